@@ -0,0 +1,232 @@
+"""
+Pescados do Alexandre - Indicadores de preco por produto
+Le as colunas das transacoes uma vez para arrays NumPy contiguos,
+ordenados por produto e dia, e calcula todos os indicadores em passagens
+vetorizadas (bincount / reduceat), sem loop em Python por transacao:
+  - preco medio de compra e de venda por kg (ponderado pelo peso)
+  - margem de preco: venda media menos compra media, sobre a venda media
+  - volume vendido nos ultimos 7 e 30 dias
+  - volatilidade do preco de venda (desvio padrao / media dos precos diarios)
+
+A margem de preco (margemPrecoPct) compara precos medios do periodo; a margem
+realizada, com o custo exato do que foi vendido (FIFO / custo medio, com o
+estoque anterior), e o margemPct de custos.py.
+
+Uso:
+  python analitica.py                       # ultimos 90 dias
+  python analitica.py --inicio 2025-01-01 --fim 2025-06-30
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+
+import arquivamento
+import unidades
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+JANELAS = (7, 30)  # dias dos volumes moveis
+GRAMAS_POR_CENTAVO = unidades.GRAMAS / unidades.CENTAVOS  # centavos/g -> reais/kg
+
+
+class Transacoes:
+    """Colunas das transacoes ordenadas por (produto, dia).
+
+    produto: id do produto; dia: numero do dia (unidades.dia); venda: True
+    nas vendas; peso: gramas; valor: centavos. 'ids' sao os produtos
+    presentes (crescente) e 'indice' a posicao de cada linha em 'ids'.
+    """
+
+    __slots__ = ("produto", "dia", "venda", "peso", "valor", "ids", "indice")
+
+    def __init__(self, linhas: np.ndarray):
+        linhas = linhas.reshape(-1, 5)
+        if len(linhas):
+            # lexsort e estavel: dentro do mesmo dia mantem a ordem de leitura
+            linhas = linhas[np.lexsort((linhas[:, 1], linhas[:, 0]))]
+        self.produto = np.ascontiguousarray(linhas[:, 0])
+        self.dia = np.ascontiguousarray(linhas[:, 1])
+        self.venda = np.ascontiguousarray(linhas[:, 2] == 1)
+        self.peso = np.ascontiguousarray(linhas[:, 3])
+        self.valor = np.ascontiguousarray(linhas[:, 4])
+        self.ids, self.indice = np.unique(self.produto, return_inverse=True)
+
+    def __len__(self) -> int:
+        return len(self.dia)
+
+
+def carregar(conn, inicio=None, fim=None, placeholder: str = "?") -> Transacoes:
+    """Transacoes (recentes e arquivadas, se preciso) de 'inicio' a 'fim'"""
+    filtros = []
+    params: List[Any] = []
+    if inicio:
+        filtros.append(f"dia >= {placeholder}")
+        params.append(unidades.dia(inicio))
+    if fim:
+        filtros.append(f"dia <= {placeholder}")
+        params.append(unidades.dia(fim))
+    where = ("WHERE " + " AND ".join(filtros)) if filtros else ""
+    fonte = arquivamento.fonte_transacoes(conn, inicio, placeholder)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT produtoId, dia, CASE WHEN tipo = 'venda' THEN 1 ELSE 0 END, pesoG, valorCentavos
+            FROM {fonte} t {where}
+            """,
+            params,
+        )
+        return Transacoes(np.array(cursor.fetchall(), dtype=np.int64))
+    finally:
+        cursor.close()
+
+
+def _razao(a: np.ndarray, b: np.ndarray, escala: float = 1.0) -> np.ndarray:
+    """a * escala / b, com NaN onde b e zero"""
+    saida = np.full(len(a), np.nan)
+    np.divide(a * escala, b, out=saida, where=b != 0)
+    return saida
+
+
+def calcular(dados: Transacoes, referencia: int, inicio: int | None = None) -> Dict[str, np.ndarray]:
+    """Indicadores por produto (na ordem de dados.ids) ate o dia 'referencia'.
+
+    Precos, margem e volatilidade usam o periodo [inicio, referencia]; os
+    volumes moveis usam as janelas terminando em 'referencia'.
+    """
+    n = len(dados.ids)
+    ate = dados.dia <= referencia
+    periodo = ate if inicio is None else ate & (dados.dia >= inicio)
+    compras = periodo & ~dados.venda
+    vendas = periodo & dados.venda
+
+    def somar(mascara: np.ndarray, coluna: np.ndarray) -> np.ndarray:
+        return np.bincount(dados.indice[mascara], weights=coluna[mascara], minlength=n)
+
+    peso_compra = somar(compras, dados.peso)
+    valor_compra = somar(compras, dados.valor)
+    peso_venda = somar(vendas, dados.peso)
+    valor_venda = somar(vendas, dados.valor)
+    preco_compra = _razao(valor_compra, peso_compra, GRAMAS_POR_CENTAVO)
+    preco_venda = _razao(valor_venda, peso_venda, GRAMAS_POR_CENTAVO)
+
+    resultado = {
+        "pesoComprado": peso_compra / unidades.GRAMAS,
+        "pesoVendido": peso_venda / unidades.GRAMAS,
+        "valorComprado": valor_compra / unidades.CENTAVOS,
+        "receita": valor_venda / unidades.CENTAVOS,
+        "precoMedioCompra": preco_compra,
+        "precoMedioVenda": preco_venda,
+        "margemPrecoPct": _razao(preco_venda - preco_compra, preco_venda),
+    }
+    for janela in JANELAS:
+        recentes = ate & dados.venda & (dados.dia > referencia - janela)
+        resultado[f"volume{janela}d"] = somar(recentes, dados.peso) / unidades.GRAMAS
+
+    # Preco de venda de cada (produto, dia): as linhas ja estao agrupadas
+    linhas = np.flatnonzero(vendas)
+    produto, dia = dados.indice[linhas], dados.dia[linhas]
+    if len(linhas):
+        novo = np.empty(len(linhas), dtype=bool)
+        novo[0] = True
+        novo[1:] = (produto[1:] != produto[:-1]) | (dia[1:] != dia[:-1])
+        inicios = np.flatnonzero(novo)
+        preco_dia = _razao(
+            np.add.reduceat(dados.valor[linhas], inicios),
+            np.add.reduceat(dados.peso[linhas], inicios),
+            GRAMAS_POR_CENTAVO,
+        )
+        produto_dia = produto[inicios]
+    else:
+        preco_dia = np.empty(0)
+        produto_dia = np.empty(0, dtype=np.int64)
+    dias = np.bincount(produto_dia, minlength=n)
+    media = _razao(np.bincount(produto_dia, weights=preco_dia, minlength=n), dias)
+    quadrados = _razao(np.bincount(produto_dia, weights=preco_dia * preco_dia, minlength=n), dias)
+    desvio = np.sqrt(np.clip(quadrados - media * media, 0.0, None))
+    resultado["diasComVenda"] = dias
+    resultado["volatilidade"] = np.where(dias >= 2, _razao(desvio, media), np.nan)
+    return resultado
+
+
+def _valor(x):
+    if isinstance(x, np.integer):
+        return int(x)
+    x = float(x)
+    return None if np.isnan(x) else x
+
+
+def resumo(conn, inicio=None, fim=None, placeholder: str = "?") -> Dict[str, Any]:
+    """Indicadores de todos os produtos cadastrados no periodo (fim padrao: hoje)"""
+    referencia = unidades.dia(fim) if fim else unidades.dia(date.today())
+    inicio_dia = unidades.dia(inicio) if inicio else None
+    # Os volumes moveis precisam dos ultimos max(JANELAS) dias mesmo com periodo curto
+    carregar_de = None
+    if inicio_dia is not None:
+        carregar_de = unidades.data_iso(min(inicio_dia, referencia - max(JANELAS) + 1))
+    dados = carregar(conn, carregar_de, unidades.data_iso(referencia), placeholder)
+    metricas = calcular(dados, referencia, inicio_dia)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, nome FROM produtos ORDER BY nome")
+        produtos = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    posicoes = {int(pid): i for i, pid in enumerate(dados.ids)}
+    por_produto = []
+    for produto_id, nome in ((p[0], p[1]) for p in produtos):
+        i = posicoes.get(int(produto_id))
+        linha = {"produtoId": produto_id, "nome": nome}
+        for chave, coluna in metricas.items():
+            linha[chave] = _valor(coluna[i]) if i is not None else (0 if chave == "diasComVenda" else None)
+        por_produto.append(linha)
+    return {
+        "referencia": unidades.data_iso(referencia),
+        "inicio": unidades.data_iso(inicio_dia) if inicio_dia is not None else None,
+        "janelas": list(JANELAS),
+        "porProduto": por_produto,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Indicadores de preco por produto")
+    parser.add_argument("--inicio", help="AAAA-MM-DD (padrao: 90 dias antes do fim)")
+    parser.add_argument("--fim", help="AAAA-MM-DD (padrao: hoje)")
+    parser.add_argument("--banco", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    fim = date.fromisoformat(args.fim) if args.fim else date.today()
+    inicio = args.inicio or (fim - timedelta(days=89)).isoformat()
+    conn = sqlite3.connect(args.banco)
+    try:
+        resultado = resumo(conn, inicio, fim)
+    finally:
+        conn.close()
+
+    def numero(x, formato):
+        return "-" if x is None else format(x, formato)
+
+    print(f"{resultado['inicio']} a {resultado['referencia']}")
+    print(f"{'produto':<20} {'compra/kg':>10} {'venda/kg':>10} {'margem':>8} {'7d kg':>9} {'30d kg':>9} {'volat.':>8}")
+    for p in resultado["porProduto"]:
+        print(
+            f"{p['nome'][:20]:<20} {numero(p['precoMedioCompra'], '.2f'):>10} {numero(p['precoMedioVenda'], '.2f'):>10} "
+            f"{numero(p['margemPrecoPct'], '.1%'):>8} {numero(p['volume7d'], '.2f'):>9} {numero(p['volume30d'], '.2f'):>9} "
+            f"{numero(p['volatilidade'], '.1%'):>8}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,18 @@ Pescados do Alexandre - Aplicativo Principal
 Este script inicia o servidor e abre o navegador automaticamente.
 """
 
+import time
+
+# Relogio da inicializacao (fases medidas em TEMPOS_INICIO)
+T_INICIO = time.perf_counter()
+
 import os
 import sys
+import json
+import mimetypes
 import socket
-import webbrowser
 import threading
-import time
+from contextlib import contextmanager
 
 # Definir diretorios (funciona tanto em dev quanto no executavel)
 if getattr(sys, 'frozen', False):
@@ -31,25 +37,98 @@ DB_PATH = os.path.join(APP_DIR, 'pescados.db')
 # Definir pasta do frontend (embutida no executavel)
 FRONTEND_DIR = os.path.join(BUNDLE_DIR, "frontend")
 
+# Frontend gerado por build_frontend.py (nomes com hash + .gz/.br), se existir
+DIST_DIR = os.path.join(FRONTEND_DIR, "dist")
+STATIC_DIR = DIST_DIR if os.path.isdir(DIST_DIR) else FRONTEND_DIR
+
+# Assets com hash no nome nunca mudam; o resto sempre revalida
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+CACHE_LEGADO = 'public, max-age=86400'
+
 # Importar Flask e configurar app
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
-import sqlite3
+
+import cache
+import custos
+import db_trace
+import escrita
+import events
+import lojas
+import metrics
+import singleflight
+import slow_query
+import unidades
 
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
+events.init_app(app)
+slow_query.install(os.path.join(APP_DIR, 'slow_queries.log'))
+
+# ==================== INICIALIZACAO ====================
+
+FASES_INICIO = metrics.Gauge(
+    'pescados_startup_phase_seconds',
+    'Duracao de cada fase da inicializacao do app',
+    ('fase',),
+)
+TEMPOS_INICIO = []
+
+@contextmanager
+def fase(nome):
+    """Mede uma fase da inicializacao"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        TEMPOS_INICIO.append((nome, duracao))
+        FASES_INICIO.set(nome, valor=duracao)
+
+def _registrar_imports():
+    # Do primeiro import ate o app Flask montado
+    duracao = time.perf_counter() - T_INICIO
+    TEMPOS_INICIO.append(('imports', duracao))
+    FASES_INICIO.set('imports', valor=duracao)
 
 # ==================== DATABASE ====================
 
+# Incrementar ao mudar tabelas ou indices: bancos com user_version menor
+# refazem o CREATE ... IF NOT EXISTS (e migracoes) uma vez so
+VERSAO_SCHEMA = 2  # 2: transacoes em ponto fixo (gramas, centavos, dia)
+
+def caminho_banco(loja=None):
+    """Arquivo SQLite da loja (padrao: loja da requisicao atual)"""
+    return lojas.caminho_sqlite(loja or lojas.atual(), APP_DIR, DB_PATH)
+
 def get_connection():
-    """Retorna uma conexao com o banco de dados"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Retorna uma conexao (instrumentada) com o banco da loja atual"""
+    return db_trace.connect_sqlite(caminho_banco())
 
 def init_db():
-    """Inicializa o banco de dados com as tabelas necessarias"""
+    """Confere a versao do schema, cria o que faltar e popula os produtos (uma conexao)"""
     conn = get_connection()
+    try:
+        convertido = False
+        if conn.execute('PRAGMA user_version').fetchone()[0] < VERSAO_SCHEMA:
+            convertido = criar_tabelas(conn)
+            conn.execute(f'PRAGMA user_version = {VERSAO_SCHEMA}')
+        if convertido:
+            # Transacoes convertidas para ponto fixo: livro refeito do zero
+            custos.reconstruir(conn)
+        else:
+            # Livro de custo: so varre tudo se a marca d'agua (linhas, maior
+            # id, metodo) mostrar gravacoes feitas por fora do app
+            custos.sincronizar_se_preciso(conn)
+        popular_produtos_iniciais(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def criar_tabelas(conn):
+    """Tabelas e indices do app (sem commit); True se converteu transacoes antigas"""
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -61,30 +140,28 @@ def init_db():
         )
     ''')
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transacoes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            produtoId INTEGER NOT NULL,
-            tipo TEXT NOT NULL CHECK(tipo IN ('compra', 'venda')),
-            pesoKg REAL NOT NULL,
-            precoKg REAL NOT NULL,
-            valorTotal REAL NOT NULL,
-            data TEXT NOT NULL,
-            FOREIGN KEY (produtoId) REFERENCES produtos(id)
-        )
-    ''')
+    # Transacoes em inteiros (gramas, centavos, dia) com indice (dia, id);
+    # bancos antigos sao convertidos aqui
+    convertido = unidades.criar_tabelas(conn)
 
-    conn.commit()
-    conn.close()
+    # Livro de custo (FIFO / custo medio) e arquivo de periodos fechados
+    import arquivamento  # so quando o schema muda (VERSAO_SCHEMA)
+    custos.criar_tabelas(conn)
+    arquivamento.criar_tabelas(conn)
+    cursor.close()
+    return convertido
 
-def popular_produtos_iniciais():
+def popular_produtos_iniciais(conn=None):
     """Popula o banco com os produtos iniciais (sem transacoes)"""
-    conn = get_connection()
+    propria = conn is None
+    if propria:
+        conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('SELECT COUNT(*) FROM produtos')
     if cursor.fetchone()[0] > 0:
-        conn.close()
+        if propria:
+            conn.close()
         return
 
     produtos = [
@@ -103,10 +180,21 @@ def popular_produtos_iniciais():
         VALUES (?, ?, ?)
     ''', produtos)
 
-    conn.commit()
-    conn.close()
+    if propria:
+        conn.commit()
+        conn.close()
     print(f"Banco inicializado com {len(produtos)} produtos.")
 
+def _loja_existe(loja):
+    return os.path.exists(caminho_banco(loja))
+
+def _inicializar_loja(loja):
+    """Tabelas e produtos iniciais da loja atual (lojas.preparar chama uma vez por loja)"""
+    init_db()
+
+lojas.init_app(app, _loja_existe, _inicializar_loja)
+
+@cache.memorizar('produtos', 'produtos')
 def get_produtos():
     conn = get_connection()
     cursor = conn.cursor()
@@ -115,13 +203,20 @@ def get_produtos():
     conn.close()
     return produtos
 
-def get_transacoes():
+@cache.memorizar('transacoes', 'transacoes')
+def get_transacoes(limite=None, antes=None):
+    """Transacoes da mais recente para a mais antiga.
+
+    Com limite, devolve uma pagina; antes=(dia, id) continua a partir da
+    ultima transacao da pagina anterior (paginacao por chave, sem OFFSET).
+    """
+    import arquivamento  # depois de um arquivamento a lista continua no arquivo
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM transacoes ORDER BY data DESC, id DESC')
-    transacoes = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return transacoes
+    try:
+        linhas = arquivamento.listar_transacoes(conn, limite, antes)
+    finally:
+        conn.close()
+    return [unidades.para_api(row) for row in linhas]
 
 def adicionar_produto(nome, preco_compra, preco_venda):
     conn = get_connection()
@@ -133,6 +228,7 @@ def adicionar_produto(nome, preco_compra, preco_venda):
     produto_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    cache.invalidar('produtos')
     return produto_id
 
 def atualizar_produto(id, nome, preco_compra, preco_venda):
@@ -145,6 +241,7 @@ def atualizar_produto(id, nome, preco_compra, preco_venda):
     ''', (nome, preco_compra, preco_venda, id))
     conn.commit()
     conn.close()
+    cache.invalidar('produtos')
 
 def excluir_produto(id):
     conn = get_connection()
@@ -152,49 +249,150 @@ def excluir_produto(id):
     cursor.execute('DELETE FROM produtos WHERE id = ?', (id,))
     conn.commit()
     conn.close()
+    cache.invalidar('produtos')
 
-def adicionar_transacao(produto_id, tipo, peso_kg, preco_kg, valor_total, data):
-    conn = get_connection()
+# Transacoes sao gravadas pela thread de escrita em grupo (um COMMIT por lote)
+ESCRITOR = escrita.Escritor(lambda loja: db_trace.connect_sqlite(caminho_banco(loja), check_same_thread=False))
+
+def _inserir_transacao(conn, produto_id, tipo, peso_kg, preco_kg, valor_total, data):
+    linha = unidades.para_banco(produto_id, tipo, peso_kg, preco_kg, valor_total, data)
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO transacoes (produtoId, tipo, pesoKg, precoKg, valorTotal, data)
+        INSERT INTO transacoes (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia)
         VALUES (?, ?, ?, ?, ?, ?)
-    ''', (produto_id, tipo, peso_kg, preco_kg, valor_total, data))
+    ''', linha)
     transacao_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    # O custo usa os valores ja arredondados, iguais aos gravados
+    custos.registrar(conn, transacao_id, produto_id, tipo, unidades.kg(linha[2]),
+                     unidades.reais(linha[4]), unidades.data_iso(linha[5]))
+    return transacao_id
+
+def _excluir_transacao(conn, id):
+    conn.execute('DELETE FROM transacoes WHERE id = ?', (id,))
+    custos.remover(conn, id)
+
+def adicionar_transacao(produto_id, tipo, peso_kg, preco_kg, valor_total, data):
+    """Grava a transacao e devolve o id (depois do COMMIT do lote)"""
+    transacao_id = ESCRITOR.executar(_inserir_transacao, produto_id, tipo, peso_kg, preco_kg, valor_total, data)
+    cache.invalidar('transacoes')
     return transacao_id
 
 def excluir_transacao(id):
+    ESCRITOR.executar(_excluir_transacao, id)
+    cache.invalidar('transacoes')
+
+@cache.memorizar('custos', 'transacoes', 'produtos')
+def get_custos(inicio=None, fim=None):
+    """Margem bruta e estoque valorizado por produto no periodo"""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM transacoes WHERE id = ?', (id,))
-    conn.commit()
+    resultado = custos.resumo(conn, inicio, fim)
+    nomes = {row['id']: row['nome'] for row in conn.execute('SELECT id, nome FROM produtos')}
     conn.close()
+    for item in resultado['porProduto']:
+        item['nome'] = nomes.get(item['produtoId'])
+    return resultado
+
+@cache.memorizar('analitica', 'transacoes', 'produtos')
+def get_analitica(inicio=None, fim=None):
+    """Precos medios, margem, volumes 7/30 dias e volatilidade por produto"""
+    import analitica  # numpy so e carregado quando alguem pede os indicadores
+    conn = get_connection()
+    try:
+        return analitica.resumo(conn, inicio, fim)
+    finally:
+        conn.close()
+
+@cache.memorizar('previsao', 'transacoes', 'produtos')
+def get_previsao(hoje=None):
+    """Previsao de vendas de amanha e compra sugerida por produto"""
+    import previsao
+    conn = get_connection()
+    try:
+        # O estado da previsao fica guardado por banco (so os dias novos sao lidos)
+        return previsao.prever(conn, hoje, chave=caminho_banco())
+    finally:
+        conn.close()
+
+@cache.memorizar('serie_lucro', 'transacoes')
+def get_serie_lucro(inicio=None, fim=None, de=None, ate=None, pontos=None):
+    """Lucro acumulado por dia, reduzido a no maximo 'pontos' pontos"""
+    import downsample
+    pontos = pontos or downsample.PONTOS_PADRAO
+    conn = get_connection()
+    serie = downsample.lucro_acumulado(conn, inicio, fim, de, ate, pontos)
+    conn.close()
+    return serie
 
 # ==================== ROTAS ====================
 
+@app.errorhandler(escrita.EscritaNaoFeita)
+@app.errorhandler(escrita.EscritorParado)
+def erro_escrita(e):
+    # Nada foi gravado: o cliente pode repetir a requisicao
+    resposta = jsonify({'erro': str(e), 'gravado': False})
+    resposta.headers['Retry-After'] = '5'
+    return resposta, 503
+
+def _carregar_asset_manifest():
+    """Mapa nome original -> URL versionada gerado pelo build do frontend"""
+    try:
+        with open(os.path.join(STATIC_DIR, 'asset-manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = _carregar_asset_manifest()
+
+def enviar_estatico(nome, mimetype=None, cache_control=CACHE_REVALIDAR):
+    """Envia um arquivo do frontend, usando a versao .br/.gz se o navegador aceitar"""
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+
+    codificacao = None
+    for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[enc] and os.path.isfile(os.path.join(STATIC_DIR, nome + ext)):
+            codificacao = enc
+            nome += ext
+            break
+
+    response = send_from_directory(STATIC_DIR, nome, mimetype=mimetype)
+    if codificacao:
+        response.headers['Content-Encoding'] = codificacao
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def enviar_legado(nome, mimetype):
+    """URLs antigas sem hash (instalacoes PWA anteriores ao build)"""
+    url = ASSET_MANIFEST.get(nome, '/' + nome)
+    return enviar_estatico(url.lstrip('/'), mimetype, CACHE_LEGADO)
+
 @app.route('/')
 def index():
-    return send_from_directory(FRONTEND_DIR, 'index.html')
+    return enviar_estatico('index.html', 'text/html')
 
 @app.route('/manifest.json')
 def manifest():
-    return send_from_directory(FRONTEND_DIR, 'manifest.json', mimetype='application/manifest+json')
+    return enviar_estatico('manifest.json', 'application/manifest+json')
 
 @app.route('/sw.js')
 def service_worker():
-    return send_from_directory(FRONTEND_DIR, 'sw.js', mimetype='application/javascript')
+    return enviar_estatico('sw.js', 'application/javascript')
 
 @app.route('/icon-192.png')
 def icon_192():
-    return send_from_directory(FRONTEND_DIR, 'icon-192.png', mimetype='image/png')
+    return enviar_legado('icon-192.png', 'image/png')
 
 @app.route('/icon-512.png')
 def icon_512():
-    return send_from_directory(FRONTEND_DIR, 'icon-512.png', mimetype='image/png')
+    return enviar_legado('icon-512.png', 'image/png')
+
+@app.route('/assets/<path:nome>')
+def assets(nome):
+    return enviar_estatico('assets/' + nome, cache_control=CACHE_IMUTAVEL)
 
 @app.route('/api/produtos', methods=['GET'])
+@singleflight.compartilhar('produtos')
 def api_get_produtos():
     return jsonify(get_produtos())
 
@@ -202,39 +400,216 @@ def api_get_produtos():
 def api_criar_produto():
     data = request.json
     id = adicionar_produto(data['nome'], data['precoCompraPadrao'], data['precoVendaPadrao'])
+    events.publicar('produtos', 'inserir', id, {'id': id, **data})
     return jsonify({'id': id, **data}), 201
 
 @app.route('/api/produtos/<int:id>', methods=['PUT'])
 def api_atualizar_produto(id):
     data = request.json
     atualizar_produto(id, data['nome'], data['precoCompraPadrao'], data['precoVendaPadrao'])
+    events.publicar('produtos', 'atualizar', id, {'id': id, **data})
     return jsonify({'id': id, **data})
 
 @app.route('/api/produtos/<int:id>', methods=['DELETE'])
 def api_excluir_produto(id):
     excluir_produto(id)
+    events.publicar('produtos', 'excluir', id)
     return '', 204
 
 @app.route('/api/transacoes', methods=['GET'])
+@singleflight.compartilhar('transacoes')
 def api_get_transacoes():
-    return jsonify(get_transacoes())
+    # ?limite=N&antes=<data>,<id> pagina a lista; sem parametros devolve tudo
+    limite = request.args.get('limite', type=int)
+    antes = request.args.get('antes')
+    if antes is not None:
+        data, _, ultimo_id = antes.rpartition(',')
+        try:
+            if not ultimo_id.isdigit():
+                raise ValueError
+            antes = (unidades.dia(data), int(ultimo_id))
+        except ValueError:
+            return jsonify({'erro': 'antes deve ser <data>,<id>'}), 400
+    if limite is not None and limite <= 0:
+        return jsonify({'erro': 'limite deve ser positivo'}), 400
+    return jsonify(get_transacoes(limite, antes))
 
 @app.route('/api/transacoes', methods=['POST'])
 def api_criar_transacao():
     data = request.json
-    id = adicionar_transacao(
-        data['produtoId'], data['tipo'], data['pesoKg'],
-        data['precoKg'], data['valorTotal'], data['data']
-    )
-    return jsonify({'id': id, **data}), 201
+    campos = (data['produtoId'], data['tipo'], data['pesoKg'],
+              data['precoKg'], data['valorTotal'], data['data'])
+    id = adicionar_transacao(*campos)
+    # Devolve o que foi gravado (gramas / centavos arredondados), nao a entrada
+    transacao = unidades.para_api((id, *unidades.para_banco(*campos)))
+    events.publicar('transacoes', 'inserir', id, transacao)
+    return jsonify(transacao), 201
 
 @app.route('/api/transacoes/<int:id>', methods=['DELETE'])
 def api_excluir_transacao(id):
     excluir_transacao(id)
+    events.publicar('transacoes', 'excluir', id)
     return '', 204
 
+@app.route('/api/import/transacoes', methods=['POST'])
+def api_importar_transacoes():
+    # CSV no campo "arquivo" (multipart) ou no corpo; ?validar=1 so confere
+    try:
+        import importacao  # pandas so e carregado quando alguem importa
+    except ImportError:
+        return jsonify({'erro': 'importacao requer pandas no servidor'}), 501
+    arquivo = request.files.get('arquivo')
+    conteudo = arquivo.read() if arquivo else request.get_data()
+    if not conteudo:
+        return jsonify({'erro': 'envie o CSV no campo "arquivo" ou no corpo'}), 400
+    somente_validar = request.args.get('validar') in ('1', 'true')
+    conn = get_connection()
+    try:
+        # Validacao e conversao aqui; o INSERT e o custo vao pela thread de
+        # gravacao (uma operacao, um COMMIT), sem disputar o lock do SQLite
+        relatorio = importacao.importar(
+            conn, conteudo, somente_validar=somente_validar,
+            gravacao=lambda linhas: ESCRITOR.executar(importacao.gravar, linhas),
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    finally:
+        conn.close()
+    if relatorio['importadas']:
+        cache.invalidar('transacoes')
+        # Um aviso so; os aparelhos recarregam em vez de receber linha a linha
+        events.publicar('transacoes', 'importar', None, {'quantidade': relatorio['importadas']})
+    return jsonify(relatorio)
+
+@app.route('/api/export/transacoes', methods=['GET'])
+def api_exportar_transacoes():
+    # ?formato=csv|parquet&inicio=&fim=&produto=1&produto=2 (em streaming)
+    # O arquivo e gerado depois que a requisicao termina: fixa o banco da loja agora
+    import exportacao
+    caminho = caminho_banco()
+    return exportacao.resposta_flask(lambda: db_trace.connect_sqlite(caminho), request.args)
+
+@app.route('/api/series/lucro', methods=['GET'])
+@singleflight.compartilhar('serie_lucro')
+def api_serie_lucro():
+    # inicio/fim: periodo acumulado; de/ate: trecho ampliado; pontos: resolucao desejada
+    args = request.args
+    try:
+        datas = [args.get(nome) or None for nome in ('inicio', 'fim', 'de', 'ate')]
+        for valor in datas:
+            if valor is not None:
+                unidades.dia(valor)
+    except ValueError:
+        return jsonify({'erro': 'inicio, fim, de e ate devem ser AAAA-MM-DD'}), 400
+    import downsample
+    try:
+        pontos = downsample.limitar_pontos(args.get('pontos'))
+    except ValueError:
+        return jsonify({'erro': 'pontos deve ser um inteiro positivo'}), 400
+    return jsonify(get_serie_lucro(*datas, pontos))
+
+@app.route('/api/custos', methods=['GET'])
+@singleflight.compartilhar('custos')
+def api_custos():
+    # ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD (ambos opcionais)
+    inicio, fim = request.args.get('inicio') or None, request.args.get('fim') or None
+    try:
+        for valor in (inicio, fim):
+            if valor is not None:
+                unidades.dia(valor)
+    except ValueError:
+        return jsonify({'erro': 'inicio e fim devem ser AAAA-MM-DD'}), 400
+    return jsonify(get_custos(inicio, fim))
+
+@app.route('/api/analitica', methods=['GET'])
+@singleflight.compartilhar('analitica')
+def api_analitica():
+    # ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD (fim padrao: hoje; volumes de 7 e 30 dias ate o fim)
+    try:
+        return jsonify(get_analitica(request.args.get('inicio'), request.args.get('fim')))
+    except ImportError:
+        return jsonify({'erro': 'indicadores requerem numpy no servidor'}), 501
+    except ValueError:
+        return jsonify({'erro': 'datas devem ser AAAA-MM-DD'}), 400
+
+@app.route('/api/previsao', methods=['GET'])
+@singleflight.compartilhar('previsao')
+def api_previsao():
+    # ?data=AAAA-MM-DD usa outra data como hoje (padrao: hoje)
+    try:
+        return jsonify(get_previsao(request.args.get('data')))
+    except ImportError:
+        return jsonify({'erro': 'previsao requer numpy no servidor'}), 501
+    except ValueError:
+        return jsonify({'erro': 'data deve ser AAAA-MM-DD'}), 400
+
+@app.route('/api/lojas', methods=['GET'])
+def api_lojas():
+    return jsonify({'atual': lojas.atual(), 'lojas': lojas.listar_sqlite(APP_DIR)})
+
+@app.route('/api/lojas', methods=['POST'])
+def api_criar_loja():
+    try:
+        loja = lojas.validar((request.json or {}).get('loja'))
+    except lojas.LojaInvalida as e:
+        return jsonify({'erro': str(e)}), 400
+    if _loja_existe(loja):
+        return jsonify({'erro': f'loja ja existe: {loja}'}), 409
+    lojas.criar_sqlite(loja, APP_DIR)
+    with lojas.usando(loja):
+        lojas.preparar(loja)
+    return jsonify({'loja': loja}), 201
+
+@app.route('/api/lojas/consolidado', methods=['GET'])
+def api_lojas_consolidado():
+    # Custos e margem de todas as lojas, lidos em paralelo (um banco por loja)
+    inicio, fim = request.args.get('inicio') or None, request.args.get('fim') or None
+    try:
+        for valor in (inicio, fim):
+            if valor is not None:
+                unidades.dia(valor)
+    except ValueError:
+        return jsonify({'erro': 'inicio e fim devem ser AAAA-MM-DD'}), 400
+
+    def totais(loja):
+        # Loja ainda nao aberta neste processo: schema e livro antes de ler
+        lojas.preparar(loja)
+        return get_custos(inicio, fim)['totais']
+
+    return jsonify(lojas.consolidar(lojas.listar_sqlite(APP_DIR), totais))
+
+@app.route('/api/backups', methods=['GET'])
+def api_backups():
+    # Ultimo backup do agendador e copias guardadas na pasta
+    import backup
+    pasta = AGENDADOR_BACKUP.pasta if AGENDADOR_BACKUP else os.path.join(APP_DIR, 'backups')
+    return jsonify({
+        'ativo': AGENDADOR_BACKUP is not None,
+        'ultimo': AGENDADOR_BACKUP.ultimo if AGENDADOR_BACKUP else None,
+        'erro': AGENDADOR_BACKUP.ultimo_erro if AGENDADOR_BACKUP else None,
+        'arquivos': backup.listar(pasta),
+    })
+
 # ==================== MAIN ====================
 
+AGENDADOR_BACKUP = None
+
+def iniciar_backups(args):
+    """Agenda backups online do banco (--backup-horas 0 desliga)"""
+    global AGENDADOR_BACKUP
+    if args.backup_horas <= 0:
+        return
+    import backup
+    AGENDADOR_BACKUP = backup.Agendador(
+        args.backup_horas * 3600,
+        # Um backup por loja; a principal fica na raiz da pasta
+        bancos=lambda: [(loja, caminho_banco(loja)) for loja in lojas.listar_sqlite(APP_DIR)],
+        pasta=args.backup_pasta or os.path.join(APP_DIR, 'backups'),
+        manter=args.backup_manter if args.backup_manter is not None else backup.MANTER,
+    )
+    AGENDADOR_BACKUP.iniciar()
+    print(f"   Backup a cada {args.backup_horas:g}h, mantendo {AGENDADOR_BACKUP.opcoes['manter']} copias")
+
 def get_local_ip():
     """Descobre o IP local da maquina"""
     try:
@@ -247,17 +622,126 @@ def get_local_ip():
         return "127.0.0.1"
 
 def open_browser(port):
-    """Abre o navegador apos um pequeno delay"""
-    time.sleep(1.5)
+    """Abre o navegador (chamado quando o socket ja esta escutando)"""
+    import webbrowser
     webbrowser.open(f'http://localhost:{port}')
 
-def main():
-    PORT = 5000
-    local_ip = get_local_ip()
+THREADS_RESERVADAS = 8  # threads que o canal de eventos nunca ocupa
+
+def parse_args(argv=None):
+    """Le as opcoes de linha de comando (com padroes vindos do ambiente)"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Pescados do Alexandre')
+    parser.add_argument('--modo', choices=['producao', 'dev'],
+                        default=os.getenv('PESCADOS_MODO', 'producao'),
+                        help='producao = waitress; dev = servidor do Werkzeug')
+    parser.add_argument('--porta', type=int, default=int(os.getenv('PESCADOS_PORTA', 5000)))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('PESCADOS_THREADS', 32)),
+                        help='threads de atendimento (cada celular em /api/events ocupa uma)')
+    parser.add_argument('--eventos-max', type=int,
+                        default=int(os.environ['PESCADOS_EVENTOS_MAX']) if 'PESCADOS_EVENTOS_MAX' in os.environ else None,
+                        help=f'conexoes em /api/events (padrao: threads - {THREADS_RESERVADAS}); acima disso, 503')
+    parser.add_argument('--conexoes', type=int, default=int(os.getenv('PESCADOS_CONEXOES', 100)),
+                        help='maximo de conexoes abertas; limita a fila de requisicoes')
+    parser.add_argument('--backlog', type=int, default=int(os.getenv('PESCADOS_BACKLOG', 64)),
+                        help='fila de conexoes aguardando accept() no socket')
+    parser.add_argument('--keepalive', type=int, default=int(os.getenv('PESCADOS_KEEPALIVE', 30)),
+                        help='segundos que uma conexao ociosa fica aberta')
+    parser.add_argument('--backup-horas', type=float, default=float(os.getenv('PESCADOS_BACKUP_HORAS', 6)),
+                        help='intervalo entre backups automaticos (0 desliga)')
+    parser.add_argument('--backup-manter', type=int,
+                        default=int(os.environ['PESCADOS_BACKUP_MANTER']) if 'PESCADOS_BACKUP_MANTER' in os.environ else None,
+                        help='quantidade de backups guardados (padrao 14)')
+    parser.add_argument('--backup-pasta', default=os.getenv('PESCADOS_BACKUP_PASTA'),
+                        help='pasta dos backups (padrao: backups ao lado do banco)')
+    parser.add_argument('--escrita-janela-ms', type=float,
+                        default=float(os.getenv('PESCADOS_ESCRITA_JANELA_MS', escrita.JANELA * 1000)),
+                        help='espera maxima para juntar transacoes num mesmo COMMIT')
+    parser.add_argument('--sem-navegador', action='store_true',
+                        default=os.getenv('PESCADOS_NAVEGADOR', '1') == '0',
+                        help='nao abre o navegador ao iniciar')
+    # O executavel --windowed pode receber argumentos extras do Windows
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def _instalar_sinais():
+    """Converte SIGTERM/SIGBREAK em KeyboardInterrupt para encerrar com calma"""
+    import signal
+
+    def _parar(signum, frame):
+        raise KeyboardInterrupt
+
+    for nome in ('SIGTERM', 'SIGBREAK'):
+        sig = getattr(signal, nome, None)
+        if sig is not None:
+            try:
+                signal.signal(sig, _parar)
+            except (ValueError, OSError):
+                pass
+
+def run_dev_server(port, ao_escutar=None):
+    """Servidor do Werkzeug (uma thread por requisicao, sem limites)"""
+    from werkzeug.serving import make_server
+    server = make_server('0.0.0.0', port, app, threaded=True)
+    if ao_escutar:
+        ao_escutar()
 
-    # Inicializar banco de dados
-    init_db()
-    popular_produtos_iniciais()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServidor encerrado.")
+        server.shutdown()
+
+def run_production_server(args, ao_escutar=None):
+    """Servidor waitress: pool fixo de threads, conexoes limitadas e keep-alive"""
+    from waitress.server import create_server
+
+    server = create_server(
+        app,
+        host='0.0.0.0',
+        port=args.porta,
+        threads=args.threads,
+        connection_limit=args.conexoes,
+        backlog=args.backlog,
+        channel_timeout=args.keepalive,
+        ident='Pescados',
+    )
+    # Cada celular no canal de eventos prende uma thread: sobram algumas para a API
+    events.LIMITE_ASSINANTES = (args.eventos_max if args.eventos_max is not None
+                                else max(1, args.threads - THREADS_RESERVADAS))
+    print(f"   Servidor waitress: {args.threads} threads, ate {args.conexoes} conexoes, "
+          f"{events.LIMITE_ASSINANTES} no canal de eventos")
+    # create_server ja fez bind + listen: conexoes esperam no backlog ate o run()
+    if ao_escutar:
+        ao_escutar()
+
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        print("\nEncerrando... aguardando requisicoes em andamento.")
+    finally:
+        # Para de aceitar conexoes e deixa as tarefas em curso terminarem
+        # (os streams de /api/events sao encerrados para liberar as threads)
+        events.fechar()
+        server.close()
+        server.task_dispatcher.shutdown(cancel_pending=False, timeout=10)
+        print("Servidor encerrado.")
+
+def _resumo_inicio():
+    fases = ', '.join(f'{nome} {duracao * 1000:.0f}' for nome, duracao in TEMPOS_INICIO)
+    return f"   Pronto em {(time.perf_counter() - T_INICIO) * 1000:.0f} ms ({fases})"
+
+def main(argv=None):
+    args = parse_args(argv)
+    PORT = args.porta
+
+    # Banco da loja principal: confere a versao do schema numa conexao so
+    with fase('banco'):
+        lojas.preparar(lojas.PADRAO)
+
+    with fase('rede'):
+        local_ip = get_local_ip()
 
     print("=" * 55)
     print("   PESCADOS DO ALEXANDRE - Controle de Estoque")
@@ -269,18 +753,39 @@ def main():
     print("   Para fechar, pressione Ctrl+C ou feche a janela.")
     print("=" * 55)
 
-    # Abrir navegador automaticamente
-    threading.Thread(target=open_browser, args=(PORT,), daemon=True).start()
+    _instalar_sinais()
+    ESCRITOR.janela = max(args.escrita_janela_ms, 0) / 1000
+    inicio_servidor = time.perf_counter()
 
-    # Iniciar servidor (sem modo debug para producao)
-    from werkzeug.serving import make_server
-    server = make_server('0.0.0.0', PORT, app, threaded=True)
+    def ao_escutar():
+        TEMPOS_INICIO.append(('servidor', time.perf_counter() - inicio_servidor))
+        FASES_INICIO.set('servidor', valor=TEMPOS_INICIO[-1][1])
+        print(_resumo_inicio())
+        # O navegador abre assim que a porta aceita conexoes
+        if not args.sem_navegador:
+            threading.Thread(target=open_browser, args=(PORT,), daemon=True).start()
+        # Backups nao atrasam a primeira pagina
+        iniciar_backups(args)
 
+    # Iniciar servidor (sem modo debug para producao)
     try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("\nServidor encerrado.")
-        server.shutdown()
+        if args.modo == 'producao':
+            try:
+                import waitress  # noqa: F401
+            except ImportError:
+                print("   waitress nao instalado - usando servidor de desenvolvimento.")
+            else:
+                run_production_server(args, ao_escutar)
+                return
+
+        run_dev_server(PORT, ao_escutar)
+    finally:
+        # Depois do servidor: as gravacoes ja enfileiradas sao confirmadas
+        ESCRITOR.parar()
+        if AGENDADOR_BACKUP is not None:
+            AGENDADOR_BACKUP.parar()
+
+_registrar_imports()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,164 @@
+"""
+Pescados do Alexandre - Arquivamento de periodos fechados
+Move as transacoes anteriores a uma data de corte para transacoes_arquivo
+e grava o saldo de abertura de cada produto (kg, valor, lotes e totais
+acumulados) no livro de custo. Estoque e lucro continuam exatos, mas as
+consultas do dia a dia so leem as transacoes recentes.
+
+Relatorios que comecam antes do corte (exportacao, serie de lucro,
+resumo de custos) juntam as duas tabelas com UNION ALL.
+
+Uso:
+  python arquivamento.py --antes-de 2025-01-01
+  python arquivamento.py --manter-anos 1      # arquiva ate 1o de janeiro do ano passado
+Com DATABASE_URL definido usa Postgres; senao usa o pescados.db local.
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import os
+import sys
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import custos
+import unidades
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+COLUNAS = unidades.COLUNAS
+
+# Transacoes recentes + arquivadas, para relatorios de periodos antigos
+TRANSACOES_COMPLETAS = f"""(
+    SELECT {COLUNAS} FROM transacoes
+    UNION ALL
+    SELECT {COLUNAS} FROM transacoes_arquivo
+)"""
+
+
+def _texto_data(valor) -> str:
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+def criar_tabelas(conn, backend: str = "sqlite") -> None:
+    # Mesmo formato em ponto fixo da tabela transacoes
+    unidades.criar_tabelas(conn, backend, "transacoes_arquivo")
+
+
+def fonte_transacoes(conn, inicio=None, placeholder: str = "?") -> str:
+    """Tabela (ou subconsulta) de transacoes que cobre o periodo pedido"""
+    corte = custos.corte_arquivo(conn, placeholder)
+    if corte is None:
+        return "transacoes"
+    if inicio and _texto_data(inicio) >= corte:
+        return "transacoes"
+    return TRANSACOES_COMPLETAS
+
+
+def listar_transacoes(conn, limite: Optional[int] = None, antes: Optional[Tuple[int, int]] = None,
+                      placeholder: str = "?") -> List[tuple]:
+    """Linhas (COLUNAS) da mais recente para a mais antiga, recentes e arquivadas.
+
+    antes=(dia, id) continua depois da ultima linha da pagina anterior. Cada
+    tabela e lida pelo indice (dia, id) com o mesmo LIMIT e as duas listas
+    sao intercaladas: a paginacao passa do corte para o arquivo sem ordenar
+    a uniao inteira (lancamentos retroativos podem ficar nas duas tabelas).
+    """
+    tabelas = ["transacoes"]
+    if custos.corte_arquivo(conn, placeholder) is not None:
+        tabelas.append("transacoes_arquivo")
+    where = ""
+    params: List[Any] = []
+    if antes is not None:
+        where = f" WHERE dia < {placeholder} OR (dia = {placeholder} AND id < {placeholder})"
+        params += [antes[0], antes[0], antes[1]]
+    ordem = " ORDER BY dia DESC, id DESC"
+    if limite is not None:
+        ordem += f" LIMIT {placeholder}"
+        params.append(limite)
+    listas = []
+    cursor = conn.cursor()
+    try:
+        for tabela in tabelas:
+            cursor.execute(f"SELECT {COLUNAS} FROM {tabela}{where}{ordem}", params)
+            listas.append([tuple(r) for r in cursor.fetchall()])
+    finally:
+        cursor.close()
+    if len(listas) == 1:
+        return listas[0]
+    linhas = heapq.merge(*listas, key=lambda r: (r[6], r[0]), reverse=True)
+    return list(itertools.islice(linhas, limite))
+
+
+def arquivar(conn, corte, backend: str = "sqlite") -> Dict[str, Any]:
+    """Arquiva as transacoes com data anterior a 'corte' numa unica transacao"""
+    placeholder = "%s" if backend == "postgres" else "?"
+    corte = _texto_data(corte)
+    dia_corte = unidades.dia(corte)
+    atual = custos.corte_arquivo(conn, placeholder)
+    if atual is not None and corte <= atual:
+        return {"corte": atual, "transacoes": 0, "produtos": 0}
+
+    cursor = conn.cursor()
+    try:
+        produtos = custos.fechar_periodo(conn, corte, placeholder)
+        cursor.execute(
+            f"INSERT INTO transacoes_arquivo ({COLUNAS}) "
+            f"SELECT {COLUNAS} FROM transacoes WHERE dia < {placeholder}",
+            (dia_corte,),
+        )
+        cursor.execute(f"DELETE FROM transacoes WHERE dia < {placeholder}", (dia_corte,))
+        movidas = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {"corte": corte, "transacoes": movidas, "produtos": produtos}
+
+
+# ==================== CLI ====================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Arquiva transacoes de periodos fechados")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--antes-de", help="data de corte (AAAA-MM-DD); arquiva o que for anterior")
+    grupo.add_argument("--manter-anos", type=int, help="anos completos mantidos alem do atual")
+    parser.add_argument("--banco", help="arquivo SQLite (ignora DATABASE_URL)")
+    args = parser.parse_args(argv)
+
+    if args.antes_de:
+        corte = date.fromisoformat(args.antes_de)
+    else:
+        corte = date(date.today().year - max(args.manter_anos, 0), 1, 1)
+
+    database_url = os.getenv("DATABASE_URL")
+    if database_url and not args.banco:
+        import psycopg2
+
+        conn, backend = psycopg2.connect(database_url), "postgres"
+    else:
+        import sqlite3
+
+        conn, backend = sqlite3.connect(args.banco or DB_PATH), "sqlite"
+    try:
+        custos.criar_tabelas(conn, backend)
+        criar_tabelas(conn, backend)
+        resultado = arquivar(conn, corte, backend)
+        if backend == "sqlite" and resultado["transacoes"]:
+            conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+    print(f"corte {resultado['corte']}: {resultado['transacoes']} transacao(oes) arquivada(s), "
+          f"{resultado['produtos']} produto(s) com saldo de abertura")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+"""
+Pescados do Alexandre - Variante ASGI
+Parte da API REST do app.py em Starlette: arquivos do PWA e o CRUD de
+/api/produtos e /api/transacoes (mesmos payloads). Resumos, series,
+custos, previsao, importacao/exportacao, eventos (SSE), lojas, backup e
+metricas so existem no app.py.
+
+Leituras assincronas (uma conexao aiosqlite por requisicao no SQLite,
+pool asyncpg no Postgres): conexoes lentas ou ociosas de celulares nao
+prendem threads. Gravacoes usam uma conexao DB-API numa thread e atualizam
+o livro de custo (custos.py) na mesma transacao, como no app.py. Nao ha
+cache nem eventos entre processos: rode esta variante no lugar do app.py,
+nao ao lado dele, sobre o mesmo banco.
+
+Uso:
+  pip install starlette uvicorn aiosqlite asyncpg psycopg2-binary
+  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+Com DATABASE_URL definido usa Postgres; senao usa o pescados.db local.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import json
+import os
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import arquivamento
+import custos
+import unidades
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+FRONTEND_DIR = os.path.join(APP_DIR, "frontend")
+
+# Tamanho dos blocos lidos do cursor ao enviar listas grandes
+TAMANHO_BLOCO = 500
+
+PRODUTOS_INICIAIS = [
+    ("Camarao Regional", 25.00, 40.00),
+    ("Camarao Rosa", 35.00, 55.00),
+    ("Pescada Amarela", 18.00, 30.00),
+    ("Dourada", 20.00, 35.00),
+    ("Filhote", 28.00, 45.00),
+    ("Pescada Go", 15.00, 28.00),
+    ("Pata de Caranguejo", 30.00, 50.00),
+    ("Massa de Caranguejo", 40.00, 65.00),
+]
+
+# Postgres devolve identificadores sem aspas em minusculas
+KEY_MAP = {
+    "precocomprapadrao": "precoCompraPadrao",
+    "precovendapadrao": "precoVendaPadrao",
+    "produtoid": "produtoId",
+    "pesokg": "pesoKg",
+    "precokg": "precoKg",
+    "valortotal": "valorTotal",
+}
+
+
+def _normalizar(row: dict) -> dict:
+    fixed = {}
+    for k, v in row.items():
+        if hasattr(v, "isoformat"):
+            v = v.isoformat()
+        fixed[KEY_MAP.get(k, k)] = v
+    return fixed
+
+
+def _preparar(conn, backend: str) -> None:
+    """Tabelas, livro de custo e produtos iniciais (conexao sincrona, sem commit)"""
+    cursor = conn.cursor()
+    try:
+        chave = "SERIAL PRIMARY KEY" if backend == "postgres" else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        real = "DOUBLE PRECISION" if backend == "postgres" else "REAL"
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS produtos (
+                id {chave},
+                nome TEXT NOT NULL,
+                precoCompraPadrao {real} NOT NULL,
+                precoVendaPadrao {real} NOT NULL
+            )
+            """
+        )
+        convertido = unidades.criar_tabelas(conn, backend)
+        custos.criar_tabelas(conn, backend)
+        arquivamento.criar_tabelas(conn, backend)
+        placeholder = "%s" if backend == "postgres" else "?"
+        if convertido:
+            custos.reconstruir(conn, placeholder)
+        else:
+            custos.sincronizar_se_preciso(conn, placeholder)
+        cursor.execute("SELECT COUNT(*) FROM produtos")
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany(
+                "INSERT INTO produtos (nome, precoCompraPadrao, precoVendaPadrao) "
+                f"VALUES ({placeholder}, {placeholder}, {placeholder})",
+                PRODUTOS_INICIAIS,
+            )
+    finally:
+        cursor.close()
+
+
+# ==================== SQLITE (aiosqlite) ====================
+
+class SqliteBackend:
+    """Leituras com uma conexao aiosqlite por requisicao (o WAL deixa ler
+    em paralelo); gravacoes com sqlite3 numa thread, pelas mesmas funcoes
+    do app.py (custo junto, na mesma transacao)."""
+
+    placeholder = "?"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _conectar(self):
+        import sqlite3
+
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _abrir(self) -> None:
+        conn = self._conectar()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            _preparar(conn, "sqlite")
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def abrir(self) -> None:
+        await asyncio.to_thread(self._abrir)
+
+    async def fechar(self) -> None:
+        pass
+
+    @contextlib.asynccontextmanager
+    async def _leitura(self):
+        import aiosqlite
+
+        async with aiosqlite.connect(self.path) as conn:
+            conn.row_factory = aiosqlite.Row
+            yield conn
+
+    async def listar(self, sql: str, params=()) -> list:
+        async with self._leitura() as conn, conn.execute(sql, params) as cur:
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def iterar(self, sql: str, params=()):
+        async with self._leitura() as conn, conn.execute(sql, params) as cur:
+            while True:
+                rows = await cur.fetchmany(TAMANHO_BLOCO)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+
+    def _gravar(self, funcao, args):
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            resultado = funcao(conn, self.placeholder, *args)
+            conn.commit()
+            return resultado
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    async def gravar(self, funcao, *args):
+        """funcao(conn, placeholder, *args) numa transacao, fora do loop"""
+        return await asyncio.to_thread(self._gravar, funcao, args)
+
+
+# ==================== POSTGRES (asyncpg) ====================
+
+class PostgresBackend:
+    """Leituras pelo pool do asyncpg; gravacoes com psycopg2 numa thread,
+    para o livro de custo (custos.py, API DB-API) entrar na mesma transacao."""
+
+    placeholder = "%s"
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.pool = None
+        self.pool_escrita = None
+
+    def _abrir(self) -> None:
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.pool_escrita = ThreadedConnectionPool(1, 4, self.dsn)
+        self._gravar(lambda conn, placeholder: _preparar(conn, "postgres"), ())
+
+    async def abrir(self) -> None:
+        import asyncpg
+
+        await asyncio.to_thread(self._abrir)
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=10)
+
+    async def fechar(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+        if self.pool_escrita is not None:
+            self.pool_escrita.closeall()
+
+    @staticmethod
+    def _sql(sql: str) -> str:
+        # Converte os "?" da API comum para $1, $2, ...
+        partes = sql.split("?")
+        return "".join(p + (f"${i + 1}" if i < len(partes) - 1 else "") for i, p in enumerate(partes))
+
+    async def listar(self, sql: str, params=()) -> list:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(self._sql(sql), *params)
+        return [_normalizar(dict(row)) for row in rows]
+
+    async def iterar(self, sql: str, params=()):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(self._sql(sql), *params)
+                while True:
+                    rows = await cursor.fetch(TAMANHO_BLOCO)
+                    if not rows:
+                        break
+                    yield [_normalizar(dict(row)) for row in rows]
+
+    def _gravar(self, funcao, args):
+        conn = self.pool_escrita.getconn()
+        try:
+            resultado = funcao(conn, self.placeholder, *args)
+            conn.commit()
+            return resultado
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool_escrita.putconn(conn)
+
+    async def gravar(self, funcao, *args):
+        """funcao(conn, placeholder, *args) numa transacao, fora do loop"""
+        return await asyncio.to_thread(self._gravar, funcao, args)
+
+
+# ==================== GRAVACAO (sincrona, DB-API) ====================
+
+def _inserir(conn, placeholder: str, sql: str, params) -> int:
+    cursor = conn.cursor()
+    try:
+        if placeholder == "%s":
+            cursor.execute(sql.replace("?", placeholder) + " RETURNING id", params)
+            return cursor.fetchone()[0]
+        cursor.execute(sql, params)
+        return cursor.lastrowid
+    finally:
+        cursor.close()
+
+
+def _executar(conn, placeholder: str, sql: str, params) -> None:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql.replace("?", placeholder), params)
+    finally:
+        cursor.close()
+
+
+def _inserir_transacao(conn, placeholder: str, linha) -> int:
+    transacao_id = _inserir(
+        conn, placeholder,
+        "INSERT INTO transacoes (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        linha,
+    )
+    # Mesmo calculo do app.py: custo com os valores ja arredondados
+    custos.registrar(conn, transacao_id, linha[0], linha[1], unidades.kg(linha[2]),
+                     unidades.reais(linha[4]), unidades.data_iso(linha[5]), placeholder)
+    return transacao_id
+
+
+def _excluir_transacao(conn, placeholder: str, transacao_id: int) -> None:
+    _executar(conn, placeholder, "DELETE FROM transacoes WHERE id = ?", (transacao_id,))
+    custos.remover(conn, transacao_id, placeholder)
+
+
+def _criar_backend():
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return PostgresBackend(database_url)
+    return SqliteBackend(DB_PATH)
+
+
+db = _criar_backend()
+
+
+# ==================== ROTAS ====================
+
+def _arquivo(nome: str, media_type: str | None = None):
+    async def rota(request: Request):
+        return FileResponse(os.path.join(FRONTEND_DIR, nome), media_type=media_type)
+    return rota
+
+
+async def api_get_produtos(request: Request):
+    return JSONResponse(await db.listar("SELECT * FROM produtos ORDER BY nome"))
+
+
+async def api_criar_produto(request: Request):
+    data = await request.json()
+    novo_id = await db.gravar(
+        _inserir,
+        "INSERT INTO produtos (nome, precoCompraPadrao, precoVendaPadrao) VALUES (?, ?, ?)",
+        (data["nome"], data["precoCompraPadrao"], data["precoVendaPadrao"]),
+    )
+    return JSONResponse({"id": novo_id, **data}, status_code=201)
+
+
+async def api_atualizar_produto(request: Request):
+    produto_id = request.path_params["id"]
+    data = await request.json()
+    await db.gravar(
+        _executar,
+        "UPDATE produtos SET nome = ?, precoCompraPadrao = ?, precoVendaPadrao = ? WHERE id = ?",
+        (data["nome"], data["precoCompraPadrao"], data["precoVendaPadrao"], produto_id),
+    )
+    return JSONResponse({"id": produto_id, **data})
+
+
+async def api_excluir_produto(request: Request):
+    await db.gravar(_executar, "DELETE FROM produtos WHERE id = ?", (request.path_params["id"],))
+    return Response(status_code=204)
+
+
+async def api_get_transacoes(request: Request):
+    # ?limite=N&antes=<data>,<id> pagina a lista (mesma regra do app.py,
+    # incluindo as transacoes arquivadas)
+    filtro = ""
+    params = []
+    antes = request.query_params.get("antes")
+    if antes is not None:
+        data, _, ultimo_id = antes.rpartition(",")
+        try:
+            if not ultimo_id.isdigit():
+                raise ValueError
+            dia = unidades.dia(data)
+        except ValueError:
+            return JSONResponse({"erro": "antes deve ser <data>,<id>"}, status_code=400)
+        filtro = " WHERE dia < ? OR (dia = ? AND id < ?)"
+        params += [dia, dia, int(ultimo_id)]
+    ordem = " ORDER BY dia DESC, id DESC"
+    limite = request.query_params.get("limite")
+    if limite is not None:
+        if not limite.isdigit() or int(limite) <= 0:
+            return JSONResponse({"erro": "limite deve ser positivo"}, status_code=400)
+        ordem += " LIMIT ?"
+        params.append(int(limite))
+
+    (corte,) = (await db.listar("SELECT MAX(dataCorte) AS corte FROM saldos_abertura"))[0].values()
+    if corte is not None and limite is not None:
+        # Pagina: cada tabela pelo indice (dia, id), intercaladas aqui
+        listas = [
+            [unidades.para_api(list(row.values())) for row in
+             await db.listar(f"SELECT {unidades.COLUNAS} FROM {tabela}{filtro}{ordem}", params)]
+            for tabela in ("transacoes", "transacoes_arquivo")
+        ]
+        pagina = heapq.merge(*listas, key=lambda t: (t["data"], t["id"]), reverse=True)
+        return JSONResponse(list(itertools.islice(pagina, int(limite))))
+    fonte = "transacoes" if corte is None else arquivamento.TRANSACOES_COMPLETAS + " t"
+    sql = f"SELECT {unidades.COLUNAS} FROM {fonte}{filtro}{ordem}"
+
+    async def corpo():
+        # Envia o array JSON em blocos: o download grande nao fica todo em memoria
+        yield b"["
+        primeiro = True
+        async for bloco in db.iterar(sql, params):
+            texto = ",".join(
+                json.dumps(unidades.para_api(list(row.values())), separators=(",", ":")) for row in bloco
+            )
+            if not primeiro:
+                texto = "," + texto
+            primeiro = False
+            yield texto.encode("utf-8")
+        yield b"]"
+
+    return StreamingResponse(corpo(), media_type="application/json")
+
+
+async def api_criar_transacao(request: Request):
+    data = await request.json()
+    linha = unidades.para_banco(data["produtoId"], data["tipo"], data["pesoKg"],
+                                data["precoKg"], data["valorTotal"], data["data"])
+    novo_id = await db.gravar(_inserir_transacao, linha)
+    # Devolve o que foi gravado (gramas / centavos arredondados), nao a entrada
+    return JSONResponse(unidades.para_api((novo_id, *linha)), status_code=201)
+
+
+async def api_excluir_transacao(request: Request):
+    await db.gravar(_excluir_transacao, request.path_params["id"])
+    return Response(status_code=204)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await db.abrir()
+    try:
+        yield
+    finally:
+        await db.fechar()
+
+
+routes = [
+    Route("/", _arquivo("index.html")),
+    Route("/manifest.json", _arquivo("manifest.json", "application/manifest+json")),
+    Route("/sw.js", _arquivo("sw.js", "application/javascript")),
+    Route("/icon-192.png", _arquivo("icon-192.png", "image/png")),
+    Route("/icon-512.png", _arquivo("icon-512.png", "image/png")),
+    Route("/api/produtos", api_get_produtos, methods=["GET"]),
+    Route("/api/produtos", api_criar_produto, methods=["POST"]),
+    Route("/api/produtos/{id:int}", api_atualizar_produto, methods=["PUT"]),
+    Route("/api/produtos/{id:int}", api_excluir_produto, methods=["DELETE"]),
+    Route("/api/transacoes", api_get_transacoes, methods=["GET"]),
+    Route("/api/transacoes", api_criar_transacao, methods=["POST"]),
+    Route("/api/transacoes/{id:int}", api_excluir_transacao, methods=["DELETE"]),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PESCADOS_PORTA", 5000)))
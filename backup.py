@@ -0,0 +1,261 @@
+"""
+Pescados do Alexandre - Backup automatico do banco
+Copia o pescados.db com a API de backup online do SQLite, poucas paginas
+por vez e com uma pausa entre os passos, para que as gravacoes do app nao
+fiquem presas esperando. Cada copia passa por PRAGMA integrity_check,
+e guardada compactada (.db.gz) e as mais antigas sao apagadas conforme a
+retencao.
+
+Uso:
+  python backup.py                      # um backup agora
+  python backup.py --pasta D:\\backups --manter 30
+No app.py o agendador roda em segundo plano (--backup-horas, 0 desliga).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import lojas
+import metrics
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+PAGINAS_POR_PASSO = 256    # ~1 MB com paginas de 4 KB
+PAUSA_PASSO = 0.01         # segundos livres para os escritores entre passos
+MAX_REINICIOS = 3          # recomecos por gravacao concorrente antes da copia de uma vez
+MANTER = 14                # copias mantidas
+MANTER_DIAS = 0            # idade maxima em dias (0 = sem limite)
+PREFIXO = "pescados-"
+SUFIXO = ".db.gz"
+
+DURACAO = metrics.Histogram(
+    "pescados_backup_duration_seconds",
+    "Duracao do backup (copia, verificacao e compactacao)",
+    ("loja",),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+TAMANHO = metrics.Gauge(
+    "pescados_backup_size_bytes",
+    "Tamanho do ultimo backup",
+    ("loja", "arquivo"),
+)
+ULTIMO_SUCESSO = metrics.Gauge(
+    "pescados_backup_last_success_timestamp_seconds",
+    "Horario (epoch) do ultimo backup verificado",
+    ("loja",),
+)
+BACKUPS = metrics.Counter(
+    "pescados_backups_total",
+    "Backups executados por resultado",
+    ("loja", "resultado"),
+)
+
+
+class BackupInvalido(Exception):
+    """A copia nao passou no integrity_check"""
+
+
+class _Reiniciado(Exception):
+    pass
+
+
+def _copiar_online(origem: str, destino: str, paginas: int, pausa: float) -> int:
+    """Copia o banco em passos de 'paginas' paginas; devolve o total de paginas.
+
+    Uma gravacao de outra conexao faz o SQLite recomecar a copia. Se isso
+    acontecer MAX_REINICIOS vezes (app muito ocupado), o restante e feito
+    num passo so, que segura o banco apenas pelo tempo da copia.
+    """
+    total = 0
+    anterior = None
+    reinicios = 0
+
+    def progresso(status, restantes, paginas_total):
+        nonlocal total, anterior, reinicios
+        total = paginas_total
+        if anterior is not None and restantes > anterior:
+            reinicios += 1
+            if reinicios >= MAX_REINICIOS:
+                raise _Reiniciado
+        anterior = restantes
+        if restantes and pausa:
+            # Entre os passos o banco fica livre para as gravacoes do app
+            time.sleep(pausa)
+
+    fonte = sqlite3.connect(origem, timeout=30)
+    alvo = sqlite3.connect(destino)
+    try:
+        try:
+            fonte.backup(alvo, pages=paginas, progress=progresso)
+        except _Reiniciado:
+            fonte.backup(alvo)
+    finally:
+        alvo.close()
+        fonte.close()
+    return total
+
+
+def _verificar(caminho: str) -> None:
+    conn = sqlite3.connect(caminho)
+    try:
+        resultado = [r[0] for r in conn.execute("PRAGMA integrity_check").fetchall()]
+    finally:
+        conn.close()
+    if resultado != ["ok"]:
+        raise BackupInvalido("; ".join(resultado[:5]))
+
+
+def _compactar(origem: str, destino: str) -> None:
+    with open(origem, "rb") as f_in, gzip.open(destino, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+
+
+def listar(pasta: str) -> List[Dict[str, Any]]:
+    """Backups da pasta, do mais novo para o mais antigo"""
+    if not os.path.isdir(pasta):
+        return []
+    itens = []
+    for nome in os.listdir(pasta):
+        if nome.startswith(PREFIXO) and nome.endswith(SUFIXO):
+            caminho = os.path.join(pasta, nome)
+            info = os.stat(caminho)
+            itens.append({"arquivo": nome, "bytes": info.st_size, "criadoEm": info.st_mtime})
+    return sorted(itens, key=lambda i: i["arquivo"], reverse=True)
+
+
+def aplicar_retencao(pasta: str, manter: int = MANTER, manter_dias: int = MANTER_DIAS) -> List[str]:
+    """Apaga as copias alem de 'manter' ou mais velhas que 'manter_dias'"""
+    limite = time.time() - manter_dias * 86400 if manter_dias > 0 else None
+    apagados = []
+    for i, item in enumerate(listar(pasta)):
+        # A copia mais recente nunca e apagada
+        if i > 0 and (i >= max(manter, 1) or (limite is not None and item["criadoEm"] < limite)):
+            os.remove(os.path.join(pasta, item["arquivo"]))
+            apagados.append(item["arquivo"])
+    return apagados
+
+
+def fazer_backup(origem: str = DB_PATH, pasta: Optional[str] = None, manter: int = MANTER,
+                 manter_dias: int = MANTER_DIAS, paginas: int = PAGINAS_POR_PASSO,
+                 pausa: float = PAUSA_PASSO, loja: str = lojas.PADRAO) -> Dict[str, Any]:
+    """Faz, verifica e compacta uma copia do banco; devolve o relatorio.
+
+    'loja' so rotula as metricas (cada loja tem o seu ultimo sucesso).
+    """
+    pasta = pasta or os.path.join(os.path.dirname(os.path.abspath(origem)), "backups")
+    os.makedirs(pasta, exist_ok=True)
+    nome = f"{PREFIXO}{datetime.now().strftime('%Y%m%d-%H%M%S')}{SUFIXO}"
+    temporario = os.path.join(pasta, nome[: -len(".gz")] + ".tmp")
+    final = os.path.join(pasta, nome)
+
+    inicio = time.perf_counter()
+    try:
+        total_paginas = _copiar_online(origem, temporario, paginas, pausa)
+        _verificar(temporario)
+        tamanho_banco = os.path.getsize(temporario)
+        _compactar(temporario, final + ".tmp")
+        os.replace(final + ".tmp", final)
+    except Exception:
+        BACKUPS.inc(loja, "erro")
+        if os.path.exists(final + ".tmp"):
+            os.remove(final + ".tmp")
+        raise
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    duracao = time.perf_counter() - inicio
+
+    tamanho = os.path.getsize(final)
+    DURACAO.observe(loja, valor=duracao)
+    TAMANHO.set(loja, "compactado", valor=tamanho)
+    TAMANHO.set(loja, "banco", valor=tamanho_banco)
+    ULTIMO_SUCESSO.set(loja, valor=time.time())
+    BACKUPS.inc(loja, "ok")
+    return {
+        "arquivo": final,
+        "bytes": tamanho,
+        "bytesBanco": tamanho_banco,
+        "paginas": total_paginas,
+        "duracao": round(duracao, 3),
+        "apagados": aplicar_retencao(pasta, manter, manter_dias),
+    }
+
+
+class Agendador:
+    """Thread que faz um backup a cada 'intervalo' segundos.
+
+    bancos() devolve [(nome, caminho)]: o primeiro vai para 'pasta' e os
+    demais (uma loja cada) para 'pasta/<nome>'.
+    """
+
+    def __init__(self, intervalo: float, bancos: Callable[[], List[Tuple[str, str]]],
+                 pasta: str, espera_inicial: float = 60.0, **opcoes):
+        self.intervalo = intervalo
+        self.bancos = bancos
+        self.pasta = pasta
+        self.espera_inicial = espera_inicial
+        self.opcoes = opcoes
+        self.ultimo: Dict[str, Dict[str, Any]] = {}
+        self.ultimo_erro: Optional[str] = None
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def executar(self) -> None:
+        erros = []
+        for i, (nome, caminho) in enumerate(self.bancos()):
+            pasta = self.pasta if i == 0 else os.path.join(self.pasta, nome)
+            try:
+                relatorio = self.ultimo[nome] = fazer_backup(caminho, pasta, loja=nome, **self.opcoes)
+                print(f"   Backup {nome}: {os.path.basename(relatorio['arquivo'])} "
+                      f"({relatorio['bytes'] / 1024:.0f} KB em {relatorio['duracao']:.1f}s)")
+            except Exception as e:
+                erros.append(f"{nome}: {e}")
+                print(f"   Backup {nome} falhou: {e}")
+        self.ultimo_erro = "; ".join(erros) or None
+
+    def _loop(self) -> None:
+        espera = self.espera_inicial
+        while not self._parar.wait(espera):
+            self.executar()
+            espera = self.intervalo
+
+    def iniciar(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="pescados-backup", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout: float = 30.0) -> None:
+        # Um backup em andamento termina antes de a thread sair
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backup online do pescados.db")
+    parser.add_argument("--banco", default=DB_PATH)
+    parser.add_argument("--pasta", help="destino (padrao: pasta backups ao lado do banco)")
+    parser.add_argument("--manter", type=int, default=MANTER, help="copias mantidas")
+    parser.add_argument("--manter-dias", type=int, default=MANTER_DIAS, help="idade maxima em dias (0 = sem limite)")
+    args = parser.parse_args(argv)
+
+    relatorio = fazer_backup(args.banco, args.pasta, args.manter, args.manter_dias)
+    print(f"{relatorio['arquivo']}: {relatorio['bytes']} bytes "
+          f"(banco {relatorio['bytesBanco']} bytes) em {relatorio['duracao']}s")
+    for nome in relatorio["apagados"]:
+        print(f"removido {nome}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
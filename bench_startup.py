@@ -0,0 +1,88 @@
+"""
+Pescados do Alexandre - Tempo de inicializacao
+Sobe o app varias vezes e mede do lancamento do processo ate a primeira
+resposta de /api/produtos (o que o balcao espera ao abrir o app).
+
+Uso:
+  python bench_startup.py                          # python app.py, 5 vezes
+  python bench_startup.py --exe dist\\PescadosAlexandre.exe --vezes 3
+  python bench_startup.py --limite 1500            # sai com erro se a mediana passar de 1,5 s
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir(comando, timeout: float = 60.0):
+    """Devolve (ms ate a primeira resposta, linha 'Pronto em' do app)"""
+    porta = _porta_livre()
+    ambiente = dict(os.environ, PYTHONUNBUFFERED="1")
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        comando + ["--porta", str(porta), "--sem-navegador", "--backup-horas", "0"],
+        cwd=APP_DIR, env=ambiente, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    try:
+        while True:
+            if processo.poll() is not None:
+                raise RuntimeError("o app encerrou antes de responder:\n" + processo.stdout.read())
+            if time.perf_counter() - inicio > timeout:
+                raise TimeoutError(f"sem resposta em {timeout:.0f}s")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{porta}/api/produtos", timeout=5) as r:
+                    r.read()
+                break
+            except OSError:
+                time.sleep(0.01)
+        decorrido = (time.perf_counter() - inicio) * 1000
+    finally:
+        processo.terminate()
+        try:
+            saida, _ = processo.communicate(timeout=15)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+            saida, _ = processo.communicate()
+    pronto = next((linha.strip() for linha in (saida or "").splitlines() if "Pronto em" in linha), "")
+    return decorrido, pronto
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mede o tempo de inicializacao do app")
+    parser.add_argument("--exe", help="executavel gerado pelo build.bat (padrao: python app.py)")
+    parser.add_argument("--vezes", type=int, default=5)
+    parser.add_argument("--limite", type=float, help="mediana maxima em ms (falha se passar)")
+    args = parser.parse_args(argv)
+
+    comando = [os.path.abspath(args.exe)] if args.exe else [sys.executable, os.path.join(APP_DIR, "app.py")]
+    tempos = []
+    for i in range(max(args.vezes, 1)):
+        decorrido, pronto = medir(comando)
+        tempos.append(decorrido)
+        print(f"{i + 1}: {decorrido:.0f} ms  {pronto}")
+
+    mediana = statistics.median(tempos)
+    print(f"mediana {mediana:.0f} ms (min {min(tempos):.0f}, max {max(tempos):.0f})")
+    if args.limite is not None and mediana > args.limite:
+        print(f"acima do limite de {args.limite:.0f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
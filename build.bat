@@ -13,6 +13,17 @@ if errorlevel 1 (
     exit /b 1
 )
 
+REM Node.js e opcional: sem ele o frontend vai sem compilar (frontend/ direto)
+set FRONTEND_DIST=1
+call npm --version >nul 2>&1
+if errorlevel 1 (
+    echo AVISO: Node.js nao encontrado - o frontend nao sera compilado.
+    echo O app usara frontend/ direto, com React e Tailwind vindos de CDN.
+    echo Para o frontend compilado, instale o Node.js em https://nodejs.org
+    echo.
+    set FRONTEND_DIST=0
+)
+
 REM Criar diretorio de build
 if exist "build_env" rmdir /s /q "build_env"
 if exist "dist" rmdir /s /q "dist"
@@ -29,15 +40,39 @@ if errorlevel 1 (
 echo [2/4] Instalando dependencias...
 call build_env\Scripts\activate.bat
 pip install --upgrade pip >nul 2>&1
-pip install flask flask-cors pyinstaller
+pip install flask flask-cors waitress brotli numpy pyinstaller
 if errorlevel 1 (
     echo ERRO ao instalar dependencias!
     pause
     exit /b 1
 )
 
+REM Ferramentas do frontend (esbuild, tailwindcss) e React/Recharts embutidos
+if "%FRONTEND_DIST%"=="1" (
+    call npm install --no-audit --no-fund
+    if errorlevel 1 (
+        echo ERRO ao instalar dependencias do frontend!
+        pause
+        exit /b 1
+    )
+)
+
 echo [3/4] Compilando executavel...
 
+REM Gerar frontend/dist (JSX compilado, CSS purgado, assets com hash, .gz/.br
+REM e precache do service worker). Sem Node.js, descartar um dist/ antigo para
+REM o executavel nao levar um frontend desatualizado
+if "%FRONTEND_DIST%"=="1" (
+    python build_frontend.py
+    if errorlevel 1 (
+        echo ERRO ao gerar o frontend!
+        pause
+        exit /b 1
+    )
+) else (
+    if exist "frontend\dist" rmdir /s /q "frontend\dist"
+)
+
 REM Adicionando favicon.ico ao build (opcional, se existir)
 if exist "favicon.ico" (
     set FAVICON_ARG=--add-data "favicon.ico;." ^
@@ -51,8 +86,10 @@ pyinstaller --noconfirm --onefile --windowed ^
     %FAVICON_ARG% ^
     --hidden-import "flask" ^
     --hidden-import "flask_cors" ^
+    --hidden-import "waitress" ^
     --hidden-import "werkzeug" ^
     --hidden-import "jinja2" ^
+    --hidden-import "numpy" ^
     app.py
 
 if errorlevel 1 (
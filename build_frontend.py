@@ -0,0 +1,278 @@
+"""
+Pescados do Alexandre - Build do frontend
+Gera frontend/dist/ com:
+  - o app JSX pre-compilado e minificado (esbuild), o CSS do Tailwind so com
+    as classes usadas e React/Recharts embutidos, sem Babel nem CDN no celular
+  - assets com hash do conteudo no nome (assets/icon-192.<hash>.png), servidos
+    pelo app.py com cache imutavel de 1 ano
+  - index.html, manifest.json e sw.js apontando para os nomes versionados
+  - lista de precache do service worker e CACHE_NAME derivados dos hashes
+  - versoes pre-comprimidas .gz (e .br se o modulo brotli estiver instalado)
+
+Requer Node.js para a compilacao (npm install na raiz do projeto).
+
+Uso:
+  python build_frontend.py                # compila o JSX (padrao)
+  python build_frontend.py --sem-compilar # mantem Babel/CDN no navegador
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(APP_DIR, "frontend")
+DIST_DIR = os.path.join(FRONTEND_DIR, "dist")
+ASSETS_DIR = os.path.join(DIST_DIR, "assets")
+NODE_MODULES = os.path.join(APP_DIR, "node_modules")
+
+# Bibliotecas UMD embutidas no vendor.js, na ordem de carregamento
+VENDOR_UMD = [
+    "react/umd/react.production.min.js",
+    "react-dom/umd/react-dom.production.min.js",
+    "prop-types/prop-types.min.js",
+    "react-is/umd/react-is.production.min.js",
+    "recharts/umd/Recharts.min.js",
+]
+
+TAILWIND_ENTRADA = "@tailwind base;\n@tailwind components;\n@tailwind utilities;\n"
+
+# Arquivos copiados com hash no nome (caminho relativo a frontend/)
+ASSETS_VERSIONADOS = ["icon-192.png", "icon-512.png"]
+
+# Extensoes que valem a pena comprimir
+COMPRIMIVEIS = (".html", ".js", ".css", ".json", ".svg", ".txt")
+TAMANHO_MINIMO_COMPRESSAO = 512
+
+TAMANHO_HASH = 10
+
+
+def hash_conteudo(dados: bytes) -> str:
+    return hashlib.sha256(dados).hexdigest()[:TAMANHO_HASH]
+
+
+def nome_versionado(nome: str, dados: bytes) -> str:
+    base, ext = os.path.splitext(os.path.basename(nome))
+    return f"{base}.{hash_conteudo(dados)}{ext}"
+
+
+def ler(caminho: str) -> bytes:
+    with open(caminho, "rb") as f:
+        return f.read()
+
+
+def escrever(caminho: str, dados: bytes) -> None:
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, "wb") as f:
+        f.write(dados)
+
+
+def publicar_asset(nome: str, dados: bytes, mapa: dict) -> str:
+    """Grava um asset em dist/assets com hash no nome e devolve a URL"""
+    versionado = nome_versionado(nome, dados)
+    escrever(os.path.join(ASSETS_DIR, versionado), dados)
+    url = f"/assets/{versionado}"
+    mapa[nome] = url
+    return url
+
+
+def reescrever_referencias(texto: str, mapa: dict) -> str:
+    """Troca /nome pelos caminhos versionados em HTML/JSON"""
+    for nome, url in mapa.items():
+        texto = re.sub(r'(["\'(])/' + re.escape(nome) + r'(["\')])', r"\1" + url + r"\2", texto)
+    return texto
+
+
+def gerar_service_worker(mapa: dict, cdn: list) -> bytes:
+    """Reescreve o bloco @build do sw.js com CACHE_NAME e precache gerados"""
+    fonte = ler(os.path.join(FRONTEND_DIR, "sw.js")).decode("utf-8")
+    precache = ["/", "/manifest.json"] + sorted(mapa.values()) + cdn
+    versao = hash_conteudo("\n".join(precache).encode("utf-8"))
+    bloco = (
+        "// @build:inicio - gerado por build_frontend.py, nao editar\n"
+        f"const CACHE_NAME = 'pescados-{versao}';\n\n"
+        "// Arquivos para cachear (shell do app)\n"
+        f"const SHELL_CACHE = {json.dumps(precache, indent=2)};\n"
+        "// @build:fim"
+    )
+    gerado, n = re.subn(r"// @build:inicio.*?// @build:fim", lambda _: bloco, fonte, flags=re.S)
+    if n != 1:
+        raise SystemExit("sw.js sem o bloco // @build:inicio ... // @build:fim")
+    return gerado.encode("utf-8")
+
+
+def urls_cdn(html: str) -> list:
+    """Scripts externos ainda carregados pelo index.html (entram no precache)"""
+    return re.findall(r'<script[^>]+src="(https?://[^"]+)"', html)
+
+
+# ==================== COMPILACAO ====================
+
+BABEL_SCRIPT = re.compile(r'\s*<script type="text/babel">(.*?)</script>', re.S)
+SCRIPT_CDN = re.compile(r'\s*<script src="https?://[^"]+"></script>')
+
+
+def ferramenta_node(nome: str) -> str:
+    """Caminho do executavel em node_modules/.bin (com .cmd no Windows)"""
+    for candidato in (nome + ".cmd", nome) if os.name == "nt" else (nome,):
+        caminho = os.path.join(NODE_MODULES, ".bin", candidato)
+        if os.path.isfile(caminho):
+            return caminho
+    raise SystemExit(
+        f"{nome} nao encontrado em node_modules. Rode 'npm install' na raiz do projeto "
+        "ou use --sem-compilar."
+    )
+
+
+def compilar_jsx(fonte: str) -> bytes:
+    """JSX -> JS minificado (sem bundle: React e Recharts continuam globais)"""
+    resultado = subprocess.run(
+        [ferramenta_node("esbuild"), "--loader=jsx", "--format=iife", "--minify",
+         "--target=es2017", "--log-level=warning"],
+        input=fonte.encode("utf-8"),
+        capture_output=True,
+        check=False,
+    )
+    if resultado.returncode != 0:
+        raise SystemExit("Falha ao compilar JSX:\n" + resultado.stderr.decode("utf-8", "replace"))
+    return resultado.stdout
+
+
+def gerar_css(fonte_jsx: str) -> bytes:
+    """CSS do Tailwind contendo apenas as classes usadas no app"""
+    with tempfile.TemporaryDirectory() as tmp:
+        conteudo = os.path.join(tmp, "app.jsx")
+        entrada = os.path.join(tmp, "entrada.css")
+        saida = os.path.join(tmp, "app.css")
+        escrever(conteudo, fonte_jsx.encode("utf-8"))
+        escrever(entrada, TAILWIND_ENTRADA.encode("utf-8"))
+        resultado = subprocess.run(
+            [ferramenta_node("tailwindcss"), "-i", entrada, "-o", saida,
+             "--content", conteudo, "--minify"],
+            capture_output=True,
+            check=False,
+        )
+        if resultado.returncode != 0:
+            raise SystemExit("Falha ao gerar CSS:\n" + resultado.stderr.decode("utf-8", "replace"))
+        return ler(saida)
+
+
+def gerar_vendor() -> bytes:
+    """Concatena as bibliotecas UMD instaladas pelo npm"""
+    partes = []
+    for relativo in VENDOR_UMD:
+        caminho = os.path.join(NODE_MODULES, *relativo.split("/"))
+        if not os.path.isfile(caminho):
+            raise SystemExit(f"{relativo} nao encontrado. Rode 'npm install' na raiz do projeto.")
+        partes.append(ler(caminho).rstrip())
+    return b";\n".join(partes) + b";\n"
+
+
+def compilar_html(html: str, mapa: dict) -> str:
+    """Troca Babel/CDN pelos arquivos compilados e versionados"""
+    encontrado = BABEL_SCRIPT.search(html)
+    if encontrado is None:
+        raise SystemExit('index.html sem <script type="text/babel">')
+    fonte_jsx = encontrado.group(1)
+
+    url_js = publicar_asset("app.js", compilar_jsx(fonte_jsx), mapa)
+    url_css = publicar_asset("app.css", gerar_css(fonte_jsx), mapa)
+    url_vendor = publicar_asset("vendor.js", gerar_vendor(), mapa)
+
+    scripts = (
+        f'\n  <script src="{url_vendor}"></script>'
+        f'\n  <script src="{url_js}"></script>'
+    )
+    html = html[:encontrado.start()] + scripts + html[encontrado.end():]
+    html = SCRIPT_CDN.sub("", html)
+    return html.replace("</title>", f'</title>\n  <link rel="stylesheet" href="{url_css}">', 1)
+
+
+def comprimir_arquivos(pasta: str) -> tuple:
+    """Cria .gz e .br ao lado de cada arquivo de texto"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    total_gz = total_br = 0
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in arquivos:
+            if not nome.endswith(COMPRIMIVEIS):
+                continue
+            caminho = os.path.join(raiz, nome)
+            dados = ler(caminho)
+            if len(dados) < TAMANHO_MINIMO_COMPRESSAO:
+                continue
+            gz = gzip.compress(dados, compresslevel=9, mtime=0)
+            if len(gz) < len(dados):
+                escrever(caminho + ".gz", gz)
+                total_gz += 1
+            if brotli is not None:
+                br = brotli.compress(dados, quality=11)
+                if len(br) < len(dados):
+                    escrever(caminho + ".br", br)
+                    total_br += 1
+    return total_gz, total_br
+
+
+def gerar(compilar: bool) -> dict:
+    """Monta o dist/ e devolve o mapa nome -> URL versionada"""
+    os.makedirs(ASSETS_DIR)
+
+    mapa = {}
+    for nome in ASSETS_VERSIONADOS:
+        publicar_asset(nome, ler(os.path.join(FRONTEND_DIR, nome)), mapa)
+
+    manifesto = ler(os.path.join(FRONTEND_DIR, "manifest.json")).decode("utf-8")
+    escrever(os.path.join(DIST_DIR, "manifest.json"), reescrever_referencias(manifesto, mapa).encode("utf-8"))
+
+    html = ler(os.path.join(FRONTEND_DIR, "index.html")).decode("utf-8")
+    if compilar:
+        html = compilar_html(html, mapa)
+    html = reescrever_referencias(html, mapa)
+    escrever(os.path.join(DIST_DIR, "index.html"), html.encode("utf-8"))
+
+    escrever(os.path.join(DIST_DIR, "sw.js"), gerar_service_worker(mapa, urls_cdn(html)))
+    escrever(os.path.join(DIST_DIR, "asset-manifest.json"),
+             json.dumps(mapa, indent=2, sort_keys=True).encode("utf-8"))
+    return mapa
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    compilar = "--sem-compilar" not in argv
+
+    if compilar:
+        # Falhar antes de apagar o dist/ atual
+        ferramenta_node("esbuild")
+        ferramenta_node("tailwindcss")
+
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    try:
+        mapa = gerar(compilar)
+    except BaseException:
+        # dist/ incompleto faria o app.py servir um frontend quebrado
+        shutil.rmtree(DIST_DIR, ignore_errors=True)
+        raise
+
+    total_gz, total_br = comprimir_arquivos(DIST_DIR)
+
+    print(f"Frontend gerado em {DIST_DIR}")
+    for nome, url in sorted(mapa.items()):
+        print(f"  {nome} -> {url}")
+    print(f"  {total_gz} arquivo(s) .gz, {total_br} arquivo(s) .br")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Pescados do Alexandre - Cache de consultas em memoria
+Guarda o resultado das leituras mais repetidas (lista de produtos, paginas
+de transacoes, custos, serie de lucro) por consulta e parametros, num LRU
+limitado. Cada tabela tem um contador de geracao por loja; toda gravacao
+feita pelo app incrementa o contador da tabela e as entradas que dependem
+dela deixam de valer, sem varrer o cache.
+
+Gravacoes feitas por outro processo (Streamlit, scripts de importacao ou
+arquivamento) nao passam pelos contadores: por isso cada entrada tambem
+expira depois de VALIDADE segundos.
+
+Os resultados sao compartilhados entre as requisicoes: nao altere o que
+get() devolve.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+import lojas
+import metrics
+
+MAXIMO = 512       # entradas guardadas
+VALIDADE = 30.0    # segundos (cobre gravacoes de outros processos)
+
+ACERTOS = metrics.Counter(
+    "pescados_cache_hits_total",
+    "Consultas respondidas pelo cache",
+    ("consulta",),
+)
+FALHAS = metrics.Counter(
+    "pescados_cache_misses_total",
+    "Consultas que foram ao banco",
+    ("consulta",),
+)
+ENTRADAS = metrics.Gauge(
+    "pescados_cache_entries",
+    "Resultados guardados no cache",
+)
+
+
+class Cache:
+    def __init__(self, maximo: int = MAXIMO, validade: float = VALIDADE):
+        self.maximo = maximo
+        self.validade = validade
+        self._entradas: "OrderedDict[tuple, Tuple[tuple, float, Any]]" = OrderedDict()
+        self._geracoes: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _versao(self, loja: str, tabelas: Sequence[str]) -> tuple:
+        return tuple(self._geracoes.get((loja, t), 0) for t in tabelas)
+
+    def get(self, consulta: str, params: tuple, tabelas: Sequence[str], calcular: Callable[[], Any]):
+        """Resultado guardado de 'consulta', ou calcular() se alguma tabela mudou"""
+        loja = lojas.atual()
+        chave = (loja, consulta, params)
+        agora = time.monotonic()
+        with self._lock:
+            versao = self._versao(loja, tabelas)
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada[0] == versao and entrada[1] > agora:
+                self._entradas.move_to_end(chave)
+                ACERTOS.inc(consulta)
+                return entrada[2]
+        FALHAS.inc(consulta)
+        # A versao lida antes da consulta: uma gravacao no meio invalida o resultado
+        valor = calcular()
+        with self._lock:
+            self._entradas[chave] = (versao, agora + self.validade, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+            ENTRADAS.set(valor=len(self._entradas))
+        return valor
+
+    def invalidar(self, *tabelas: str, loja: str | None = None) -> None:
+        """Chamado depois do COMMIT de uma gravacao nas tabelas"""
+        loja = loja or lojas.atual()
+        with self._lock:
+            for tabela in tabelas:
+                self._geracoes[(loja, tabela)] = self._geracoes.get((loja, tabela), 0) + 1
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            ENTRADAS.set(valor=0)
+
+
+CACHE = Cache()
+
+
+def memorizar(consulta: str, *tabelas: str):
+    """Decorador: guarda o resultado da funcao por argumentos e loja"""
+    def decorar(funcao):
+        def envolvida(*args, **kwargs):
+            params = args + tuple(sorted(kwargs.items()))
+            return CACHE.get(consulta, params, tabelas, lambda: funcao(*args, **kwargs))
+        envolvida.__name__ = funcao.__name__
+        envolvida.__doc__ = funcao.__doc__
+        envolvida.sem_cache = funcao
+        return envolvida
+    return decorar
+
+
+def invalidar(*tabelas: str, loja: str | None = None) -> None:
+    CACHE.invalidar(*tabelas, loja=loja)
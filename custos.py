@@ -0,0 +1,730 @@
+"""
+Pescados do Alexandre - Custo das mercadorias vendidas
+Motor de custo por produto (FIFO ou custo medio movel) com estado
+persistido no banco. Cada transacao nova e aplicada sobre o estado salvo,
+sem reler o historico; transacoes retroativas e exclusoes refazem so o
+trecho a partir do ultimo checkpoint anterior a elas.
+
+Tabelas:
+  custo_estado       estado atual de cada produto (lotes em JSON)
+  custo_movimentos   uma linha por transacao: receita, custo, estoque apos
+  custo_checkpoints  copia do estado a cada INTERVALO_CHECKPOINT movimentos
+  saldos_abertura    estado e totais acumulados na data de corte do arquivo
+  custo_movimentos_arquivo  movimentos dos periodos arquivados
+
+Depois de um arquivamento (ver arquivamento.py) o livro recomeca do saldo
+de abertura de cada produto, e o resumo so le o arquivo quando o periodo
+pedido comeca antes do corte.
+
+Funciona com sqlite3 e psycopg2: as funcoes recebem a conexao aberta (e o
+placeholder do driver) e nao fazem commit, para entrar na mesma transacao
+da gravacao que as chamou.
+
+As transacoes sao lidas em ponto fixo (gramas, centavos, dia; ver
+unidades.py) e convertidas para kg, reais e AAAA-MM-DD; o livro de custo
+guarda valores derivados (custo medio por kg nao e inteiro).
+
+Metodo escolhido por PESCADOS_CUSTO_METODO ("media" ou "fifo", padrao media).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import unidades
+
+METODOS = ("media", "fifo")
+INTERVALO_CHECKPOINT = 200
+EPSILON_KG = 1e-9
+
+
+def metodo_padrao() -> str:
+    metodo = os.getenv("PESCADOS_CUSTO_METODO", "media").lower()
+    return metodo if metodo in METODOS else "media"
+
+
+# ==================== ESQUEMA ====================
+
+def criar_tabelas(conn, backend: str = "sqlite") -> None:
+    real = "DOUBLE PRECISION" if backend == "postgres" else "REAL"
+    tipo_data = "DATE" if backend == "postgres" else "TEXT"
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS custo_estado (
+            produtoId INTEGER PRIMARY KEY,
+            metodo TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            ultimaData {tipo_data},
+            ultimoId INTEGER,
+            estado TEXT NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS custo_movimentos (
+            transacaoId INTEGER PRIMARY KEY,
+            produtoId INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            data {tipo_data} NOT NULL,
+            tipo TEXT NOT NULL,
+            pesoKg {real} NOT NULL,
+            receita {real} NOT NULL,
+            custo {real} NOT NULL,
+            compra {real} NOT NULL,
+            estoqueKg {real} NOT NULL,
+            valorEstoque {real} NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS custo_movimentos_arquivo (
+            transacaoId INTEGER PRIMARY KEY,
+            produtoId INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            data {tipo_data} NOT NULL,
+            tipo TEXT NOT NULL,
+            pesoKg {real} NOT NULL,
+            receita {real} NOT NULL,
+            custo {real} NOT NULL,
+            compra {real} NOT NULL,
+            estoqueKg {real} NOT NULL,
+            valorEstoque {real} NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_custo_movimentos_arquivo_data ON custo_movimentos_arquivo (data)"
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS saldos_abertura (
+            produtoId INTEGER PRIMARY KEY,
+            dataCorte {tipo_data} NOT NULL,
+            metodo TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            ultimaData {tipo_data},
+            ultimoId INTEGER,
+            estado TEXT NOT NULL,
+            pesoKg {real} NOT NULL,
+            valor {real} NOT NULL,
+            pesoComprado {real} NOT NULL,
+            pesoVendido {real} NOT NULL,
+            valorComprado {real} NOT NULL,
+            receita {real} NOT NULL,
+            custoVendido {real} NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_custo_movimentos_produto ON custo_movimentos (produtoId, seq)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_custo_movimentos_data ON custo_movimentos (data)"
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS custo_checkpoints (
+            produtoId INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            ultimaData {tipo_data} NOT NULL,
+            ultimoId INTEGER NOT NULL,
+            estado TEXT NOT NULL,
+            PRIMARY KEY (produtoId, seq)
+        )
+        """
+    )
+    cursor.close()
+
+
+# ==================== ESTADO ====================
+
+def estado_vazio() -> Dict[str, Any]:
+    # lotes: [[peso_kg, custo_kg], ...] do mais antigo para o mais novo
+    # (no custo medio existe no maximo um lote). deficit: kg vendidos sem
+    # estoque registrado, cobertos pelas proximas compras.
+    return {"lotes": [], "deficit": 0.0, "ultimoCusto": 0.0}
+
+
+def _estoque(estado) -> Tuple[float, float]:
+    peso = sum(lote[0] for lote in estado["lotes"])
+    valor = sum(lote[0] * lote[1] for lote in estado["lotes"])
+    return peso - estado["deficit"], valor
+
+
+def aplicar(estado, metodo: str, tipo: str, peso_kg: float, valor_total: float) -> float:
+    """Aplica uma transacao ao estado e devolve o custo da venda (0 na compra)"""
+    lotes = estado["lotes"]
+    if tipo == "compra":
+        if peso_kg <= EPSILON_KG:
+            return 0.0
+        custo_kg = valor_total / peso_kg
+        estado["ultimoCusto"] = custo_kg
+        cobre = min(estado["deficit"], peso_kg)
+        estado["deficit"] -= cobre
+        peso_kg -= cobre
+        if peso_kg <= EPSILON_KG:
+            return 0.0
+        if metodo == "fifo" or not lotes:
+            lotes.append([peso_kg, custo_kg])
+        else:
+            peso_atual, custo_atual = lotes[0]
+            total = peso_atual + peso_kg
+            lotes[0] = [total, (peso_atual * custo_atual + peso_kg * custo_kg) / total]
+        return 0.0
+
+    custo = 0.0
+    restante = peso_kg
+    while restante > EPSILON_KG and lotes:
+        lote = lotes[0]
+        usado = min(lote[0], restante)
+        custo += usado * lote[1]
+        restante -= usado
+        lote[0] -= usado
+        if lote[0] <= EPSILON_KG:
+            lotes.pop(0)
+    if restante > EPSILON_KG:
+        # Venda maior que o estoque: custo da ultima compra conhecida
+        custo += restante * estado["ultimoCusto"]
+        estado["deficit"] += restante
+    return custo
+
+
+# ==================== PERSISTENCIA ====================
+
+class _Db:
+    def __init__(self, conn, placeholder: str):
+        self.conn = conn
+        self.p = placeholder
+        self.cursor = conn.cursor()
+
+    def sql(self, texto: str) -> str:
+        return texto.replace("?", self.p)
+
+    def um(self, texto: str, params=()):
+        self.cursor.execute(self.sql(texto), params)
+        return self.cursor.fetchone()
+
+    def todos(self, texto: str, params=()) -> List:
+        self.cursor.execute(self.sql(texto), params)
+        return self.cursor.fetchall()
+
+    def executar(self, texto: str, params=()) -> None:
+        self.cursor.execute(self.sql(texto), params)
+
+    def varios(self, texto: str, linhas) -> None:
+        if linhas:
+            self.cursor.executemany(self.sql(texto), linhas)
+
+    def fechar(self) -> None:
+        self.cursor.close()
+
+
+def _texto_data(valor) -> str:
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+def _ler_estado(db: _Db, produto_id: int):
+    row = db.um("SELECT metodo, seq, ultimaData, ultimoId, estado FROM custo_estado WHERE produtoId = ?",
+                (produto_id,))
+    if row is None:
+        return None
+    metodo, seq, data, ultimo_id, estado = row[0], row[1], row[2], row[3], row[4]
+    return metodo, seq, (_texto_data(data), ultimo_id) if data is not None else None, json.loads(estado)
+
+
+def _ler_saldo(db: _Db, produto_id: int):
+    """(seq, chave, estado) do saldo de abertura do produto, se houver"""
+    row = db.um("SELECT seq, ultimaData, ultimoId, estado FROM saldos_abertura WHERE produtoId = ?",
+                (produto_id,))
+    if row is None:
+        return None
+    chave = (_texto_data(row[1]), row[2]) if row[1] is not None else None
+    return row[0], chave, json.loads(row[3])
+
+
+def _salvar_estado(db: _Db, produto_id: int, metodo: str, seq: int, chave, estado) -> None:
+    db.executar("DELETE FROM custo_estado WHERE produtoId = ?", (produto_id,))
+    db.executar(
+        "INSERT INTO custo_estado (produtoId, metodo, seq, ultimaData, ultimoId, estado) VALUES (?, ?, ?, ?, ?, ?)",
+        (produto_id, metodo, seq, chave[0] if chave else None, chave[1] if chave else None,
+         json.dumps(estado, separators=(",", ":"))),
+    )
+
+
+def _ler_transacoes(db: _Db, texto: str, params) -> List[tuple]:
+    """(id, tipo, peso_kg, valor_total, data) das linhas (id, tipo, pesoG, valorCentavos, dia)"""
+    return [
+        (r[0], r[1], unidades.kg(r[2]), unidades.reais(r[3]), unidades.data_iso(r[4]))
+        for r in db.todos(texto, params)
+    ]
+
+
+def _processar(db: _Db, produto_id: int, metodo: str, seq: int, estado, transacoes) -> Tuple[int, Optional[tuple]]:
+    """Aplica transacoes em ordem, grava movimentos e checkpoints"""
+    movimentos = []
+    checkpoints = []
+    chave = None
+    for transacao_id, tipo, peso_kg, valor_total, data in transacoes:
+        data = _texto_data(data)
+        custo = aplicar(estado, metodo, tipo, peso_kg, valor_total)
+        seq += 1
+        chave = (data, transacao_id)
+        estoque_kg, valor_estoque = _estoque(estado)
+        movimentos.append((
+            transacao_id, produto_id, seq, data, tipo, peso_kg,
+            valor_total if tipo == "venda" else 0.0, custo,
+            valor_total if tipo == "compra" else 0.0,
+            estoque_kg, valor_estoque,
+        ))
+        if seq % INTERVALO_CHECKPOINT == 0:
+            checkpoints.append((produto_id, seq, data, transacao_id, json.dumps(estado, separators=(",", ":"))))
+
+    db.varios(
+        """
+        INSERT INTO custo_movimentos
+            (transacaoId, produtoId, seq, data, tipo, pesoKg, receita, custo, compra, estoqueKg, valorEstoque)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        movimentos,
+    )
+    db.varios(
+        "INSERT INTO custo_checkpoints (produtoId, seq, ultimaData, ultimoId, estado) VALUES (?, ?, ?, ?, ?)",
+        checkpoints,
+    )
+    return seq, chave
+
+
+def _reprocessar(db: _Db, produto_id: int, metodo: str, desde=None) -> None:
+    """Refaz o produto a partir do ultimo checkpoint anterior a 'desde' (data, id)"""
+    checkpoint = None
+    if desde is not None:
+        checkpoint = db.um(
+            """
+            SELECT seq, ultimaData, ultimoId, estado FROM custo_checkpoints
+            WHERE produtoId = ? AND (ultimaData < ? OR (ultimaData = ? AND ultimoId < ?))
+            ORDER BY seq DESC LIMIT 1
+            """,
+            (produto_id, desde[0], desde[0], desde[1]),
+        )
+
+    if checkpoint is None:
+        # Do zero ou do saldo de abertura do arquivo. Transacoes lancadas
+        # depois do corte com data anterior a ele entram logo na abertura.
+        seq, chave, estado = _ler_saldo(db, produto_id) or (0, None, estado_vazio())
+        db.executar("DELETE FROM custo_movimentos WHERE produtoId = ?", (produto_id,))
+        db.executar("DELETE FROM custo_checkpoints WHERE produtoId = ?", (produto_id,))
+        transacoes = _ler_transacoes(
+            db,
+            """
+            SELECT id, tipo, pesoG, valorCentavos, dia FROM transacoes
+            WHERE produtoId = ? ORDER BY dia, id
+            """,
+            (produto_id,),
+        )
+    else:
+        seq = checkpoint[0]
+        chave = (_texto_data(checkpoint[1]), checkpoint[2])
+        estado = json.loads(checkpoint[3])
+        db.executar("DELETE FROM custo_movimentos WHERE produtoId = ? AND seq > ?", (produto_id, seq))
+        db.executar("DELETE FROM custo_checkpoints WHERE produtoId = ? AND seq > ?", (produto_id, seq))
+        dia = unidades.dia(chave[0])
+        transacoes = _ler_transacoes(
+            db,
+            """
+            SELECT id, tipo, pesoG, valorCentavos, dia FROM transacoes
+            WHERE produtoId = ? AND (dia > ? OR (dia = ? AND id > ?))
+            ORDER BY dia, id
+            """,
+            (produto_id, dia, dia, chave[1]),
+        )
+
+    novo_seq, nova_chave = _processar(db, produto_id, metodo, seq, estado, transacoes)
+    _salvar_estado(db, produto_id, metodo, novo_seq, nova_chave or chave, estado)
+
+
+# ==================== API ====================
+
+def registrar(conn, transacao_id: int, produto_id: int, tipo: str, peso_kg: float,
+              valor_total: float, data, placeholder: str = "?", metodo: str | None = None) -> None:
+    """Atualiza o custo depois de inserir uma transacao (mesma conexao, sem commit)"""
+    metodo = metodo or metodo_padrao()
+    data = _texto_data(data)
+    db = _Db(conn, placeholder)
+    try:
+        atual = _ler_estado(db, produto_id)
+        if atual is None or atual[0] != metodo:
+            _reprocessar(db, produto_id, metodo)
+            return
+        _, seq, chave, estado = atual
+        if chave is not None and (data, transacao_id) < chave:
+            # Transacao retroativa: refaz a partir dela
+            _reprocessar(db, produto_id, metodo, desde=(data, transacao_id))
+            return
+        seq, nova_chave = _processar(
+            db, produto_id, metodo, seq, estado, [(transacao_id, tipo, peso_kg, valor_total, data)]
+        )
+        _salvar_estado(db, produto_id, metodo, seq, nova_chave, estado)
+    finally:
+        db.fechar()
+
+
+def remover(conn, transacao_id: int, placeholder: str = "?", metodo: str | None = None) -> None:
+    """Atualiza o custo depois de excluir uma transacao (mesma conexao, sem commit)"""
+    db = _Db(conn, placeholder)
+    try:
+        row = db.um("SELECT produtoId, data FROM custo_movimentos WHERE transacaoId = ?", (transacao_id,))
+        if row is None:
+            return
+        produto_id, data = row[0], _texto_data(row[1])
+        _reprocessar(db, produto_id, metodo or metodo_padrao(), desde=(data, transacao_id))
+    finally:
+        db.fechar()
+
+
+def _assinaturas(db: _Db, texto: str,
+                 converter_dia: Callable[[Any], int] = int) -> Dict[Tuple[int, int], tuple]:
+    """{(produto, dia): (linhas, gramas, centavos, maior id)} de uma consulta agrupada"""
+    return {
+        (int(r[0]), converter_dia(r[1])): (int(r[2]), int(r[3] or 0), int(r[4] or 0), int(r[5]))
+        for r in db.todos(texto)
+    }
+
+
+def sincronizar(conn, placeholder: str = "?", metodo: str | None = None) -> int:
+    """Refaz os produtos cujo livro de custo nao bate com as transacoes.
+
+    Cobre gravacoes feitas por fora do motor (versoes antigas, scripts,
+    importacao, troca de metodo). Cada produto e conferido dia a dia por
+    quantidade, peso, valor e maior id; o produto e refeito a partir do
+    primeiro dia diferente. Devolve quantos produtos foram refeitos.
+    """
+    metodo = metodo or metodo_padrao()
+    db = _Db(conn, placeholder)
+    try:
+        transacoes = _assinaturas(
+            db,
+            """
+            SELECT produtoId, dia, COUNT(*), SUM(pesoG), SUM(valorCentavos), MAX(id)
+            FROM transacoes GROUP BY produtoId, dia
+            """,
+        )
+        # O livro guarda kg e reais; cada linha volta a gramas e centavos exatos
+        movimentos = _assinaturas(
+            db,
+            f"""
+            SELECT produtoId, data, COUNT(*), SUM(ROUND(pesoKg * {unidades.GRAMAS})),
+                   SUM(ROUND((receita + compra) * {unidades.CENTAVOS})), MAX(transacaoId)
+            FROM custo_movimentos GROUP BY produtoId, data
+            """,
+            lambda data: unidades.dia(_texto_data(data)),
+        )
+        metodos = dict(db.todos("SELECT produtoId, metodo FROM custo_estado"))
+        desde: Dict[int, Optional[int]] = {}
+        for produto_id, dia in set(transacoes) | set(movimentos):
+            if transacoes.get((produto_id, dia)) != movimentos.get((produto_id, dia)):
+                desde[produto_id] = min(dia, desde.get(produto_id, dia))
+        for produto_id in metodos:
+            if metodos[produto_id] != metodo:
+                desde[int(produto_id)] = None
+        # Transacao que trocou de produto: o movimento antigo sai antes, senao
+        # o produto novo nao consegue grava-lo (transacaoId e unico)
+        db.executar(
+            """
+            DELETE FROM custo_movimentos WHERE transacaoId IN (
+                SELECT m.transacaoId FROM custo_movimentos m
+                JOIN transacoes t ON t.id = m.transacaoId
+                WHERE t.produtoId <> m.produtoId
+            )
+            """
+        )
+        for produto_id in sorted(desde):
+            dia = desde[produto_id]
+            # id 0: o checkpoint usado e anterior a todo o dia
+            _reprocessar(db, produto_id, metodo, None if dia is None else (unidades.data_iso(dia), 0))
+        return len(desde)
+    finally:
+        db.fechar()
+
+
+def sincronizar_se_preciso(conn, placeholder: str = "?", metodo: str | None = None) -> int:
+    """sincronizar() so quando a marca d'agua barata diverge: quantidade e
+    maior id das transacoes contra os do livro, ou produto com outro metodo.
+
+    Para a inicializacao (cada boot, cada loja): custa duas agregacoes
+    simples em vez das duas varreduras por produto e dia. Alteracoes feitas
+    por fora que nao mudam quantidade nem maior id so sao vistas pelo
+    sincronizar() completo (importacao, arquivamento).
+    """
+    metodo = metodo or metodo_padrao()
+    db = _Db(conn, placeholder)
+    try:
+        transacoes = tuple(db.um("SELECT COUNT(*), MAX(id) FROM transacoes"))
+        livro = tuple(db.um("SELECT COUNT(*), MAX(transacaoId) FROM custo_movimentos"))
+        outro_metodo = db.um("SELECT COUNT(*) FROM custo_estado WHERE metodo <> ?", (metodo,))[0]
+    finally:
+        db.fechar()
+    if transacoes == livro and not outro_metodo:
+        return 0
+    return sincronizar(conn, placeholder, metodo)
+
+
+def reconstruir(conn, placeholder: str = "?", metodo: str | None = None) -> int:
+    """Refaz o livro de todos os produtos do zero (ou do saldo de abertura),
+    descartando checkpoints. Usado depois de converter o formato das
+    transacoes. Devolve quantos produtos foram refeitos.
+    """
+    metodo = metodo or metodo_padrao()
+    db = _Db(conn, placeholder)
+    try:
+        produtos = {r[0] for r in db.todos("SELECT DISTINCT produtoId FROM transacoes")}
+        produtos |= {r[0] for r in db.todos("SELECT produtoId FROM custo_estado")}
+        db.executar("DELETE FROM custo_checkpoints")
+        for produto_id in sorted(produtos):
+            _reprocessar(db, produto_id, metodo)
+        return len(produtos)
+    finally:
+        db.fechar()
+
+
+def corte_arquivo(conn, placeholder: str = "?") -> Optional[str]:
+    """Data de corte do ultimo arquivamento (None se nunca arquivou)"""
+    db = _Db(conn, placeholder)
+    try:
+        row = db.um("SELECT MAX(dataCorte) FROM saldos_abertura")
+    finally:
+        db.fechar()
+    return _texto_data(row[0]) if row and row[0] is not None else None
+
+
+def estoque_atual(conn, placeholder: str = "?") -> Dict[int, float]:
+    """Estoque em kg de cada produto pelo estado salvo (sem reler transacoes)"""
+    db = _Db(conn, placeholder)
+    try:
+        linhas = db.todos("SELECT produtoId, estado FROM custo_estado")
+    finally:
+        db.fechar()
+    return {int(r[0]): _estoque(json.loads(r[1]))[0] for r in linhas}
+
+
+def estoque_em(conn, data, placeholder: str = "?") -> Dict[int, float]:
+    """Estoque em kg de cada produto no fim do dia 'data', pelo ultimo
+    movimento do livro ate ele (ou pelo saldo de abertura do arquivo)"""
+    data = _texto_data(data)
+    corte = corte_arquivo(conn, placeholder)
+    arquivado = corte is not None and data < corte
+    fonte = _MOVIMENTOS_COMPLETOS if arquivado else "custo_movimentos"
+    db = _Db(conn, placeholder)
+    try:
+        estoque: Dict[int, float] = {}
+        if corte is not None and not arquivado:
+            for produto_id, estado in db.todos("SELECT produtoId, estado FROM saldos_abertura"):
+                estoque[int(produto_id)] = _estoque(json.loads(estado))[0]
+        linhas = db.todos(
+            f"""
+            SELECT m.produtoId, m.estoqueKg FROM {fonte} m
+            JOIN (
+                SELECT produtoId, MAX(seq) AS seq FROM {fonte} x
+                WHERE data <= ? GROUP BY produtoId
+            ) u ON u.produtoId = m.produtoId AND u.seq = m.seq
+            """,
+            (data,),
+        )
+    finally:
+        db.fechar()
+    estoque.update((int(r[0]), float(r[1])) for r in linhas)
+    return estoque
+
+
+def fechar_periodo(conn, corte, placeholder: str = "?", metodo: str | None = None) -> int:
+    """Fecha o livro antes de 'corte': grava o saldo de abertura de cada
+    produto e move os movimentos anteriores para custo_movimentos_arquivo.
+
+    Chamado pelo arquivamento antes de mover as transacoes (mesma conexao,
+    sem commit). Devolve quantos produtos tiveram movimentos arquivados.
+    """
+    corte = _texto_data(corte)
+    sincronizar(conn, placeholder, metodo)
+    db = _Db(conn, placeholder)
+    try:
+        produtos = [r[0] for r in db.todos(
+            "SELECT DISTINCT produtoId FROM custo_movimentos WHERE data < ?", (corte,)
+        )]
+        for produto_id in produtos:
+            atual = _ler_estado(db, produto_id)
+            metodo_produto = atual[0] if atual else (metodo or metodo_padrao())
+            anterior = db.um(
+                """
+                SELECT pesoComprado, pesoVendido, valorComprado, receita, custoVendido
+                FROM saldos_abertura WHERE produtoId = ?
+                """,
+                (produto_id,),
+            ) or (0.0, 0.0, 0.0, 0.0, 0.0)
+
+            # Estado no corte: ultimo checkpoint antes dele + movimentos seguintes
+            checkpoint = db.um(
+                """
+                SELECT seq, ultimaData, ultimoId, estado FROM custo_checkpoints
+                WHERE produtoId = ? AND ultimaData < ? ORDER BY seq DESC LIMIT 1
+                """,
+                (produto_id, corte),
+            )
+            if checkpoint is not None:
+                seq, chave, estado = checkpoint[0], (_texto_data(checkpoint[1]), checkpoint[2]), json.loads(checkpoint[3])
+            else:
+                seq, chave, estado = _ler_saldo(db, produto_id) or (0, None, estado_vazio())
+            for m_seq, data, transacao_id, tipo, peso_kg, receita, compra in db.todos(
+                """
+                SELECT seq, data, transacaoId, tipo, pesoKg, receita, compra FROM custo_movimentos
+                WHERE produtoId = ? AND seq > ? AND data < ? ORDER BY seq
+                """,
+                (produto_id, seq, corte),
+            ):
+                aplicar(estado, metodo_produto, tipo, peso_kg, receita if tipo == "venda" else compra)
+                seq, chave = m_seq, (_texto_data(data), transacao_id)
+
+            somas = db.um(
+                """
+                SELECT SUM(CASE WHEN tipo = 'compra' THEN pesoKg ELSE 0 END),
+                       SUM(CASE WHEN tipo = 'venda' THEN pesoKg ELSE 0 END),
+                       SUM(compra), SUM(receita), SUM(custo)
+                FROM custo_movimentos WHERE produtoId = ? AND data < ?
+                """,
+                (produto_id, corte),
+            )
+            totais = [(a or 0.0) + (b or 0.0) for a, b in zip(anterior, somas)]
+            peso, valor = _estoque(estado)
+            db.executar("DELETE FROM saldos_abertura WHERE produtoId = ?", (produto_id,))
+            db.executar(
+                """
+                INSERT INTO saldos_abertura
+                    (produtoId, dataCorte, metodo, seq, ultimaData, ultimoId, estado, pesoKg, valor,
+                     pesoComprado, pesoVendido, valorComprado, receita, custoVendido)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (produto_id, corte, metodo_produto, seq, chave[0] if chave else None,
+                 chave[1] if chave else None, json.dumps(estado, separators=(",", ":")),
+                 peso, valor, *totais),
+            )
+
+        colunas = "transacaoId, produtoId, seq, data, tipo, pesoKg, receita, custo, compra, estoqueKg, valorEstoque"
+        db.executar(
+            f"INSERT INTO custo_movimentos_arquivo ({colunas}) SELECT {colunas} FROM custo_movimentos WHERE data < ?",
+            (corte,),
+        )
+        db.executar("DELETE FROM custo_movimentos WHERE data < ?", (corte,))
+        db.executar("DELETE FROM custo_checkpoints WHERE ultimaData < ?", (corte,))
+        db.executar("UPDATE saldos_abertura SET dataCorte = ?", (corte,))
+        return len(produtos)
+    finally:
+        db.fechar()
+
+
+_MOVIMENTOS_COMPLETOS = """(
+    SELECT produtoId, seq, data, tipo, pesoKg, receita, custo, compra, estoqueKg, valorEstoque
+    FROM custo_movimentos
+    UNION ALL
+    SELECT produtoId, seq, data, tipo, pesoKg, receita, custo, compra, estoqueKg, valorEstoque
+    FROM custo_movimentos_arquivo
+)"""
+
+
+def resumo(conn, inicio=None, fim=None, placeholder: str = "?") -> Dict[str, Any]:
+    """Margem bruta (receita - custo das vendas) no periodo e estoque valorizado no fim dele"""
+    db = _Db(conn, placeholder)
+    try:
+        corte = db.um("SELECT MAX(dataCorte) FROM saldos_abertura")[0]
+        corte = _texto_data(corte) if corte is not None else None
+        # O arquivo so e lido quando o periodo comeca ou termina antes do corte;
+        # "desde sempre" usa os totais acumulados do saldo de abertura
+        usar_arquivo = corte is not None and any(
+            d is not None and _texto_data(d) < corte for d in (inicio or None, fim or None)
+        )
+        fonte = _MOVIMENTOS_COMPLETOS if usar_arquivo else "custo_movimentos"
+        saldos = [] if corte is None or usar_arquivo else db.todos(
+            """
+            SELECT produtoId, pesoKg, valor, pesoComprado, pesoVendido, valorComprado, receita, custoVendido
+            FROM saldos_abertura
+            """
+        )
+
+        filtros = []
+        params: List[Any] = []
+        if inicio:
+            filtros.append("data >= ?")
+            params.append(_texto_data(inicio))
+        if fim:
+            filtros.append("data <= ?")
+            params.append(_texto_data(fim))
+        where = ("WHERE " + " AND ".join(filtros)) if filtros else ""
+        periodo = db.todos(
+            f"""
+            SELECT produtoId,
+                   SUM(CASE WHEN tipo = 'compra' THEN pesoKg ELSE 0 END),
+                   SUM(CASE WHEN tipo = 'venda' THEN pesoKg ELSE 0 END),
+                   SUM(compra), SUM(receita), SUM(custo)
+            FROM {fonte} m {where}
+            GROUP BY produtoId
+            """,
+            params,
+        )
+
+        where_fim = "WHERE data <= ?" if fim else ""
+        estoque = db.todos(
+            f"""
+            SELECT m.produtoId, m.estoqueKg, m.valorEstoque
+            FROM {fonte} m
+            JOIN (SELECT produtoId, MAX(seq) AS seq FROM {fonte} x {where_fim} GROUP BY produtoId) u
+              ON u.produtoId = m.produtoId AND u.seq = m.seq
+            """,
+            [_texto_data(fim)] if fim else [],
+        )
+        metodos = dict(db.todos("SELECT produtoId, metodo FROM custo_estado"))
+    finally:
+        db.fechar()
+
+    por_produto: Dict[int, Dict[str, Any]] = {}
+
+    def item(produto_id):
+        return por_produto.setdefault(produto_id, {
+            "produtoId": produto_id, "pesoComprado": 0.0, "pesoVendido": 0.0,
+            "valorComprado": 0.0, "receita": 0.0, "custoVendido": 0.0,
+            "margem": 0.0, "margemPct": None, "estoqueKg": 0.0, "valorEstoque": 0.0,
+            "metodo": metodos.get(produto_id, metodo_padrao()),
+        })
+
+    for produto_id, peso_kg, valor, *acumulado in saldos:
+        r = item(produto_id)
+        # Estoque de abertura vale ate o primeiro movimento depois do corte
+        r["estoqueKg"] = peso_kg
+        r["valorEstoque"] = valor
+        if not inicio:
+            for chave, total in zip(("pesoComprado", "pesoVendido", "valorComprado", "receita", "custoVendido"), acumulado):
+                r[chave] = total or 0.0
+    for produto_id, peso_c, peso_v, compra, receita, custo in periodo:
+        r = item(produto_id)
+        r["pesoComprado"] += peso_c or 0.0
+        r["pesoVendido"] += peso_v or 0.0
+        r["valorComprado"] += compra or 0.0
+        r["receita"] += receita or 0.0
+        r["custoVendido"] += custo or 0.0
+    for r in por_produto.values():
+        r["margem"] = r["receita"] - r["custoVendido"]
+        r["margemPct"] = r["margem"] / r["receita"] if r["receita"] else None
+    for produto_id, estoque_kg, valor_estoque in estoque:
+        r = item(produto_id)
+        r["estoqueKg"] = estoque_kg
+        r["valorEstoque"] = valor_estoque
+
+    linhas = sorted(por_produto.values(), key=lambda r: r["produtoId"])
+    totais = {
+        chave: sum(r[chave] for r in linhas)
+        for chave in ("pesoComprado", "pesoVendido", "valorComprado", "receita",
+                      "custoVendido", "margem", "estoqueKg", "valorEstoque")
+    }
+    totais["margemPct"] = totais["margem"] / totais["receita"] if totais["receita"] else None
+    return {"porProduto": linhas, "totais": totais}
@@ -1,14 +1,16 @@
-import sqlite3
 from datetime import datetime, timedelta
 import random
 
+import arquivamento
+import custos
+import db_trace
+import unidades
+
 DB_PATH = 'pescados.db'
 
 def get_connection():
-    """Retorna uma conexao com o banco de dados"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Retorna uma conexao (instrumentada) com o banco de dados"""
+    return db_trace.connect_sqlite(DB_PATH)
 
 def init_db():
     """Inicializa o banco de dados com as tabelas necessarias"""
@@ -25,19 +27,16 @@ def init_db():
         )
     ''')
 
-    # Criar tabela de transacoes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transacoes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            produtoId INTEGER NOT NULL,
-            tipo TEXT NOT NULL CHECK(tipo IN ('compra', 'venda')),
-            pesoKg REAL NOT NULL,
-            precoKg REAL NOT NULL,
-            valorTotal REAL NOT NULL,
-            data TEXT NOT NULL,
-            FOREIGN KEY (produtoId) REFERENCES produtos(id)
-        )
-    ''')
+    # Criar tabela de transacoes (ponto fixo; converte bancos antigos)
+    convertido = unidades.criar_tabelas(conn)
+
+    # Livro de custo (FIFO / custo medio); refeito do zero depois da conversao
+    custos.criar_tabelas(conn)
+    arquivamento.criar_tabelas(conn)
+    if convertido:
+        custos.reconstruir(conn)
+    else:
+        custos.sincronizar_se_preciso(conn)
 
     conn.commit()
     conn.close()
@@ -98,12 +97,13 @@ def popular_dados_ficticios():
 
             valor_total = round(peso * preco, 2)
 
-            transacoes.append((produto_id, tipo, peso, preco, valor_total, data))
+            transacoes.append(unidades.para_banco(produto_id, tipo, peso, preco, valor_total, data))
 
     cursor.executemany('''
-        INSERT INTO transacoes (produtoId, tipo, pesoKg, precoKg, valorTotal, data)
+        INSERT INTO transacoes (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia)
         VALUES (?, ?, ?, ?, ?, ?)
     ''', transacoes)
+    custos.sincronizar(conn)
 
     conn.commit()
     conn.close()
@@ -122,8 +122,8 @@ def get_transacoes():
     """Retorna todas as transacoes ordenadas por data (mais recente primeiro)"""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM transacoes ORDER BY data DESC, id DESC')
-    transacoes = [dict(row) for row in cursor.fetchall()]
+    cursor.execute(f'SELECT {unidades.COLUNAS} FROM transacoes ORDER BY dia DESC, id DESC')
+    transacoes = [unidades.para_api(row) for row in cursor.fetchall()]
     conn.close()
     return transacoes
 
@@ -162,13 +162,16 @@ def excluir_produto(id):
 
 def adicionar_transacao(produto_id, tipo, peso_kg, preco_kg, valor_total, data):
     """Adiciona uma nova transacao"""
+    linha = unidades.para_banco(produto_id, tipo, peso_kg, preco_kg, valor_total, data)
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO transacoes (produtoId, tipo, pesoKg, precoKg, valorTotal, data)
+        INSERT INTO transacoes (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia)
         VALUES (?, ?, ?, ?, ?, ?)
-    ''', (produto_id, tipo, peso_kg, preco_kg, valor_total, data))
+    ''', linha)
     transacao_id = cursor.lastrowid
+    custos.registrar(conn, transacao_id, produto_id, tipo, unidades.kg(linha[2]),
+                     unidades.reais(linha[4]), unidades.data_iso(linha[5]))
     conn.commit()
     conn.close()
     return transacao_id
@@ -178,6 +181,7 @@ def excluir_transacao(id):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM transacoes WHERE id = ?', (id,))
+    custos.remover(conn, id)
     conn.commit()
     conn.close()
 
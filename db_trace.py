@@ -0,0 +1,208 @@
+"""
+Pescados do Alexandre - Rastreamento de consultas SQL
+Conexoes e cursores instrumentados que medem o tempo de cada comando
+executado pela camada de dados e avisam os ouvintes registrados
+(metricas, log de consultas lentas, etc).
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Callable, List, Set
+
+_ouvintes: List[Callable[["QueryEvent"], None]] = []
+_local = threading.local()
+_falharam: Set[Callable] = set()   # ouvintes cuja falha ja foi registrada
+
+logger = logging.getLogger("pescados.db_trace")
+
+
+@dataclass
+class QueryEvent:
+    conn: Any
+    backend: str  # "sqlite" ou "postgres"
+    sql: str
+    params: Any
+    seconds: float
+    rows: int
+    many: bool = False
+
+
+def add_listener(fn: Callable[[QueryEvent], None]) -> None:
+    """Registra uma funcao chamada ao fim de cada comando SQL"""
+    if fn not in _ouvintes:
+        _ouvintes.append(fn)
+
+
+def remove_listener(fn: Callable[[QueryEvent], None]) -> None:
+    if fn in _ouvintes:
+        _ouvintes.remove(fn)
+
+
+def _notificar(evento: QueryEvent) -> None:
+    # Evita recursao quando um ouvinte executa SQL (ex: EXPLAIN)
+    if not _ouvintes or getattr(_local, "ativo", False):
+        return
+    _local.ativo = True
+    try:
+        for fn in list(_ouvintes):
+            try:
+                fn(evento)
+            except Exception:
+                # A consulta do app segue; o traceback vai para o log uma
+                # vez por ouvinte (ex.: metricas ou log lento quebrado)
+                if fn not in _falharam:
+                    _falharam.add(fn)
+                    logger.exception("ouvinte de SQL %r falhou", fn)
+    finally:
+        _local.ativo = False
+
+
+# ==================== SQLITE ====================
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor SQLite que mede execucao + leitura das linhas.
+
+    No SQLite o SELECT so e realmente executado durante o fetch, entao o
+    evento de um SELECT e emitido quando o resultado termina de ser lido
+    (ou quando o cursor/conexao e fechado).
+    """
+
+    _pendente = None
+
+    def execute(self, sql, params=()):
+        self._finalizar()
+        inicio = time.perf_counter()
+        super().execute(sql, params)
+        self._registrar(sql, params, time.perf_counter() - inicio, False)
+        return self
+
+    def executemany(self, sql, seq_params):
+        self._finalizar()
+        seq_params = list(seq_params)
+        inicio = time.perf_counter()
+        super().executemany(sql, seq_params)
+        self._registrar(sql, seq_params, time.perf_counter() - inicio, True)
+        return self
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        row = super().fetchone()
+        self._acumular(time.perf_counter() - inicio, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        self._acumular(time.perf_counter() - inicio, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        rows = super().fetchall()
+        self._acumular(time.perf_counter() - inicio, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finalizar()
+        super().close()
+
+    def _registrar(self, sql, params, segundos, many):
+        if self.description is None:
+            _notificar(QueryEvent(self.connection, "sqlite", sql, params,
+                                  segundos, max(self.rowcount, 0), many))
+        else:
+            self._pendente = [sql, params, segundos, 0, many]
+
+    def _acumular(self, segundos, linhas, fim):
+        pendente = self._pendente
+        if pendente is None:
+            return
+        pendente[2] += segundos
+        pendente[3] += linhas
+        if fim:
+            self._finalizar()
+
+    def _finalizar(self):
+        pendente = self._pendente
+        if pendente is None:
+            return
+        self._pendente = None
+        sql, params, segundos, linhas, many = pendente
+        _notificar(QueryEvent(self.connection, "sqlite", sql, params, segundos, linhas, many))
+
+
+class TracedConnection(sqlite3.Connection):
+    """Conexao SQLite cujos cursores sao instrumentados"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursores = weakref.WeakSet()
+
+    def cursor(self, factory=TracedCursor):
+        cur = super().cursor(factory)
+        if isinstance(cur, TracedCursor):
+            self._cursores.add(cur)
+        return cur
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self.cursor().executemany(sql, seq_params)
+
+    def close(self):
+        for cur in list(self._cursores):
+            cur._finalizar()
+        super().close()
+
+
+def connect_sqlite(path: str, **kwargs) -> sqlite3.Connection:
+    """Abre uma conexao SQLite instrumentada (row_factory = sqlite3.Row)"""
+    conn = sqlite3.connect(path, factory=TracedConnection, **kwargs)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# ==================== POSTGRES ====================
+
+_pg_cursor_cls = None
+
+
+def pg_cursor_factory():
+    """Retorna a classe de cursor psycopg2 instrumentada (import sob demanda)"""
+    global _pg_cursor_cls
+    if _pg_cursor_cls is not None:
+        return _pg_cursor_cls
+
+    import psycopg2.extensions
+
+    class TracedPgCursor(psycopg2.extensions.cursor):
+        # psycopg2 traz o resultado inteiro no execute, entao o tempo do
+        # execute ja inclui a leitura das linhas
+        def execute(self, sql, params=None):
+            inicio = time.perf_counter()
+            try:
+                return super().execute(sql, params)
+            finally:
+                _notificar(QueryEvent(self.connection, "postgres", sql, params,
+                                      time.perf_counter() - inicio,
+                                      max(self.rowcount, 0)))
+
+        def executemany(self, sql, seq_params):
+            seq_params = list(seq_params)
+            inicio = time.perf_counter()
+            try:
+                return super().executemany(sql, seq_params)
+            finally:
+                _notificar(QueryEvent(self.connection, "postgres", sql, seq_params,
+                                      time.perf_counter() - inicio,
+                                      max(self.rowcount, 0), True))
+
+    _pg_cursor_cls = TracedPgCursor
+    return _pg_cursor_cls
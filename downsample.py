@@ -0,0 +1,153 @@
+"""
+Pescados do Alexandre - Reducao de series temporais
+Reduz series diarias a um numero de pontos que a tela consegue mostrar
+antes de enviar para os graficos:
+  - LTTB (Largest-Triangle-Three-Buckets): mantem o formato de linhas
+  - min/max por faixa: mantem picos e vales de areas e barras
+Ambos devolvem os indices dos pontos escolhidos, em ordem.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, List, Sequence
+
+import arquivamento
+import unidades
+
+PONTOS_PADRAO = 400
+PONTOS_MAXIMO = 5000
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], alvo: int) -> List[int]:
+    """Indices escolhidos pelo Largest-Triangle-Three-Buckets"""
+    n = len(xs)
+    if alvo >= n:
+        return list(range(n))
+    if alvo < 3:
+        return [0, n - 1][:max(alvo, 0)]
+
+    escolhidos = [0]
+    largura = (n - 2) / (alvo - 2)
+    a = 0
+    for i in range(alvo - 2):
+        # Media da proxima faixa (terceiro vertice do triangulo)
+        inicio_prox = int((i + 1) * largura) + 1
+        fim_prox = min(int((i + 2) * largura) + 1, n)
+        qtd = fim_prox - inicio_prox
+        media_x = sum(xs[inicio_prox:fim_prox]) / qtd
+        media_y = sum(ys[inicio_prox:fim_prox]) / qtd
+
+        # Ponto da faixa atual que forma o maior triangulo
+        inicio = int(i * largura) + 1
+        fim = int((i + 1) * largura) + 1
+        ax, ay = xs[a], ys[a]
+        melhor, maior_area = inicio, -1.0
+        for j in range(inicio, fim):
+            area = abs((ax - media_x) * (ys[j] - ay) - (ax - xs[j]) * (media_y - ay))
+            if area > maior_area:
+                melhor, maior_area = j, area
+        escolhidos.append(melhor)
+        a = melhor
+    escolhidos.append(n - 1)
+    return escolhidos
+
+
+def minmax(ys: Sequence[float], alvo: int) -> List[int]:
+    """Indices do menor e do maior valor de cada faixa (alvo/2 faixas)"""
+    n = len(ys)
+    if alvo >= n:
+        return list(range(n))
+    faixas = max(1, alvo // 2)
+    largura = n / faixas
+    escolhidos: List[int] = []
+    for f in range(faixas):
+        inicio = int(f * largura)
+        fim = min(int((f + 1) * largura), n)
+        if inicio >= fim:
+            continue
+        i_min = i_max = inicio
+        for j in range(inicio + 1, fim):
+            if ys[j] < ys[i_min]:
+                i_min = j
+            if ys[j] > ys[i_max]:
+                i_max = j
+        escolhidos.extend(sorted({i_min, i_max}))
+    return escolhidos
+
+
+def limitar_pontos(pontos) -> int:
+    """Resolucao pedida entre 3 e PONTOS_MAXIMO; ValueError se nao for inteiro positivo"""
+    if pontos is None or pontos == "":
+        return PONTOS_PADRAO
+    pontos = int(pontos)
+    if pontos <= 0:
+        raise ValueError("pontos deve ser um inteiro positivo")
+    return max(3, min(pontos, PONTOS_MAXIMO))
+
+
+def _texto_data(valor) -> str:
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+def serie_diaria(conn, inicio=None, fim=None, placeholder: str = "?") -> List[tuple]:
+    """(data, vendas, compras) por dia com movimento, em ordem de data"""
+    filtros = []
+    params: List[Any] = []
+    if inicio:
+        filtros.append(f"dia >= {placeholder}")
+        params.append(unidades.dia(inicio))
+    if fim:
+        filtros.append(f"dia <= {placeholder}")
+        params.append(unidades.dia(fim))
+    where = ("WHERE " + " AND ".join(filtros)) if filtros else ""
+    fonte = arquivamento.fonte_transacoes(conn, inicio, placeholder)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT dia,
+                   SUM(CASE WHEN tipo = 'venda' THEN valorCentavos ELSE 0 END),
+                   SUM(CASE WHEN tipo = 'compra' THEN valorCentavos ELSE 0 END)
+            FROM {fonte} t {where}
+            GROUP BY dia
+            ORDER BY dia
+            """,
+            params,
+        )
+        # Somas em centavos (exatas), convertidas so no fim
+        return [
+            (unidades.data_iso(r[0]), unidades.reais(r[1] or 0), unidades.reais(r[2] or 0))
+            for r in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+
+
+def lucro_acumulado(conn, inicio=None, fim=None, de=None, ate=None,
+                    pontos: int = PONTOS_PADRAO, placeholder: str = "?") -> Dict[str, Any]:
+    """Lucro acumulado desde 'inicio', reduzido por LTTB na janela [de, ate].
+
+    A janela permite ampliar um trecho do grafico mantendo os valores
+    acumulados desde o inicio do periodo.
+    """
+    de = _texto_data(de) if de else (_texto_data(inicio) if inicio else None)
+    ate = _texto_data(ate) if ate else (_texto_data(fim) if fim else None)
+    dias = serie_diaria(conn, inicio, ate, placeholder)
+
+    datas: List[str] = []
+    valores: List[float] = []
+    acumulado = 0.0
+    for data, vendas, compras in dias:
+        acumulado += vendas - compras
+        if de is None or data >= de:
+            datas.append(data)
+            valores.append(acumulado)
+
+    xs = [date.fromisoformat(d[:10]).toordinal() for d in datas]
+    indices = lttb(xs, valores, pontos)
+    return {
+        "pontos": [{"data": datas[i], "lucro": valores[i]} for i in indices],
+        "total": len(datas),
+        "reduzido": len(indices) < len(datas),
+    }
@@ -0,0 +1,244 @@
+"""
+Pescados do Alexandre - Gravacao em grupo (group commit)
+Uma unica thread grava as transacoes no SQLite. As requisicoes entram numa
+fila e esperam; a thread junta o que chegou dentro de uma janela curta
+(alguns milissegundos) e confirma tudo com um so COMMIT - um fsync para o
+lote inteiro em vez de um por venda, e sem celulares disputando o lock de
+escrita do banco.
+
+Cada operacao roda dentro de um SAVEPOINT: se uma falhar, so ela e
+desfeita e a requisicao dela recebe o erro; as demais do lote seguem.
+A requisicao so recebe o id depois do COMMIT, entao o evento SSE publicado
+em seguida sempre se refere a dados ja gravados. Operacoes de lojas
+diferentes vao para o banco de cada loja (um COMMIT por loja no lote).
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, TimeoutError as FuturoTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+import lojas
+import metrics
+
+JANELA = 0.005       # segundos que o lote espera por mais operacoes
+MAX_LOTE = 128       # operacoes por COMMIT
+ESPERA_MAXIMA = 30.0  # segundos que uma requisicao aguarda a gravacao
+
+LOTE = metrics.Histogram(
+    "pescados_write_batch_size",
+    "Operacoes confirmadas por COMMIT",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+ESPERA = metrics.Histogram(
+    "pescados_write_wait_seconds",
+    "Tempo entre enfileirar a gravacao e o COMMIT",
+)
+COMMITS = metrics.Counter(
+    "pescados_write_commits_total",
+    "COMMITs feitos pela thread de gravacao por resultado",
+    ("resultado",),
+)
+CANCELADAS = metrics.Counter(
+    "pescados_write_cancelled_total",
+    "Operacoes retiradas da fila por esperarem demais (nao gravadas)",
+)
+FILA = metrics.Gauge(
+    "pescados_write_queue_depth",
+    "Operacoes aguardando a thread de gravacao",
+)
+
+_FIM = object()
+
+
+class EscritorParado(RuntimeError):
+    pass
+
+
+class EscritaNaoFeita(RuntimeError):
+    """A operacao esperou demais na fila e foi retirada: nada foi gravado"""
+
+
+class _Operacao:
+    __slots__ = ("loja", "funcao", "args", "futuro", "criada")
+
+    def __init__(self, loja: str, funcao: Callable, args: tuple):
+        self.loja = loja
+        self.funcao = funcao
+        self.args = args
+        self.futuro: Future = Future()
+        self.criada = time.perf_counter()
+
+
+class Escritor:
+    """Thread unica de gravacao.
+
+    abrir(loja) devolve uma conexao SQLite nova; a thread guarda uma por
+    loja. funcao(conn, *args) executa os comandos sem COMMIT.
+    """
+
+    def __init__(self, abrir: Callable[[str], Any], janela: float = JANELA, max_lote: int = MAX_LOTE):
+        self.abrir = abrir
+        self.janela = janela
+        self.max_lote = max(1, max_lote)
+        self._fila: queue.Queue = queue.Queue()
+        self._conexoes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._parado = False
+
+    # ---------- lado das requisicoes ----------
+
+    def enviar(self, funcao: Callable, *args, loja: str | None = None) -> Future:
+        """Enfileira funcao(conn, *args); o Future resolve depois do COMMIT"""
+        operacao = _Operacao(loja or lojas.atual(), funcao, args)
+        with self._lock:
+            if self._parado:
+                raise EscritorParado("gravacao encerrada")
+            if self._thread is None:
+                self._iniciar()
+            self._fila.put(operacao)
+        FILA.inc()
+        return operacao.futuro
+
+    def executar(self, funcao: Callable, *args, loja: str | None = None, timeout: float = ESPERA_MAXIMA):
+        """Como enviar(), mas espera o COMMIT e devolve o resultado.
+
+        Se a operacao nao comecar em 'timeout' segundos ela e cancelada e
+        sai EscritaNaoFeita (seguro repetir). Se ja estiver no lote, espera
+        o COMMIT: nunca devolve erro para uma gravacao que vai acontecer.
+        """
+        futuro = self.enviar(funcao, *args, loja=loja)
+        try:
+            return futuro.result(timeout)
+        except FuturoTimeout:
+            if futuro.cancel():
+                CANCELADAS.inc()
+                raise EscritaNaoFeita(f"gravacao nao iniciada em {timeout:g} s; nada foi gravado") from None
+            return futuro.result()
+        except CancelledError:
+            raise EscritaNaoFeita("gravacao cancelada; nada foi gravado") from None
+
+    def _iniciar(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="pescados-escrita", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout: float = 10.0) -> None:
+        """Grava o que ja esta na fila e encerra a thread"""
+        with self._lock:
+            if self._parado:
+                return
+            self._parado = True
+            thread = self._thread
+            self._fila.put(_FIM)
+        if thread is not None:
+            thread.join(timeout)
+
+    # ---------- thread de gravacao ----------
+
+    def _coletar(self, primeira) -> tuple:
+        """Junta operacoes ate a janela fechar ou o lote encher"""
+        lote = [primeira]
+        limite = time.perf_counter() + self.janela
+        while len(lote) < self.max_lote:
+            restante = limite - time.perf_counter()
+            try:
+                item = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is _FIM:
+                return lote, True
+            lote.append(item)
+        return lote, False
+
+    def _loop(self) -> None:
+        fim = False
+        try:
+            while not fim:
+                item = self._fila.get()
+                if item is _FIM:
+                    break
+                lote, fim = self._coletar(item)
+                FILA.dec(valor=len(lote))
+                por_loja: Dict[str, List[_Operacao]] = OrderedDict()
+                for operacao in lote:
+                    por_loja.setdefault(operacao.loja, []).append(operacao)
+                for loja, operacoes in por_loja.items():
+                    try:
+                        self._gravar(loja, operacoes)
+                    except Exception as e:
+                        # Conexao em estado desconhecido: a proxima e aberta de novo
+                        self._descartar(loja)
+                        COMMITS.inc("erro")
+                        for op in operacoes:
+                            if not op.futuro.done():
+                                op.futuro.set_exception(e)
+        finally:
+            for conn in self._conexoes.values():
+                conn.close()
+            self._conexoes.clear()
+
+    def _conexao(self, loja: str):
+        conn = self._conexoes.get(loja)
+        if conn is None:
+            conn = self._conexoes[loja] = self.abrir(loja)
+        return conn
+
+    def _gravar(self, loja: str, operacoes: List[_Operacao]) -> None:
+        pendentes = [op for op in operacoes if op.futuro.set_running_or_notify_cancel()]
+        if not pendentes:
+            return
+        try:
+            conn = self._conexao(loja)
+            # IMMEDIATE pega o lock de escrita ja no inicio do lote
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            self._descartar(loja)
+            COMMITS.inc("erro")
+            for op in pendentes:
+                op.futuro.set_exception(e)
+            return
+
+        resultados = []
+        for op in pendentes:
+            conn.execute("SAVEPOINT operacao")
+            try:
+                valor = op.funcao(conn, *op.args)
+            except Exception as e:
+                conn.execute("ROLLBACK TO operacao")
+                conn.execute("RELEASE operacao")
+                op.futuro.set_exception(e)
+            else:
+                conn.execute("RELEASE operacao")
+                resultados.append((op, valor))
+
+        try:
+            conn.commit()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                self._descartar(loja)
+            COMMITS.inc("erro")
+            for op, _ in resultados:
+                op.futuro.set_exception(e)
+            return
+
+        COMMITS.inc("ok")
+        LOTE.observe(valor=len(pendentes))
+        agora = time.perf_counter()
+        for op, valor in resultados:
+            ESPERA.observe(valor=agora - op.criada)
+            op.futuro.set_result(valor)
+
+    def _descartar(self, loja: str) -> None:
+        conn = self._conexoes.pop(loja, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,225 @@
+"""
+Pescados do Alexandre - Eventos em tempo real
+Canal Server-Sent Events (/api/events): cada gravacao confirmada no banco e
+publicada aqui e repassada na hora para os navegadores conectados, sem
+polling. Os ultimos eventos ficam guardados para quem reconectar com
+Last-Event-ID; quem ficou para tras demais recebe um "reset" e recarrega.
+Cada loja tem o seu canal: um celular so recebe as mudancas da propria loja.
+
+Cada conexao aberta ocupa uma thread do servidor enquanto durar. Acima de
+LIMITE_ASSINANTES conexoes (somando todas as lojas) a rota responde 503
+com Retry-After, para sobrar thread para o resto da API.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import queue
+import secrets
+import threading
+from collections import deque
+
+import lojas
+import metrics
+
+HISTORICO = 500          # eventos guardados para reconexao
+TAMANHO_FILA = 200       # eventos pendentes por assinante antes de descartar
+INTERVALO_PING = 15.0    # segundos entre comentarios de keep-alive
+RETRY_MS = 3000          # intervalo de reconexao sugerido ao navegador
+LIMITE_ASSINANTES = 24   # conexoes abertas no processo (app.py ajusta pelas threads)
+ESPERA_LOTADO = 30       # Retry-After (s) quando o limite foi atingido
+
+ASSINANTES = metrics.Gauge(
+    "pescados_sse_subscribers",
+    "Conexoes abertas em /api/events",
+)
+EVENTOS = metrics.Counter(
+    "pescados_sse_events_total",
+    "Eventos publicados no canal SSE",
+    ("tabela", "acao"),
+)
+RECUSADOS = metrics.Counter(
+    "pescados_sse_rejected_total",
+    "Conexoes em /api/events recusadas com 503 (limite de assinantes)",
+)
+
+_FIM = object()
+
+
+def formatar(evento_id, nome: str, dados) -> str:
+    """Serializa um evento no formato text/event-stream"""
+    linhas = []
+    if evento_id is not None:
+        linhas.append(f"id: {evento_id}")
+    linhas.append(f"event: {nome}")
+    linhas.append("data: " + json.dumps(dados, separators=(",", ":"), ensure_ascii=False))
+    return "\n".join(linhas) + "\n\n"
+
+
+class Assinatura:
+    def __init__(self):
+        self.fila = queue.Queue(TAMANHO_FILA)
+        self.atrasada = False
+
+
+class Broker:
+    """Distribui eventos para as conexoes SSE abertas (um processo)"""
+
+    def __init__(self, historico: int = HISTORICO):
+        self._lock = threading.Lock()
+        # Ids "<epoca>.<n>", epoca aleatoria por canal: um Last-Event-ID de
+        # antes de reiniciar o servidor, ou de outra loja criada no mesmo
+        # segundo, nunca e confundido com um evento deste canal
+        self._epoca = secrets.token_hex(8)
+        self._ids = itertools.count(1)
+        self._historico = deque(maxlen=historico)
+        self._assinaturas = set()
+        self._fechado = False
+
+    def publicar(self, tabela: str, acao: str, registro_id, registro=None) -> int:
+        """Anuncia uma mudanca ja gravada (acao: inserir, atualizar ou excluir)"""
+        dados = {"tabela": tabela, "acao": acao, "id": registro_id}
+        if registro is not None:
+            dados["registro"] = registro
+        with self._lock:
+            evento_id = next(self._ids)
+            texto = formatar(f"{self._epoca}.{evento_id}", "mudanca", dados)
+            self._historico.append((evento_id, texto))
+            for assinatura in self._assinaturas:
+                if assinatura.atrasada:
+                    continue
+                try:
+                    assinatura.fila.put_nowait(texto)
+                except queue.Full:
+                    # Cliente lento: em vez de segurar memoria, manda recarregar
+                    assinatura.atrasada = True
+        EVENTOS.inc(tabela, acao)
+        return evento_id
+
+    def _perdidos(self, ultimo: str | None):
+        """Eventos depois de Last-Event-ID (None = historico nao cobre)"""
+        if not ultimo:
+            return []
+        epoca, _, numero = ultimo.partition(".")
+        if epoca != self._epoca or not numero.isdigit():
+            return None
+        ultimo_id = int(numero)
+        mais_antigo = self._historico[0][0] if self._historico else 1
+        if ultimo_id < mais_antigo - 1:
+            return None
+        return [texto for i, texto in self._historico if i > ultimo_id]
+
+    def _assinar(self, ultimo):
+        assinatura = Assinatura()
+        with self._lock:
+            perdidos = self._perdidos(ultimo)
+            self._assinaturas.add(assinatura)
+        _contar(1)
+        ASSINANTES.inc()
+        return assinatura, perdidos
+
+    def _cancelar(self, assinatura) -> None:
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+        _contar(-1)
+        ASSINANTES.dec()
+
+    def stream(self, ultimo: str | None = None):
+        """Gerador com o corpo da resposta text/event-stream"""
+        assinatura, perdidos = self._assinar(ultimo)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if perdidos is None:
+                yield formatar(None, "reset", {})
+            else:
+                yield from perdidos
+            while not self._fechado:
+                if assinatura.atrasada:
+                    yield formatar(None, "reset", {})
+                    return
+                try:
+                    texto = assinatura.fila.get(timeout=INTERVALO_PING)
+                except queue.Empty:
+                    # Comentario mantem proxies e a conexao do celular abertos
+                    yield ": ping\n\n"
+                    continue
+                if texto is _FIM:
+                    return
+                yield texto
+        finally:
+            self._cancelar(assinatura)
+
+    def fechar(self) -> None:
+        """Encerra todas as conexoes (usado no desligamento do servidor)"""
+        with self._lock:
+            self._fechado = True
+            for assinatura in self._assinaturas:
+                try:
+                    assinatura.fila.put_nowait(_FIM)
+                except queue.Full:
+                    assinatura.atrasada = True
+
+
+_BROKERS = {}
+_lock_brokers = threading.Lock()
+_abertas = 0   # conexoes de todas as lojas
+
+
+def _contar(delta: int) -> None:
+    global _abertas
+    with _lock_brokers:
+        _abertas += delta
+
+
+def lotado() -> bool:
+    """True se ja ha LIMITE_ASSINANTES conexoes abertas (limite aproximado:
+    duas conexoes simultaneas podem passar juntas)"""
+    return _abertas >= LIMITE_ASSINANTES
+
+
+def broker(loja: str | None = None) -> Broker:
+    """Canal da loja (padrao: loja da requisicao atual)"""
+    loja = loja or lojas.atual()
+    with _lock_brokers:
+        canal = _BROKERS.get(loja)
+        if canal is None:
+            canal = _BROKERS[loja] = Broker()
+        return canal
+
+
+BROKER = broker(lojas.PADRAO)
+
+
+def publicar(tabela: str, acao: str, registro_id, registro=None, loja: str | None = None) -> int:
+    return broker(loja).publicar(tabela, acao, registro_id, registro)
+
+
+def fechar() -> None:
+    """Encerra as conexoes de todas as lojas"""
+    with _lock_brokers:
+        canais = list(_BROKERS.values())
+    for canal in canais:
+        canal.fechar()
+
+
+# ==================== FLASK ====================
+
+def init_app(app) -> None:
+    """Registra a rota /api/events no app Flask"""
+    from flask import Response, jsonify, request
+
+    @app.route("/api/events")
+    def api_events():
+        if lotado():
+            RECUSADOS.inc()
+            resposta = jsonify({"erro": "muitas conexoes de eventos abertas; tente mais tarde"})
+            resposta.status_code = 503
+            resposta.headers["Retry-After"] = str(ESPERA_LOTADO)
+            return resposta
+        ultimo = request.headers.get("Last-Event-ID") or request.args.get("ultimoId")
+        return Response(
+            broker().stream(ultimo),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -0,0 +1,289 @@
+"""
+Pescados do Alexandre - Exportacao de transacoes
+Le as transacoes em blocos direto do cursor do banco e grava CSV ou
+Parquet (um row group por bloco) sem carregar tudo em memoria.
+Funciona com SQLite e com Postgres (cursor nomeado no servidor).
+
+Uso:
+  python exportacao.py --formato csv --saida transacoes.csv
+  python exportacao.py --formato parquet --inicio 2024-01-01 --fim 2024-12-31 \\
+      --produto 1 --produto 3 --saida 2024.parquet
+Com DATABASE_URL definido usa Postgres; senao usa o pescados.db local.
+Parquet requer pyarrow (pip install pyarrow).
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import os
+import sys
+from datetime import date, timedelta
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import arquivamento
+import unidades
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+TAMANHO_BLOCO = 10000
+
+COLUNAS = ["id", "data", "produtoId", "produto", "tipo", "pesoKg", "precoKg", "valorTotal"]
+
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def _texto_data(valor) -> str:
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+def consulta(inicio=None, fim=None, produtos: Sequence[int] = (), placeholder: str = "?",
+             fonte: str = "transacoes"):
+    """SQL e parametros da exportacao com os filtros informados"""
+    filtros = []
+    params: List = []
+    if inicio:
+        filtros.append(f"t.dia >= {placeholder}")
+        params.append(unidades.dia(inicio))
+    if fim:
+        filtros.append(f"t.dia <= {placeholder}")
+        params.append(unidades.dia(fim))
+    if produtos:
+        filtros.append("t.produtoId IN (" + ", ".join([placeholder] * len(produtos)) + ")")
+        params.extend(int(p) for p in produtos)
+    where = ("WHERE " + " AND ".join(filtros)) if filtros else ""
+    sql = f"""
+        SELECT t.id, t.dia, t.produtoId, p.nome, t.tipo, t.pesoG, t.precoCentavos, t.valorCentavos
+        FROM {fonte} t
+        LEFT JOIN produtos p ON p.id = t.produtoId
+        {where}
+        ORDER BY t.dia, t.id
+    """
+    return sql, params
+
+
+def iterar_blocos(conn, backend: str = "sqlite", inicio=None, fim=None,
+                  produtos: Sequence[int] = (), tamanho_bloco: int = TAMANHO_BLOCO) -> Iterator[List[tuple]]:
+    """Blocos de linhas (tuplas na ordem de COLUNAS) lidos do cursor"""
+    placeholder = "%s" if backend == "postgres" else "?"
+    # Periodos anteriores ao corte do arquivamento incluem transacoes_arquivo
+    fonte = arquivamento.fonte_transacoes(conn, inicio, placeholder)
+    sql, params = consulta(inicio, fim, produtos, placeholder, fonte)
+    if backend == "postgres":
+        # Cursor nomeado: o resultado fica no servidor e vem aos poucos
+        cursor = conn.cursor(name="pescados_exportacao")
+        cursor.itersize = tamanho_bloco
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            linhas = cursor.fetchmany(tamanho_bloco)
+            if not linhas:
+                break
+            # Ponto fixo do banco -> data, kg e reais do arquivo
+            yield [
+                (r[0], unidades.EPOCA + timedelta(days=r[1]), r[2], r[3], r[4],
+                 unidades.kg(r[5]), unidades.reais(r[6]), unidades.reais(r[7]))
+                for r in linhas
+            ]
+    finally:
+        cursor.close()
+
+
+# ==================== CSV ====================
+
+def gerar_csv(blocos: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Cabecalho e depois um pedaco de CSV por bloco"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n")
+    escritor.writerow(COLUNAS)
+    yield buffer.getvalue().encode("utf-8")
+    for bloco in blocos:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows((linha[0], _texto_data(linha[1]), *linha[2:]) for linha in bloco)
+        yield buffer.getvalue().encode("utf-8")
+
+
+# ==================== PARQUET ====================
+
+class _SaidaFluxo:
+    """Arquivo so de escrita que acumula os bytes ate serem consumidos"""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicao = 0
+        self.closed = False
+
+    def write(self, dados) -> int:
+        dados = bytes(dados)
+        self._partes.append(dados)
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self) -> int:
+        return self._posicao
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def consumir(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _esquema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("data", pa.date32()),
+        ("produtoId", pa.int64()),
+        ("produto", pa.string()),
+        ("tipo", pa.string()),
+        ("pesoKg", pa.float64()),
+        ("precoKg", pa.float64()),
+        ("valorTotal", pa.float64()),
+    ])
+
+
+def _tabela(bloco: List[tuple], esquema):
+    import pyarrow as pa
+
+    colunas = list(zip(*bloco))
+    datas = [d if isinstance(d, date) else date.fromisoformat(str(d)[:10]) for d in colunas[1]]
+    return pa.Table.from_arrays(
+        [pa.array(c, type=campo.type) for c, campo in zip(colunas[:1] + [datas] + colunas[2:], esquema)],
+        schema=esquema,
+    )
+
+
+def gerar_parquet(blocos: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Parquet em fluxo: cada bloco vira um row group e sai assim que e gravado"""
+    import pyarrow.parquet as pq
+
+    esquema = _esquema()
+    saida = _SaidaFluxo()
+    escritor = pq.ParquetWriter(saida, esquema, compression="snappy")
+    try:
+        for bloco in blocos:
+            escritor.write_table(_tabela(bloco, esquema))
+            dados = saida.consumir()
+            if dados:
+                yield dados
+    finally:
+        escritor.close()
+    yield saida.consumir()
+
+
+def gerar(formato: str, blocos: Iterable[List[tuple]]) -> Iterator[bytes]:
+    if formato == "parquet":
+        return gerar_parquet(blocos)
+    return gerar_csv(blocos)
+
+
+# ==================== FLASK ====================
+
+def resposta_flask(abrir_conexao, args):
+    """Response em streaming para /api/export/transacoes (SQLite)"""
+    from flask import Response, jsonify
+
+    formato = args.get("formato", "csv").lower()
+    if formato not in FORMATOS:
+        return jsonify({"erro": "formato deve ser csv ou parquet"}), 400
+    if formato == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({"erro": "exportacao parquet requer pyarrow no servidor"}), 501
+    try:
+        produtos = [int(p) for p in args.getlist("produto")]
+    except ValueError:
+        return jsonify({"erro": "produto deve ser um id numerico"}), 400
+    # Datas conferidas antes dos cabecalhos: depois do 200 nao ha como avisar
+    inicio, fim = args.get("inicio") or None, args.get("fim") or None
+    try:
+        for valor in (inicio, fim):
+            if valor is not None:
+                unidades.dia(valor)
+    except ValueError:
+        return jsonify({"erro": "inicio e fim devem ser AAAA-MM-DD"}), 400
+
+    def corpo():
+        # A conexao vive enquanto o arquivo e enviado
+        conn = abrir_conexao()
+        try:
+            yield from gerar(formato, iterar_blocos(conn, "sqlite", inicio, fim, produtos))
+        finally:
+            conn.close()
+
+    mimetype, extensao = FORMATOS[formato]
+    nome = f"transacoes_{inicio or 'inicio'}_{fim or 'hoje'}.{extensao}"
+    return Response(corpo(), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{nome}"'})
+
+
+# ==================== CLI ====================
+
+def _conectar(banco: Optional[str]):
+    database_url = os.getenv("DATABASE_URL")
+    if database_url and not banco:
+        import psycopg2
+
+        return psycopg2.connect(database_url), "postgres"
+    import sqlite3
+
+    return sqlite3.connect(banco or DB_PATH), "sqlite"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Exporta transacoes em CSV ou Parquet")
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    parser.add_argument("--inicio", help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--fim", help="data final (AAAA-MM-DD)")
+    parser.add_argument("--produto", type=int, action="append", default=[],
+                        help="id do produto (pode repetir)")
+    parser.add_argument("--saida", help="arquivo de saida (padrao: saida padrao)")
+    parser.add_argument("--banco", help="arquivo SQLite (ignora DATABASE_URL)")
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="linhas por bloco / row group")
+    args = parser.parse_args(argv)
+
+    conn, backend = _conectar(args.banco)
+    destino = open(args.saida, "wb") if args.saida else sys.stdout.buffer
+    total = 0
+    try:
+        def contar(blocos):
+            nonlocal total
+            for bloco in blocos:
+                total += len(bloco)
+                yield bloco
+
+        blocos = contar(iterar_blocos(conn, backend, args.inicio, args.fim, args.produto, args.bloco))
+        for pedaco in gerar(args.formato, blocos):
+            destino.write(pedaco)
+    finally:
+        if args.saida:
+            destino.close()
+        conn.close()
+    print(f"{total} transacao(oes) exportada(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
+// @build:inicio - bloco reescrito por build_frontend.py com os nomes versionados
 const CACHE_NAME = 'pescados-v1';
-const OFFLINE_URL = '/offline.html';
 
 // Arquivos para cachear (shell do app)
 const SHELL_CACHE = [
@@ -14,13 +14,123 @@ const SHELL_CACHE = [
   'https://cdn.jsdelivr.net/npm/recharts@2.10.3/umd/Recharts.min.js',
   'https://cdn.tailwindcss.com'
 ];
+// @build:fim
+
+const OFFLINE_URL = '/offline.html';
+
+// Assets com hash no nome nunca mudam de conteudo
+const ASSET_IMUTAVEL = /^\/assets\/.+\.[0-9a-f]{10}\./;
+
+// Respostas da API servidas do cache enquanto revalidam em segundo plano
+const API_CACHE = 'pescados-api';
+const API_SWR = ['/api/produtos', '/api/transacoes'];
+// Lojas adicionais usam /loja/<loja>/api/...; o cache fica separado pela URL
+const PREFIXO_LOJA = /^\/loja\/[^/]+/;
+// Escritas da API e as listas em cache que cada uma altera
+const INVALIDA = [
+  [/^\/api\/produtos(\/\d+)?$/, ['/api/produtos']],
+  [/^\/api\/transacoes(\/\d+)?$/, ['/api/transacoes']],
+  [/^\/api\/import\/transacoes$/, ['/api/transacoes']],
+];
+// Idade maxima de uma resposta em cache (a pagina pode mudar via postMessage)
+let apiMaxAgeMs = 24 * 60 * 60 * 1000;
+const CABECALHO_CACHEADO_EM = 'X-SW-Cacheado-Em';
+const CABECALHO_HASH = 'X-SW-Hash';
+
+const respostaOffline = () => new Response(
+  JSON.stringify({ error: 'Offline - sem conexao com servidor' }),
+  { headers: { 'Content-Type': 'application/json' }, status: 503 }
+);
+
+const hashCorpo = async (corpo) => {
+  const digest = await crypto.subtle.digest('SHA-256', corpo);
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+// Avisar as paginas abertas que ha dados mais novos no cache
+const avisarPaginas = async (url) => {
+  const paginas = await self.clients.matchAll({ type: 'window' });
+  paginas.forEach((pagina) => pagina.postMessage({ tipo: 'api-atualizada', url }));
+};
+
+const revalidar = async (request, cache, cached) => {
+  const response = await fetch(request);
+  if (!response.ok) {
+    return response;
+  }
+  const corpo = await response.clone().arrayBuffer();
+  const hash = await hashCorpo(corpo);
+  const headers = new Headers(response.headers);
+  headers.set(CABECALHO_CACHEADO_EM, String(Date.now()));
+  headers.set(CABECALHO_HASH, hash);
+  await cache.put(request, new Response(corpo, {
+    status: response.status,
+    statusText: response.statusText,
+    headers,
+  }));
+  if (cached && cached.headers.get(CABECALHO_HASH) !== hash) {
+    const url = new URL(request.url);
+    await avisarPaginas(url.pathname + url.search);
+  }
+  return response;
+};
+
+// Stale-while-revalidate: responde na hora com o cache (se nao estiver velho
+// demais) e busca a versao nova em segundo plano. Com cache: 'no-cache' a
+// pagina pede a versao da rede, usando o cache so se estiver offline.
+const staleWhileRevalidate = async (event) => {
+  const cache = await caches.open(API_CACHE);
+  const cached = await cache.match(event.request);
+  const rede = revalidar(event.request, cache, cached);
+
+  if (cached && event.request.cache === 'default') {
+    const idade = Date.now() - Number(cached.headers.get(CABECALHO_CACHEADO_EM) || 0);
+    if (idade <= apiMaxAgeMs) {
+      event.waitUntil(rede.catch(() => {}));
+      return cached;
+    }
+  }
+  return rede.catch(() => cached || respostaOffline());
+};
+
+// Depois de gravar no servidor, descartar as listas em cache desse recurso
+// (offline a pagina usa o IndexedDB, que ja tem a alteracao)
+const descartarApi = async (pathname) => {
+  const prefixo = (pathname.match(PREFIXO_LOJA) || [''])[0];
+  const caminho = pathname.slice(prefixo.length);
+  const regra = INVALIDA.find(([padrao]) => padrao.test(caminho));
+  if (!regra) return;
+  const alvos = regra[1].map((recurso) => prefixo + recurso);
+  const cache = await caches.open(API_CACHE);
+  const chaves = await cache.keys();
+  await Promise.all(chaves
+    .filter((req) => alvos.includes(new URL(req.url).pathname))
+    .map((req) => cache.delete(req)));
+};
+
+self.addEventListener('message', (event) => {
+  const dados = event.data || {};
+  if (dados.tipo === 'configurar' && Number(dados.apiMaxAgeMs) > 0) {
+    apiMaxAgeMs = Number(dados.apiMaxAgeMs);
+  }
+});
 
 // Instalar service worker e cachear arquivos essenciais
 self.addEventListener('install', (event) => {
   event.waitUntil(
     caches.open(CACHE_NAME).then((cache) => {
       console.log('Cacheando arquivos do app...');
-      return cache.addAll(SHELL_CACHE);
+      // Reaproveitar do cache antigo os assets versionados que nao mudaram,
+      // assim o celular so baixa o que realmente mudou
+      return Promise.all(SHELL_CACHE.map(async (url) => {
+        if (ASSET_IMUTAVEL.test(url)) {
+          const antigo = await caches.match(url);
+          if (antigo) {
+            return cache.put(url, antigo);
+          }
+        }
+        return cache.add(url);
+      }));
     })
   );
   self.skipWaiting();
@@ -32,7 +142,7 @@ self.addEventListener('activate', (event) => {
     caches.keys().then((cacheNames) => {
       return Promise.all(
         cacheNames
-          .filter((name) => name !== CACHE_NAME)
+          .filter((name) => name !== CACHE_NAME && name !== API_CACHE)
           .map((name) => caches.delete(name))
       );
     })
@@ -40,23 +150,39 @@ self.addEventListener('activate', (event) => {
   self.clients.claim();
 });
 
-// Estrategia: Network First para API, Cache First para assets
+// Estrategia: Stale-While-Revalidate para listas da API, rede para o resto
+// da API, Cache First para assets
 self.addEventListener('fetch', (event) => {
   const url = new URL(event.request.url);
+  const caminho = url.pathname.replace(PREFIXO_LOJA, '');
+
+  // Stream de eventos (SSE) vai direto ao servidor: nada de cache nem
+  // resposta offline, senao o EventSource para de reconectar
+  if (caminho === '/api/events') {
+    return;
+  }
+
+  if (caminho.startsWith('/api/')) {
+    // Listas da API - cache imediato + revalidacao (no-store = verificar servidor)
+    if (event.request.method === 'GET'
+        && API_SWR.includes(caminho)
+        && event.request.cache !== 'no-store') {
+      event.respondWith(staleWhileRevalidate(event));
+      return;
+    }
 
-  // Requisicoes de API - sempre buscar da rede
-  if (url.pathname.startsWith('/api/')) {
+    // Demais requisicoes de API - sempre buscar da rede
     event.respondWith(
       fetch(event.request)
         .then((response) => {
+          if (response.ok && event.request.method !== 'GET') {
+            event.waitUntil(descartarApi(url.pathname));
+          }
           return response;
         })
         .catch(() => {
           // Se offline, retornar erro JSON
-          return new Response(
-            JSON.stringify({ error: 'Offline - sem conexao com servidor' }),
-            { headers: { 'Content-Type': 'application/json' }, status: 503 }
-          );
+          return respostaOffline();
         })
     );
     return;
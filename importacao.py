@@ -0,0 +1,317 @@
+"""
+Pescados do Alexandre - Importacao de transacoes em lote
+Le um CSV de historico, valida coluna a coluna com pandas e grava as
+linhas validas numa unica transacao. As linhas com problema voltam no
+relatorio com o numero da linha e o motivo.
+
+Colunas aceitas (cabecalho, sem diferenciar maiusculas):
+  data, produto (nome) ou produtoId, tipo, pesoKg, precoKg, valorTotal
+precoKg e valorTotal sao opcionais: o valor total e sempre recalculado
+a partir do peso e do preco; sem preco, usa valorTotal / peso ou o preco
+padrao do produto. Datas em AAAA-MM-DD ou DD/MM/AAAA; decimais com
+ponto ou virgula; separador "," ou ";".
+
+Numeros com separador de milhar: "1.234,56" e "1,234.56" (o ultimo
+separador e o decimal, grupos de 3 digitos). Sem decimal, varias
+virgulas ("1,234,567") sao ambiguas e a linha e rejeitada; uma virgula
+so e sempre decimal ("1,5" = 1.5).
+
+Uso:
+  python importacao.py historico.csv [--validar] [--banco pescados.db]
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import sys
+import unicodedata
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+import custos
+import unidades
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+# Nome normalizado no arquivo -> coluna interna
+APELIDOS = {
+    "data": "data",
+    "produto": "produto",
+    "produtonome": "produto",
+    "nome": "produto",
+    "produtoid": "produtoId",
+    "tipo": "tipo",
+    "pesokg": "pesoKg",
+    "peso": "pesoKg",
+    "precokg": "precoKg",
+    "preco": "precoKg",
+    "valortotal": "valorTotal",
+    "valor": "valorTotal",
+}
+TIPOS = ("compra", "venda")
+TOLERANCIA_VALOR = 0.01
+MAX_ERROS = 1000  # erros devolvidos no relatorio (a contagem e sempre completa)
+
+
+def _normalizar(texto: str) -> str:
+    sem_acento = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return "".join(sem_acento.split()).casefold()
+
+
+def ler_csv(arquivo) -> pd.DataFrame:
+    """Le o CSV inteiro como texto (a conversao e feita na validacao)"""
+    if isinstance(arquivo, (bytes, bytearray)):
+        arquivo = io.BytesIO(arquivo)
+    if hasattr(arquivo, "read"):
+        conteudo = arquivo.read()
+        texto = conteudo.decode("utf-8-sig") if isinstance(conteudo, bytes) else conteudo
+    else:
+        with open(arquivo, encoding="utf-8-sig") as f:
+            texto = f.read()
+    cabecalho = texto.split("\n", 1)[0]
+    separador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    # Linhas em branco ficam no indice (e somem depois), para o numero da
+    # linha no relatorio continuar sendo o do arquivo
+    df = pd.read_csv(io.StringIO(texto), sep=separador, dtype=str, keep_default_na=False,
+                     skip_blank_lines=False)
+    df = df[~(df.fillna("").astype(str).apply(lambda c: c.str.strip()) == "").all(axis=1)]
+    return df.fillna("").rename(columns=lambda c: APELIDOS.get(_normalizar(c), c))
+
+
+_SIMPLES = r"^[+-]?\d*(?:[.,]\d+)?$"                      # 12 / 12.5 / 12,5
+_MILHAR_PONTO = r"^[+-]?\d{1,3}(?:\.\d{3})+(?:,\d+)?$"       # 1.234 567 / 1.234,56
+_MILHAR_VIRGULA = r"^[+-]?\d{1,3}(?:,\d{3})+\.\d+$"          # 1,234.56
+
+
+def _numero(serie: pd.Series) -> pd.Series:
+    """Texto -> numero; formatos fora dos aceitos (ou ambiguos) viram NaN"""
+    texto = serie.astype(str).str.strip()
+    simples = texto.str.match(_SIMPLES)
+    milhar_ponto = ~simples & texto.str.match(_MILHAR_PONTO)
+    milhar_virgula = ~simples & texto.str.match(_MILHAR_VIRGULA)
+    normalizado = pd.Series(pd.NA, index=serie.index, dtype=object)
+    normalizado = normalizado.mask(simples, texto.str.replace(",", ".", regex=False))
+    normalizado = normalizado.mask(
+        milhar_ponto, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    )
+    normalizado = normalizado.mask(milhar_virgula, texto.str.replace(",", "", regex=False))
+    return pd.to_numeric(normalizado.mask(texto == ""), errors="coerce")
+
+
+def _datas(serie: pd.Series) -> pd.Series:
+    texto = serie.astype(str).str.strip()
+    iso = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    br = pd.to_datetime(texto, format="%d/%m/%Y", errors="coerce")
+    return iso.fillna(br)
+
+
+def validar(df: pd.DataFrame, produtos: List[Dict[str, Any]], hoje: date | None = None):
+    """Valida e normaliza as linhas.
+
+    Devolve (validas, erros, invalidas): validas e um DataFrame com as
+    colunas da API (produtoId, tipo, pesoKg, precoKg, valorTotal, data),
+    erros uma lista de {"linha", "erros"} com a linha do arquivo
+    (cabecalho = linha 1) e invalidas o total de linhas rejeitadas.
+    """
+    hoje = pd.Timestamp(hoje or date.today())
+    problemas = pd.DataFrame(index=df.index)
+
+    def marcar(nome: str, mascara) -> None:
+        problemas[nome] = mascara
+
+    faltando = [c for c in ("data", "tipo", "pesoKg") if c not in df.columns]
+    if "produto" not in df.columns and "produtoId" not in df.columns:
+        faltando.append("produto ou produtoId")
+    if faltando:
+        raise ValueError("Colunas obrigatorias ausentes: " + ", ".join(faltando))
+
+    # Produto: id informado ou nome cadastrado
+    por_id = {int(p["id"]): p for p in produtos}
+    por_nome = {_normalizar(p["nome"]): int(p["id"]) for p in produtos}
+    produto_id = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    if "produtoId" in df.columns:
+        ids = _numero(df["produtoId"])
+        produto_id = ids.where(ids.isin(list(por_id))).astype("Int64")
+    if "produto" in df.columns:
+        nomes = df["produto"].map(_normalizar).map(por_nome).astype("Int64")
+        produto_id = produto_id.fillna(nomes)
+    marcar("produto nao cadastrado", produto_id.isna())
+
+    tipo = df["tipo"].str.strip().str.lower()
+    marcar("tipo deve ser compra ou venda", ~tipo.isin(TIPOS))
+
+    peso = _numero(df["pesoKg"])
+    marcar("pesoKg deve ser um numero positivo", ~(peso > 0))
+
+    datas = _datas(df["data"])
+    marcar("data invalida (use AAAA-MM-DD ou DD/MM/AAAA)", datas.isna())
+    marcar("data no futuro", datas > hoje)
+
+    # Preco: do arquivo, senao valorTotal / peso, senao o padrao do produto
+    vazio = pd.Series(float("nan"), index=df.index)
+    preco_arquivo = _numero(df["precoKg"]) if "precoKg" in df.columns else vazio
+    valor_arquivo = _numero(df["valorTotal"]) if "valorTotal" in df.columns else vazio
+    derivado = preco_arquivo.isna() & valor_arquivo.notna()
+    preco = preco_arquivo.fillna((valor_arquivo / peso).round(2))
+    padrao_compra = produto_id.map({i: p["precoCompraPadrao"] for i, p in por_id.items()})
+    padrao_venda = produto_id.map({i: p["precoVendaPadrao"] for i, p in por_id.items()})
+    padrao = padrao_compra.where(tipo == "compra", padrao_venda).astype(float)
+    preco = preco.fillna(padrao)
+    # Sem produto nao ha preco padrao: o erro ja foi apontado acima
+    marcar("precoKg invalido", ~(preco >= 0) & produto_id.notna())
+
+    # Valor total recalculado; se o preco veio de valorTotal / peso, o valor
+    # do arquivo e mantido para nao perder centavos no arredondamento do preco
+    valor = (peso * preco).round(2).where(~derivado, valor_arquivo)
+    divergente = preco_arquivo.notna() & valor_arquivo.notna() & ((valor_arquivo - valor).abs() > TOLERANCIA_VALOR)
+    marcar("valorTotal nao confere com pesoKg x precoKg", divergente)
+
+    invalida = problemas.any(axis=1)
+    erros: List[Dict[str, Any]] = []
+    if invalida.any():
+        ruins = problemas[invalida]
+        for linha, marcas in zip(ruins.index[:MAX_ERROS], ruins.to_numpy()[:MAX_ERROS]):
+            erros.append({
+                "linha": int(linha) + 2,
+                "erros": [nome for nome, ruim in zip(ruins.columns, marcas) if ruim],
+            })
+
+    ok = ~invalida
+    validas = pd.DataFrame({
+        "produtoId": produto_id[ok].astype(int),
+        "tipo": tipo[ok],
+        "pesoKg": peso[ok].astype(float),
+        "precoKg": preco[ok].astype(float).round(2),
+        "valorTotal": valor[ok].astype(float),
+        "data": datas[ok].dt.strftime("%Y-%m-%d"),
+    })
+    return validas, erros, int(invalida.sum())
+
+
+def _carregar_produtos(conn) -> List[Dict[str, Any]]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, nome, precoCompraPadrao, precoVendaPadrao FROM produtos")
+        return [
+            {"id": r[0], "nome": r[1], "precoCompraPadrao": r[2], "precoVendaPadrao": r[3]}
+            for r in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+
+
+def preparar(validas: pd.DataFrame) -> List[tuple]:
+    """Linhas validas -> (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia)"""
+    # Ponto fixo (unidades.py), convertido por coluna
+    dias = (pd.to_datetime(validas["data"], format="%Y-%m-%d") - pd.Timestamp(unidades.EPOCA)).dt.days
+    banco = pd.DataFrame({
+        "produtoId": validas["produtoId"].astype("int64"),
+        "tipo": validas["tipo"],
+        "pesoG": unidades.inteiros(validas["pesoKg"], unidades.GRAMAS),
+        "precoCentavos": unidades.inteiros(validas["precoKg"], unidades.CENTAVOS),
+        "valorCentavos": unidades.inteiros(validas["valorTotal"], unidades.CENTAVOS),
+        "dia": dias.astype("int64"),
+    })
+    # int() nativo: sqlite3 e psycopg2 nao aceitam numpy.int64
+    return [
+        (int(p), t, int(g), int(c), int(v), int(d))
+        for p, t, g, c, v, d in banco.itertuples(index=False, name=None)
+    ]
+
+
+def gravar(conn, linhas: List[tuple], backend: str = "sqlite") -> int:
+    """INSERT das linhas preparadas e custo dos produtos afetados, sem commit"""
+    if not linhas:
+        return 0
+    placeholder = "%s" if backend == "postgres" else "?"
+    cursor = conn.cursor()
+    try:
+        sql = "INSERT INTO transacoes (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia) VALUES "
+        if backend == "postgres":
+            from psycopg2.extras import execute_values
+
+            execute_values(cursor, sql + "%s", linhas, page_size=5000)
+        else:
+            cursor.executemany(sql + "(?, ?, ?, ?, ?, ?)", linhas)
+        # O livro de custo dos produtos afetados e refeito uma vez so
+        custos.sincronizar(conn, placeholder=placeholder)
+    finally:
+        cursor.close()
+    return len(linhas)
+
+
+def inserir(conn, validas: pd.DataFrame, backend: str = "sqlite") -> int:
+    """Grava todas as linhas validas numa transacao (e o custo junto)"""
+    try:
+        quantidade = gravar(conn, preparar(validas), backend)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return quantidade
+
+
+def importar(conn, arquivo, backend: str = "sqlite", somente_validar: bool = False,
+             gravacao: Optional[Callable[[List[tuple]], int]] = None) -> Dict[str, Any]:
+    """Le, valida e grava um CSV; devolve o relatorio da importacao.
+
+    'gravacao' recebe as linhas ja convertidas e grava por outro caminho
+    (o app usa a thread de gravacao); sem ela, inserir() usa 'conn'.
+    """
+    df = ler_csv(arquivo)
+    validas, erros, invalidas = validar(df, _carregar_produtos(conn))
+    if somente_validar:
+        importadas = 0
+    elif gravacao is not None:
+        importadas = gravacao(preparar(validas))
+    else:
+        importadas = inserir(conn, validas, backend)
+    return {
+        "total": len(df),
+        "validas": len(validas),
+        "invalidas": invalidas,
+        "importadas": importadas,
+        "erros": erros,
+    }
+
+
+# ==================== CLI ====================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Importa transacoes de um CSV")
+    parser.add_argument("arquivo")
+    parser.add_argument("--validar", action="store_true", help="so valida, nao grava")
+    parser.add_argument("--banco", help="arquivo SQLite (ignora DATABASE_URL)")
+    args = parser.parse_args(argv)
+
+    database_url = os.getenv("DATABASE_URL")
+    if database_url and not args.banco:
+        import psycopg2
+
+        conn, backend = psycopg2.connect(database_url), "postgres"
+    else:
+        import sqlite3
+
+        conn, backend = sqlite3.connect(args.banco or DB_PATH), "sqlite"
+    try:
+        relatorio = importar(conn, args.arquivo, backend, args.validar)
+    except ValueError as e:
+        print(f"erro: {e}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+
+    for erro in relatorio["erros"]:
+        print(f"linha {erro['linha']}: {'; '.join(erro['erros'])}", file=sys.stderr)
+    print(f"{relatorio['total']} linha(s), {relatorio['invalidas']} com erro, "
+          f"{relatorio['importadas']} importada(s)")
+    return 1 if relatorio["invalidas"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Pescados do Alexandre - Varias lojas (uma base por loja)
+Cada banca tem o seu proprio banco: um arquivo SQLite em lojas/<loja>.db
+(a loja "principal" continua no pescados.db) ou um schema loja_<loja> no
+Postgres. Assim cada resumo le so os dados da propria loja.
+
+A loja da requisicao vem, nesta ordem, de:
+  prefixo /loja/<loja>/...   (usado pelo app no navegador)
+  cabecalho X-Loja
+  parametro ?loja=
+  cookie loja
+e fica numa contextvar lida por get_connection().
+
+O relatorio consolidado le as lojas em paralelo (uma conexao por loja).
+"""
+
+from __future__ import annotations
+
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List
+
+PADRAO = "principal"
+PASTA = "lojas"
+PREFIXO_SCHEMA = "loja_"
+MAX_PARALELO = 8
+
+_ID_VALIDO = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+_PREFIXO_URL = re.compile(r"^/loja/([^/]+)(/.*)?$")
+
+_loja_atual: contextvars.ContextVar[str] = contextvars.ContextVar("pescados_loja", default=PADRAO)
+
+
+class LojaInvalida(ValueError):
+    pass
+
+
+def validar(loja: str) -> str:
+    loja = (loja or "").strip().lower()
+    if not _ID_VALIDO.match(loja):
+        raise LojaInvalida("loja deve ter letras minusculas, numeros, - ou _ (ate 32)")
+    return loja
+
+
+def atual() -> str:
+    return _loja_atual.get()
+
+
+@contextmanager
+def usando(loja: str):
+    """Executa o bloco com 'loja' como loja atual"""
+    token = _loja_atual.set(validar(loja))
+    try:
+        yield loja
+    finally:
+        _loja_atual.reset(token)
+
+
+# ==================== SQLITE ====================
+
+def caminho_sqlite(loja: str, app_dir: str, db_principal: str) -> str:
+    if loja == PADRAO:
+        return db_principal
+    return os.path.join(app_dir, PASTA, f"{validar(loja)}.db")
+
+
+def listar_sqlite(app_dir: str) -> List[str]:
+    """Lojas com banco criado (a principal sempre existe)"""
+    pasta = os.path.join(app_dir, PASTA)
+    encontradas = []
+    if os.path.isdir(pasta):
+        for nome in os.listdir(pasta):
+            loja, extensao = os.path.splitext(nome)
+            if extensao == ".db" and _ID_VALIDO.match(loja) and loja != PADRAO:
+                encontradas.append(loja)
+    return [PADRAO] + sorted(encontradas)
+
+
+def criar_sqlite(loja: str, app_dir: str) -> str:
+    caminho = caminho_sqlite(validar(loja), app_dir, "")
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    return caminho
+
+
+# ==================== POSTGRES ====================
+
+def schema_postgres(loja: str) -> str:
+    return "public" if loja == PADRAO else PREFIXO_SCHEMA + validar(loja).replace("-", "_")
+
+
+def usar_schema(conn, loja: str, criar: bool = False) -> None:
+    """Aponta o search_path da conexao para o schema da loja"""
+    schema = schema_postgres(loja)
+    cursor = conn.cursor()
+    if criar and schema != "public":
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+    cursor.execute(f'SET search_path TO "{schema}"')
+    cursor.close()
+    # Confirmado ja: um rollback posterior nao desfaz o search_path
+    conn.commit()
+
+
+def listar_postgres(conn) -> List[str]:
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT schema_name FROM information_schema.schemata WHERE schema_name LIKE %s ORDER BY schema_name",
+        (PREFIXO_SCHEMA + "%",),
+    )
+    schemas = [r[0] for r in cursor.fetchall()]
+    cursor.close()
+    return [PADRAO] + [s[len(PREFIXO_SCHEMA):] for s in schemas]
+
+
+# ==================== CONSOLIDADO ====================
+
+def consolidar(lojas: Iterable[str], calcular: Callable[[str], Dict[str, Any]],
+               paralelo: int = MAX_PARALELO) -> Dict[str, Any]:
+    """Executa calcular(loja) em paralelo e soma os totais numericos.
+
+    calcular deve abrir a propria conexao (uma por loja, em threads).
+    """
+    lojas = list(lojas)
+
+    def executar(loja):
+        with usando(loja):
+            return calcular(loja)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(paralelo, len(lojas)))) as executor:
+        resultados = list(executor.map(executar, lojas))
+
+    totais: Dict[str, Any] = {}
+    for resultado in resultados:
+        for chave, valor in resultado.items():
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                totais[chave] = totais.get(chave, 0) + valor
+    if "margem" in totais and "receita" in totais:
+        totais["margemPct"] = totais["margem"] / totais["receita"] if totais["receita"] else None
+    return {
+        "porLoja": [{"loja": loja, **resultado} for loja, resultado in zip(lojas, resultados)],
+        "totais": totais,
+    }
+
+
+# ==================== FLASK ====================
+
+class _PrefixoLoja:
+    """Middleware WSGI: /loja/<loja>/api/... vira /api/... com a loja no environ"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encontrado = _PREFIXO_URL.match(environ.get("PATH_INFO", ""))
+        if encontrado:
+            loja, resto = encontrado.group(1), encontrado.group(2) or "/"
+            environ["pescados.loja"] = loja
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + f"/loja/{loja}"
+            environ["PATH_INFO"] = resto
+        return self.wsgi_app(environ, start_response)
+
+
+def loja_da_requisicao(request) -> str:
+    return (
+        request.environ.get("pescados.loja")
+        or request.headers.get("X-Loja")
+        or request.args.get("loja")
+        or request.cookies.get("loja")
+        or PADRAO
+    )
+
+
+_prontas = set()
+_lock_prontas = threading.Lock()
+_inicializar: Callable[[str], None] | None = None
+
+
+def preparar(loja: str) -> None:
+    """Chama o inicializar(loja) de init_app uma vez por loja e processo.
+
+    A loja ja deve ser a atual (usando() ou a requisicao dela).
+    """
+    if loja in _prontas:
+        return
+    with _lock_prontas:
+        if loja not in _prontas:
+            if _inicializar is not None:
+                _inicializar(loja)
+            _prontas.add(loja)
+
+
+def init_app(app, existe: Callable[[str], bool], inicializar: Callable[[str], None]) -> None:
+    """Instala o roteamento por loja no app Flask.
+
+    existe(loja) diz se a loja foi criada; inicializar(loja) cria as tabelas
+    (chamado uma vez por loja e processo, na primeira requisicao dela).
+    """
+    global _inicializar
+    from flask import g, jsonify, request
+
+    app.wsgi_app = _PrefixoLoja(app.wsgi_app)
+    _inicializar = inicializar
+
+    @app.before_request
+    def _escolher_loja():
+        try:
+            loja = validar(loja_da_requisicao(request))
+        except LojaInvalida as e:
+            return jsonify({"erro": str(e)}), 400
+        if loja != PADRAO and not existe(loja):
+            # Criar loja e explicito (POST /api/lojas), nunca por engano de URL
+            return jsonify({"erro": f"loja desconhecida: {loja}"}), 404
+        g.loja_token = _loja_atual.set(loja)
+        preparar(loja)
+        return None
+
+    @app.teardown_request
+    def _liberar_loja(_erro=None):
+        token = g.pop("loja_token", None)
+        if token is not None:
+            _loja_atual.reset(token)
@@ -0,0 +1,231 @@
+"""
+Pescados do Alexandre - Metricas
+Contadores e histogramas em memoria expostos em /metrics no formato texto
+do Prometheus. Tudo e protegido por um unico lock e custa poucos
+microssegundos por requisicao, entao pode ficar ligado em producao.
+"""
+
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+import time
+from typing import Dict, List, Sequence, Set, Tuple
+
+import db_trace
+
+_lock = threading.Lock()
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    partes = [f'{n}="{_escape(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatar(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, labels: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labelnames = tuple(labels)
+        self._valores: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.registrar(self)
+
+    def _cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def inc(self, *labels, valor: float = 1.0) -> None:
+        with _lock:
+            self._valores[labels] = self._valores.get(labels, 0.0) + valor
+
+    def render(self) -> List[str]:
+        linhas = self._cabecalho()
+        for chave, valor in sorted(self._valores.items()):
+            linhas.append(f"{self.nome}{_labels(self.labelnames, chave)} {_formatar(valor)}")
+        return linhas
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def set(self, *labels, valor: float) -> None:
+        with _lock:
+            self._valores[labels] = float(valor)
+
+    def inc(self, *labels, valor: float = 1.0) -> None:
+        with _lock:
+            self._valores[labels] = self._valores.get(labels, 0.0) + valor
+
+    def dec(self, *labels, valor: float = 1.0) -> None:
+        self.inc(*labels, valor=-valor)
+
+    render = Counter.render
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(nome, ajuda, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, valor: float) -> None:
+        i = bisect.bisect_left(self.buckets, valor)
+        with _lock:
+            dados = self._valores.get(labels)
+            if dados is None:
+                # [contagens por bucket..., +Inf], soma
+                dados = self._valores[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            dados[0][i] += 1
+            dados[1] += valor
+
+    def render(self) -> List[str]:
+        linhas = self._cabecalho()
+        for chave, (contagens, soma) in sorted(self._valores.items()):
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += n
+                le = f'le="{_formatar(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_labels(self.labelnames, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_labels(self.labelnames, chave)} {_formatar(soma)}")
+            linhas.append(f"{self.nome}_count{_labels(self.labelnames, chave)} {acumulado}")
+        return linhas
+
+
+class Registry:
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+
+    def registrar(self, metrica: _Metrica) -> None:
+        self._metricas[metrica.nome] = metrica
+
+    def render(self) -> str:
+        with _lock:
+            linhas: List[str] = []
+            for metrica in self._metricas.values():
+                linhas.extend(metrica.render())
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRY = Registry()
+
+# ==================== METRICAS PADRAO ====================
+
+HTTP_LATENCIA = Histogram(
+    "pescados_http_request_duration_seconds",
+    "Tempo de resposta das requisicoes HTTP",
+    ("method", "route"),
+)
+HTTP_TAMANHO = Histogram(
+    "pescados_http_response_size_bytes",
+    "Tamanho do corpo das respostas HTTP",
+    ("method", "route"),
+    buckets=SIZE_BUCKETS,
+)
+HTTP_STATUS = Counter(
+    "pescados_http_requests_total",
+    "Requisicoes HTTP por rota e status",
+    ("method", "route", "status"),
+)
+SQL_LATENCIA = Histogram(
+    "pescados_sql_duration_seconds",
+    "Tempo de execucao dos comandos SQL (inclui leitura das linhas)",
+    ("backend", "statement"),
+)
+SQL_LINHAS = Counter(
+    "pescados_sql_rows_total",
+    "Linhas lidas ou alteradas pelos comandos SQL",
+    ("backend", "statement"),
+)
+
+_ESPACOS = re.compile(r"\s+")
+# Literais viram "?": o mesmo comando com valores diferentes e uma serie so
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+LIMITE_STATEMENTS = 200   # labels distintos; o resto cai em OUTROS
+OUTROS = "outros"
+_statement_cache: Dict[str, str] = {}
+_statements: Set[str] = set()
+
+
+def normalizar_sql(sql: str) -> str:
+    """Reduz o SQL a uma linha curta para usar como label.
+
+    Os labels formam um registro fixo de ate LIMITE_STATEMENTS comandos
+    (primeiros a aparecer); comandos novos depois disso viram OUTROS, para
+    o /metrics nao crescer sem limite com SQL montado em tempo de execucao.
+    """
+    rotulo = _statement_cache.get(sql)
+    if rotulo is None:
+        rotulo = _LITERAIS.sub("?", _ESPACOS.sub(" ", sql).strip())[:120]
+        with _lock:
+            if rotulo not in _statements:
+                if len(_statements) < LIMITE_STATEMENTS:
+                    _statements.add(rotulo)
+                else:
+                    rotulo = OUTROS
+            if len(_statement_cache) < 1000:
+                _statement_cache[sql] = rotulo
+    return rotulo
+
+
+def _observar_sql(evento: db_trace.QueryEvent) -> None:
+    rotulo = normalizar_sql(evento.sql)
+    SQL_LATENCIA.observe(evento.backend, rotulo, valor=evento.seconds)
+    if evento.rows:
+        SQL_LINHAS.inc(evento.backend, rotulo, valor=evento.rows)
+
+
+db_trace.add_listener(_observar_sql)
+
+
+# ==================== FLASK ====================
+
+def init_app(app) -> None:
+    """Registra o middleware de metricas e a rota /metrics no app Flask"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _metricas_inicio():
+        g._metricas_inicio = time.perf_counter()
+
+    @app.after_request
+    def _metricas_fim(response):
+        inicio = g.pop("_metricas_inicio", None)
+        if inicio is None:
+            return response
+        rota = request.url_rule.rule if request.url_rule is not None else "<sem rota>"
+        metodo = request.method
+        HTTP_LATENCIA.observe(metodo, rota, valor=time.perf_counter() - inicio)
+        HTTP_STATUS.inc(metodo, rota, str(response.status_code))
+        # Respostas em streaming nao tem tamanho conhecido
+        if not response.is_streamed:
+            HTTP_TAMANHO.observe(metodo, rota, valor=response.calculate_content_length() or 0)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
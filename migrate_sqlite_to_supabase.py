@@ -9,6 +9,9 @@ from __future__ import annotations
 import os
 import sqlite3
 import sys
+from pathlib import Path
+
+import unidades
 
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -27,7 +30,8 @@ def main() -> int:
 
     import psycopg2
 
-    sqlite_conn = sqlite3.connect(SQLITE_PATH)
+    # Origem so para leitura: o arquivo local nao e alterado
+    sqlite_conn = sqlite3.connect(Path(SQLITE_PATH).as_uri() + "?mode=ro", uri=True)
     sqlite_conn.row_factory = sqlite3.Row
     sqlite_cur = sqlite_conn.cursor()
 
@@ -46,19 +50,8 @@ def main() -> int:
             )
             """
         )
-        pg_cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS transacoes (
-                id SERIAL PRIMARY KEY,
-                produtoId INTEGER NOT NULL REFERENCES produtos(id),
-                tipo TEXT NOT NULL CHECK(tipo IN ('compra', 'venda')),
-                pesoKg DOUBLE PRECISION NOT NULL,
-                precoKg DOUBLE PRECISION NOT NULL,
-                valorTotal DOUBLE PRECISION NOT NULL,
-                data DATE NOT NULL
-            )
-            """
-        )
+        # Transacoes em ponto fixo no destino; a origem e convertida na leitura
+        unidades.criar_tabelas(pg_conn, "postgres")
         pg_conn.commit()
 
         # Safety: avoid duplicate imports
@@ -78,10 +71,7 @@ def main() -> int:
         )
         produtos = [tuple(row) for row in sqlite_cur.fetchall()]
 
-        sqlite_cur.execute(
-            "SELECT id, produtoId, tipo, pesoKg, precoKg, valorTotal, data FROM transacoes ORDER BY id"
-        )
-        transacoes = [tuple(row) for row in sqlite_cur.fetchall()]
+        transacoes = unidades.ler_transacoes(sqlite_conn)
 
         # Insert into Postgres
         if produtos:
@@ -95,8 +85,8 @@ def main() -> int:
 
         if transacoes:
             pg_cur.executemany(
-                """
-                INSERT INTO transacoes (id, produtoId, tipo, pesoKg, precoKg, valorTotal, data)
+                f"""
+                INSERT INTO transacoes ({unidades.COLUNAS})
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """,
                 transacoes,
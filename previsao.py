@@ -0,0 +1,295 @@
+"""
+Pescados do Alexandre - Previsao de vendas e sugestao de compra
+Preve os kg vendidos por produto no dia seguinte com um modelo sazonal
+leve, ajustado para todos os produtos de uma vez (matrizes NumPy):
+  - perfil do dia da semana: media de cada dia da semana / media geral
+  - nivel: suavizacao exponencial (ALFA) das vendas sem o efeito do dia
+  - previsao = nivel x perfil do dia pedido
+
+O estado (vendas diarias dos ultimos HISTORICO dias completos) fica em
+memoria por banco. A cada chamada so os dias novos sao lidos; se as vendas
+ja incluidas mudaram (lancamento retroativo, exclusao), o estado e
+recarregado inteiro. As vendas de hoje entram so no que falta vender hoje.
+
+Sugestao de compra = previsao de amanha + SEGURANCA, menos o estoque que
+deve sobrar hoje (estoque no fim do dia pelo livro de custo, ja com as
+vendas lancadas, menos o que ainda falta vender). Com --data no passado o
+estoque e o daquele dia, nao o de hoje.
+
+Uso:
+  python previsao.py
+  python previsao.py --data 2025-06-30   # como se hoje fosse essa data
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from datetime import date
+from typing import Any, Dict, Hashable, List
+
+import numpy as np
+
+import arquivamento
+import custos
+import metrics
+import unidades
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+HISTORICO = 84     # dias completos usados no ajuste (12 semanas)
+ALFA = 0.3         # peso do dia mais recente no nivel
+SEGURANCA = 0.1    # folga sobre a previsao na sugestao de compra
+
+AJUSTES = metrics.Counter(
+    "pescados_forecast_refits_total",
+    "Atualizacoes do estado da previsao por tipo (incremental, completo)",
+    ("tipo",),
+)
+
+
+def dia_semana(dias):
+    """Segunda = 0 ... domingo = 6 (1970-01-01 foi uma quinta-feira)"""
+    return (dias + 3) % 7
+
+
+def _razao(a: np.ndarray, b: np.ndarray, padrao: float = 0.0) -> np.ndarray:
+    saida = np.full(np.broadcast(a, b).shape, padrao)
+    np.divide(a, b, out=saida, where=b != 0)
+    return saida
+
+
+class Estado:
+    """Vendas diarias em gramas por produto, de 'inicio' a 'fim' (inclusive).
+
+    vendas[i, j] e o total do produto ids[i] no dia inicio + j; linhas[j] e
+    o numero de vendas do dia (para conferir se o passado mudou).
+    """
+
+    __slots__ = ("fim", "ids", "vendas", "linhas", "nivel", "perfil")
+
+    def __init__(self, fim: int):
+        self.fim = fim
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vendas = np.zeros((0, HISTORICO), dtype=np.int64)
+        self.linhas = np.zeros(HISTORICO, dtype=np.int64)
+        self.nivel = np.empty(0)
+        self.perfil = np.empty((0, 7))
+
+    @property
+    def inicio(self) -> int:
+        return self.fim - HISTORICO + 1
+
+    def avancar(self, fim: int) -> None:
+        """Desloca a janela para terminar em 'fim' (dias novos zerados)"""
+        passo = min(fim - self.fim, HISTORICO)
+        if passo > 0:
+            self.vendas[:, :-passo] = self.vendas[:, passo:]
+            self.vendas[:, -passo:] = 0
+            self.linhas[:-passo] = self.linhas[passo:]
+            self.linhas[-passo:] = 0
+        self.fim = fim
+
+    def somar(self, produto: np.ndarray, dia: np.ndarray, peso: np.ndarray, quantidade: np.ndarray) -> None:
+        novos = np.setdiff1d(produto, self.ids)
+        if len(novos):
+            ids = np.union1d(self.ids, novos)
+            vendas = np.zeros((len(ids), HISTORICO), dtype=np.int64)
+            vendas[np.searchsorted(ids, self.ids)] = self.vendas
+            self.ids, self.vendas = ids, vendas
+        coluna = dia - self.inicio
+        np.add.at(self.vendas, (np.searchsorted(self.ids, produto), coluna), peso)
+        np.add.at(self.linhas, coluna, quantidade)
+
+    def ajustar(self) -> None:
+        """Perfil semanal e nivel de todos os produtos em passagens vetorizadas"""
+        kg = self.vendas / unidades.GRAMAS
+        semana = dia_semana(np.arange(self.inicio, self.fim + 1))
+        um = np.eye(7)[semana]  # dia x dia da semana
+        # Produtos novos: os dias antes da primeira venda nao contam como zero
+        vendeu = kg > 0
+        primeiro = np.where(vendeu.any(axis=1), vendeu.argmax(axis=1), HISTORICO)
+        valido = np.arange(HISTORICO) >= primeiro[:, None]
+
+        media_dia = _razao((kg * valido) @ um, valido @ um)
+        media = _razao((kg * valido).sum(axis=1), valido.sum(axis=1))
+        perfil = _razao(media_dia, media[:, None], 1.0)
+        perfil = _razao(perfil, perfil.mean(axis=1)[:, None], 1.0)
+
+        # Suavizacao exponencial normalizada: peso ALFA (1 - ALFA)^idade
+        fator = perfil[:, semana]
+        usar = valido & (fator > 0)
+        pesos = (1 - ALFA) ** np.arange(HISTORICO - 1, -1, -1)
+        self.nivel = _razao((_razao(kg, fator) * usar) @ pesos, usar @ pesos)
+        self.perfil = perfil
+
+    def prever(self, ids: np.ndarray, dia: int) -> np.ndarray:
+        """kg previstos no 'dia' para cada produto de 'ids' (0 sem historico)"""
+        saida = np.zeros(len(ids))
+        if len(self.ids):
+            posicao = np.searchsorted(self.ids, ids).clip(max=len(self.ids) - 1)
+            conhecido = self.ids[posicao] == ids
+            valor = self.nivel * self.perfil[:, dia_semana(dia)]
+            saida[conhecido] = valor[posicao[conhecido]]
+        return saida
+
+
+def _vendas(conn, inicio: int, fim: int, placeholder: str = "?"):
+    """(produto, dia, gramas, quantidade) das vendas por produto e dia"""
+    fonte = arquivamento.fonte_transacoes(conn, unidades.data_iso(inicio), placeholder)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT produtoId, dia, SUM(pesoG), COUNT(*)
+            FROM {fonte} t
+            WHERE tipo = 'venda' AND dia >= {placeholder} AND dia <= {placeholder}
+            GROUP BY produtoId, dia
+            """,
+            (inicio, fim),
+        )
+        linhas = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 4)
+    finally:
+        cursor.close()
+    return linhas[:, 0], linhas[:, 1], linhas[:, 2], linhas[:, 3]
+
+
+def _conferencia(conn, inicio: int, fim: int, placeholder: str = "?"):
+    """(vendas, {produto: (gramas, gramas x dia)}) do periodo: uma venda
+    trocada de produto ou de dia muda as somas dos produtos envolvidos"""
+    fonte = arquivamento.fonte_transacoes(conn, unidades.data_iso(inicio), placeholder)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT produtoId, COUNT(*), SUM(pesoG), SUM(CAST(dia - {placeholder} AS BIGINT) * pesoG)
+            FROM {fonte} t
+            WHERE tipo = 'venda' AND dia >= {placeholder} AND dia <= {placeholder}
+            GROUP BY produtoId
+            """,
+            (inicio, inicio, fim),
+        )
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+    somas = {int(r[0]): (int(r[2]), int(r[3])) for r in linhas if r[2]}
+    return sum(int(r[1]) for r in linhas), somas
+
+
+def atualizar(conn, estado: Estado | None, fim: int, placeholder: str = "?") -> Estado:
+    """Estado com os dias completos ate 'fim', lendo so o que falta"""
+    if estado is not None and estado.fim <= fim and fim - estado.fim < HISTORICO:
+        anterior = estado.fim
+        estado.avancar(fim)
+        # Os dias ja incluidos continuam iguais no banco?
+        guardados = HISTORICO - (fim - anterior)
+        vendas = estado.vendas[:, :guardados]
+        gramas = vendas.sum(axis=1)
+        ponderadas = vendas @ np.arange(guardados)
+        esperado = (
+            int(estado.linhas[:guardados].sum()),
+            {int(p): (int(g), int(d)) for p, g, d in zip(estado.ids, gramas, ponderadas) if g},
+        )
+        if _conferencia(conn, estado.inicio, anterior, placeholder) == esperado:
+            if fim > anterior:
+                estado.somar(*_vendas(conn, anterior + 1, fim, placeholder))
+                estado.ajustar()
+                AJUSTES.inc("incremental")
+            return estado
+
+    estado = Estado(fim)
+    estado.somar(*_vendas(conn, estado.inicio, fim, placeholder))
+    estado.ajustar()
+    AJUSTES.inc("completo")
+    return estado
+
+
+_ESTADOS: Dict[Hashable, Estado] = {}
+_LOCK = threading.Lock()
+
+
+def prever(conn, hoje=None, chave: Hashable = None, placeholder: str = "?") -> Dict[str, Any]:
+    """Previsao de hoje e de amanha e sugestao de compra de cada produto.
+
+    'chave' identifica o banco (ex.: caminho do arquivo) para reaproveitar
+    o estado entre chamadas; sem chave o ajuste e feito do zero.
+    """
+    dia = unidades.dia(hoje or date.today())
+    with _LOCK:
+        estado = atualizar(conn, _ESTADOS.get(chave) if chave is not None else None, dia - 1, placeholder)
+        if chave is not None:
+            _ESTADOS[chave] = estado
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, nome FROM produtos ORDER BY nome")
+            produtos = cursor.fetchall()
+        finally:
+            cursor.close()
+        ids = np.array([int(p[0]) for p in produtos], dtype=np.int64)
+        previsao_hoje = estado.prever(ids, dia)
+        previsao_amanha = estado.prever(ids, dia + 1)
+
+    # Vendas de hoje ate agora (uma linha por produto)
+    vendido = np.zeros(len(ids))
+    posicoes = {int(i): k for k, i in enumerate(ids)}
+    produto, _, peso, _ = _vendas(conn, dia, dia, placeholder)
+    for produto_id, gramas in zip(produto.tolist(), peso.tolist()):
+        if produto_id in posicoes:
+            vendido[posicoes[produto_id]] += gramas / unidades.GRAMAS
+
+    # Estoque no fim do dia da previsao (hoje: o atual, com as vendas ja lancadas)
+    estoques = custos.estoque_em(conn, unidades.data_iso(dia), placeholder)
+    estoque = np.array([estoques.get(int(i), 0.0) for i in ids])
+    sobra = np.maximum(estoque - np.maximum(previsao_hoje - vendido, 0.0), 0.0)
+    # Arredonda a compra para cima em 100 g
+    falta = np.maximum(previsao_amanha * (1 + SEGURANCA) - sobra, 0.0)
+    sugestao = np.ceil(np.round(falta * 10, 6)) / 10
+
+    por_produto: List[Dict[str, Any]] = []
+    for i, p in enumerate(produtos):
+        por_produto.append({
+            "produtoId": p[0],
+            "nome": p[1],
+            "previsaoHojeKg": float(previsao_hoje[i]),
+            "vendidoHojeKg": float(vendido[i]),
+            "previsaoKg": float(previsao_amanha[i]),
+            "estoqueKg": float(estoque[i]),
+            "sugestaoCompraKg": float(sugestao[i]),
+        })
+    return {
+        "data": unidades.data_iso(dia),
+        "alvo": unidades.data_iso(dia + 1),
+        "historicoDias": HISTORICO,
+        "porProduto": por_produto,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Previsao de vendas e sugestao de compra para amanha")
+    parser.add_argument("--data", help="AAAA-MM-DD usado como hoje (padrao: hoje)")
+    parser.add_argument("--banco", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.banco)
+    try:
+        resultado = prever(conn, args.data)
+    finally:
+        conn.close()
+
+    print(f"Compra sugerida para {resultado['alvo']} (historico de {resultado['historicoDias']} dias)")
+    print(f"{'produto':<20} {'hoje kg':>9} {'vendido':>9} {'amanha kg':>10} {'estoque':>9} {'comprar':>9}")
+    for p in resultado["porProduto"]:
+        print(
+            f"{p['nome'][:20]:<20} {p['previsaoHojeKg']:>9.2f} {p['vendidoHojeKg']:>9.2f} "
+            f"{p['previsaoKg']:>10.2f} {p['estoqueKg']:>9.2f} {p['sugestaoCompraKg']:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,13 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 import database
+import metrics
+import slow_query
 
 app = Flask(__name__, static_folder='.')
 CORS(app)
+metrics.init_app(app)
+slow_query.install('slow_queries.log')
 
 # Inicializar banco de dados ao iniciar o servidor
 database.init_db()
@@ -0,0 +1,95 @@
+"""
+Pescados do Alexandre - Requisicoes GET identicas em andamento
+Quando varios celulares voltam do Wi-Fi ao mesmo tempo, todos chamam
+/api/produtos e /api/transacoes juntos. Em vez de cada um fazer a sua
+consulta e o seu JSON, a primeira requisicao executa a rota e as que
+chegarem iguais (mesma loja, caminho e query string) enquanto ela roda
+esperam e recebem os mesmos bytes.
+
+So junta requisicoes simultaneas: nada e guardado depois que a primeira
+termina (isso e papel do cache.py).
+"""
+
+from __future__ import annotations
+
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+import lojas
+import metrics
+
+EXECUCOES = metrics.Counter(
+    "pescados_singleflight_executions_total",
+    "Rotas GET executadas de fato (uma por grupo de requisicoes iguais)",
+    ("rota",),
+)
+AGRUPADAS = metrics.Counter(
+    "pescados_singleflight_collapsed_total",
+    "Requisicoes GET que aproveitaram a resposta de outra em andamento",
+    ("rota",),
+)
+
+
+class _Chamada:
+    __slots__ = ("pronta", "valor", "erro")
+
+    def __init__(self):
+        self.pronta = threading.Event()
+        self.valor = None
+        self.erro = None
+
+
+class Grupo:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chamadas: Dict[Hashable, _Chamada] = {}
+
+    def executar(self, chave: Hashable, funcao: Callable[[], Any]):
+        """Devolve (valor, compartilhado); so uma funcao() roda por chave"""
+        with self._lock:
+            chamada = self._chamadas.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._chamadas[chave] = _Chamada()
+        if not lider:
+            chamada.pronta.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.valor, True
+
+        try:
+            chamada.valor = funcao()
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._chamadas[chave]
+            chamada.pronta.set()
+        return chamada.valor, False
+
+
+GRUPO = Grupo()
+
+
+def compartilhar(rota: str):
+    """Decorador de rota Flask GET: requisicoes iguais simultaneas dividem a resposta"""
+    def decorar(view):
+        @functools.wraps(view)
+        def envolvida(*args, **kwargs):
+            from flask import current_app, request
+
+            def responder():
+                EXECUCOES.inc(rota)
+                resposta = current_app.make_response(view(*args, **kwargs))
+                return resposta.get_data(), resposta.status_code, resposta.mimetype
+
+            chave = (lojas.atual(), request.path, request.query_string)
+            (corpo, status, mimetype), compartilhado = GRUPO.executar(chave, responder)
+            if compartilhado:
+                AGRUPADAS.inc(rota)
+            # Cada requisicao recebe o seu Response (cabecalhos por requisicao)
+            return current_app.response_class(corpo, status=status, mimetype=mimetype)
+        return envolvida
+    return decorar
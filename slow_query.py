@@ -0,0 +1,134 @@
+"""
+Pescados do Alexandre - Log de consultas lentas
+Registra em um arquivo rotativo todo comando SQL que passar do limite
+configurado, com parametros, duracao, numero de linhas e o plano de
+execucao capturado na hora (EXPLAIN QUERY PLAN no SQLite; no Postgres
+EXPLAIN (ANALYZE, BUFFERS) para SELECT e EXPLAIN para o resto, dentro de
+um SAVEPOINT desfeito em seguida).
+
+Configuracao por variaveis de ambiente:
+  PESCADOS_SLOW_QUERY_MS    limite em milissegundos (padrao 200, 0 = tudo, -1 = desligado)
+  PESCADOS_SLOW_QUERY_LOG   caminho do arquivo de log
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+from logging.handlers import RotatingFileHandler
+
+import db_trace
+
+LIMITE_PADRAO_MS = 200.0
+TAMANHO_MAXIMO_LOG = 2 * 1024 * 1024
+ARQUIVOS_ROTACAO = 5
+
+logger = logging.getLogger("pescados.slow_query")
+logger.propagate = False
+
+_limite_segundos = None
+
+
+def _primeiro_params(evento: db_trace.QueryEvent):
+    if not evento.many:
+        return evento.params
+    return evento.params[0] if evento.params else ()
+
+
+def capturar_plano(evento: db_trace.QueryEvent) -> str:
+    """Executa o EXPLAIN adequado ao backend para o comando do evento"""
+    sql = evento.sql.strip()
+    params = _primeiro_params(evento)
+    comando = sql.split(None, 1)[0].upper() if sql else ""
+    if comando not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+        return "(sem plano para este comando)"
+
+    try:
+        if evento.backend == "sqlite":
+            # Cursor base, fora da instrumentacao
+            cur = sqlite3.Cursor(evento.conn)
+            try:
+                cur.execute("EXPLAIN QUERY PLAN " + sql, params or ())
+                linhas = cur.fetchall()
+            finally:
+                cur.close()
+            return "\n".join(f"{row[0]}|{row[1]}| {row[3]}" for row in linhas) or "(plano vazio)"
+
+        import psycopg2.extensions
+
+        conn = evento.conn
+        situacao = conn.get_transaction_status()
+        if situacao == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return "(sem plano: transacao com erro)"
+        # ANALYZE executa o comando de novo: so num SELECT simples (um WITH
+        # pode ter DELETE/UPDATE dentro), e mesmo assim desfeito no fim
+        if comando == "SELECT":
+            explain = "EXPLAIN (ANALYZE, BUFFERS) "
+        else:
+            explain = "EXPLAIN "
+        cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        try:
+            # SAVEPOINT: falha ou efeito do EXPLAIN nao chega na transacao
+            # de quem fez a consulta; em autocommit, uma transacao propria
+            cur.execute("BEGIN" if conn.autocommit else "SAVEPOINT pescados_plano")
+            try:
+                cur.execute(explain + sql, params)
+                linhas = cur.fetchall()
+            finally:
+                if conn.autocommit:
+                    cur.execute("ROLLBACK")
+                else:
+                    cur.execute("ROLLBACK TO SAVEPOINT pescados_plano")
+                    cur.execute("RELEASE SAVEPOINT pescados_plano")
+        finally:
+            cur.close()
+            if situacao == psycopg2.extensions.TRANSACTION_STATUS_IDLE and not conn.autocommit:
+                # O SAVEPOINT abriu uma transacao que a conexao nao tinha
+                conn.rollback()
+        return "\n".join(row[0] for row in linhas)
+    except Exception as exc:
+        return f"(falha ao capturar plano: {exc})"
+
+
+def _registrar(evento: db_trace.QueryEvent) -> None:
+    if _limite_segundos is None or evento.seconds < _limite_segundos:
+        return
+    params = _primeiro_params(evento)
+    if evento.many:
+        params = f"{params!r} (+{len(evento.params) - 1} conjuntos)"
+    plano = capturar_plano(evento)
+    logger.warning(
+        "consulta lenta: %.1f ms | %d linha(s) | backend=%s\nSQL: %s\nParametros: %s\nPlano:\n%s\n",
+        evento.seconds * 1000.0,
+        evento.rows,
+        evento.backend,
+        " ".join(evento.sql.split()),
+        params,
+        plano,
+    )
+
+
+def install(caminho_log: str, limite_ms: float | None = None) -> None:
+    """Liga o log de consultas lentas (pode ser chamado mais de uma vez)"""
+    global _limite_segundos
+
+    if limite_ms is None:
+        limite_ms = float(os.getenv("PESCADOS_SLOW_QUERY_MS", LIMITE_PADRAO_MS))
+    caminho_log = os.getenv("PESCADOS_SLOW_QUERY_LOG", caminho_log)
+
+    if limite_ms < 0:
+        _limite_segundos = None
+        db_trace.remove_listener(_registrar)
+        return
+
+    _limite_segundos = limite_ms / 1000.0
+    if not logger.handlers:
+        handler = RotatingFileHandler(
+            caminho_log, maxBytes=TAMANHO_MAXIMO_LOG, backupCount=ARQUIVOS_ROTACAO,
+            encoding="utf-8", delay=True,
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+    db_trace.add_listener(_registrar)
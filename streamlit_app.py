@@ -16,11 +16,23 @@ import pandas as pd
 import streamlit as st
 import altair as alt
 
+import analitica
+import arquivamento
+import custos
+import db_trace
+import downsample
+import importacao
+import lojas
+import previsao
+import slow_query
+import unidades
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(APP_DIR, "pescados.db")
 LOGO_PATH = os.path.join(APP_DIR, "frontend", "icon-192.png")
 
+slow_query.install(os.path.join(APP_DIR, "slow_queries.log"))
+
 
 @dataclass(frozen=True)
 class DbConfig:
@@ -42,19 +54,43 @@ def get_db_config() -> DbConfig:
     return DbConfig(backend="sqlite", database_url=None)
 
 
+def listar_lojas() -> List[str]:
+    cfg = get_db_config()
+    if cfg.backend == "postgres":
+        with get_connection(lojas.PADRAO) as conn:
+            return lojas.listar_postgres(conn)
+    return lojas.listar_sqlite(APP_DIR)
+
+
+def loja_atual() -> str:
+    """Loja escolhida na barra lateral (ou ?loja= na URL)"""
+    loja = st.session_state.get("loja") or st.query_params.get("loja") or lojas.PADRAO
+    try:
+        return lojas.validar(loja)
+    except lojas.LojaInvalida:
+        return lojas.PADRAO
+
+
 @contextmanager
-def get_connection():
+def get_connection(loja: str | None = None, criar: bool = False):
+    """Conexao com o banco da loja: arquivo SQLite proprio ou schema no Postgres.
+
+    Em threads (relatorio consolidado) a loja deve ser passada explicitamente.
+    """
     cfg = get_db_config()
+    loja = loja or loja_atual()
     if cfg.backend == "postgres":
         import psycopg2
-        conn = psycopg2.connect(cfg.database_url)
+        conn = psycopg2.connect(cfg.database_url, cursor_factory=db_trace.pg_cursor_factory())
         try:
+            lojas.usar_schema(conn, loja, criar=criar)
             yield conn
         finally:
             conn.close()
     else:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        caminho = lojas.criar_sqlite(loja, APP_DIR) if criar and loja != lojas.PADRAO else \
+            lojas.caminho_sqlite(loja, APP_DIR, DB_PATH)
+        conn = db_trace.connect_sqlite(caminho, check_same_thread=False)
         try:
             yield conn
         finally:
@@ -87,9 +123,9 @@ def rows_to_dicts(cursor, rows):
     return mapped
 
 
-def init_db() -> None:
+def init_db(loja: str | None = None) -> None:
     cfg = get_db_config()
-    with get_connection() as conn:
+    with get_connection(loja, criar=True) as conn:
         cursor = conn.cursor()
 
         if cfg.backend == "postgres":
@@ -103,19 +139,6 @@ def init_db() -> None:
                 )
                 """
             )
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS transacoes (
-                    id SERIAL PRIMARY KEY,
-                    produtoId INTEGER NOT NULL REFERENCES produtos(id),
-                    tipo TEXT NOT NULL CHECK(tipo IN ('compra', 'venda')),
-                    pesoKg DOUBLE PRECISION NOT NULL,
-                    precoKg DOUBLE PRECISION NOT NULL,
-                    valorTotal DOUBLE PRECISION NOT NULL,
-                    data DATE NOT NULL
-                )
-                """
-            )
         else:
             cursor.execute(
                 """
@@ -127,26 +150,31 @@ def init_db() -> None:
                 )
                 """
             )
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS transacoes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    produtoId INTEGER NOT NULL,
-                    tipo TEXT NOT NULL CHECK(tipo IN ('compra', 'venda')),
-                    pesoKg REAL NOT NULL,
-                    precoKg REAL NOT NULL,
-                    valorTotal REAL NOT NULL,
-                    data TEXT NOT NULL,
-                    FOREIGN KEY (produtoId) REFERENCES produtos(id)
-                )
-                """
-            )
 
+        # Transacoes em ponto fixo (gramas, centavos, dia); converte bancos antigos
+        convertido = unidades.criar_tabelas(conn, cfg.backend)
+        custos.criar_tabelas(conn, cfg.backend)
+        arquivamento.criar_tabelas(conn, cfg.backend)
+        placeholder = "%s" if cfg.backend == "postgres" else "?"
+        if convertido:
+            # Livro de custo refeito sobre os valores ja arredondados
+            custos.reconstruir(conn, placeholder)
+        else:
+            custos.sincronizar_se_preciso(conn, placeholder)
         conn.commit()
 
 
-def popular_produtos_iniciais() -> None:
-    with get_connection() as conn:
+@st.cache_resource(show_spinner=False)
+def preparar_loja(backend: str, loja: str) -> bool:
+    """init_db + produtos iniciais uma vez por processo, backend e loja
+    (o Streamlit reexecuta o script a cada clique)"""
+    init_db(loja)
+    popular_produtos_iniciais(loja)
+    return True
+
+
+def popular_produtos_iniciais(loja: str | None = None) -> None:
+    with get_connection(loja) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM produtos")
         if cursor.fetchone()[0] > 0:
@@ -183,42 +211,51 @@ def get_produtos() -> List[Dict[str, Any]]:
 
 
 def get_transacoes() -> List[Dict[str, Any]]:
+    """Todas as transacoes, incluindo as arquivadas (KPIs, graficos e historico)"""
+    cfg = get_db_config()
+    placeholder = "%s" if cfg.backend == "postgres" else "?"
     with get_connection() as conn:
+        fonte = arquivamento.fonte_transacoes(conn, None, placeholder)
         cursor = conn.cursor()
         cursor.execute(
-            """
-            SELECT t.*, p.nome AS "produtoNome"
-            FROM transacoes t
+            f"""
+            SELECT t.id, t.produtoId, t.tipo, t.pesoG, t.precoCentavos, t.valorCentavos, t.dia,
+                   p.nome AS "produtoNome"
+            FROM {fonte} t
             JOIN produtos p ON p.id = t.produtoId
-            ORDER BY t.data DESC, t.id DESC
+            ORDER BY t.dia DESC, t.id DESC
             """
         )
-        return rows_to_dicts(cursor, cursor.fetchall())
+        return [{**unidades.para_api(row), "produtoNome": row[7]} for row in cursor.fetchall()]
 
 
-def get_resumo_produtos() -> List[Dict[str, Any]]:
+def get_resumo_produtos(inicio: date | None = None, fim: date | None = None) -> List[Dict[str, Any]]:
+    """Resumo por produto no periodo: lucro = receita - custo das vendas
+    (FIFO ou custo medio) e estoque valorizado ao fim do periodo."""
+    cfg = get_db_config()
+    placeholder = "%s" if cfg.backend == "postgres" else "?"
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT
-                p.id,
-                p.nome,
-                COALESCE(SUM(CASE WHEN t.tipo='compra' THEN t.pesoKg END), 0) AS peso_compra,
-                COALESCE(SUM(CASE WHEN t.tipo='venda' THEN t.pesoKg END), 0) AS peso_venda,
-                COALESCE(SUM(CASE WHEN t.tipo='compra' THEN t.valorTotal END), 0) AS valor_compra,
-                COALESCE(SUM(CASE WHEN t.tipo='venda' THEN t.valorTotal END), 0) AS valor_venda
-            FROM produtos p
-            LEFT JOIN transacoes t ON t.produtoId = p.id
-            GROUP BY p.id, p.nome
-            ORDER BY p.nome
-            """
-        )
-        rows = rows_to_dicts(cursor, cursor.fetchall())
-
-    for r in rows:
-        r["estoque_kg"] = r["peso_compra"] - r["peso_venda"]
-        r["lucro"] = r["valor_venda"] - r["valor_compra"]
+        cursor.execute("SELECT id, nome FROM produtos ORDER BY nome")
+        produtos = cursor.fetchall()
+        cursor.close()
+        custo = {r["produtoId"]: r for r in custos.resumo(conn, inicio, fim, placeholder)["porProduto"]}
+
+    rows = []
+    for produto_id, nome in ((p[0], p[1]) for p in produtos):
+        c = custo.get(produto_id, {})
+        rows.append({
+            "id": produto_id,
+            "nome": nome,
+            "peso_compra": c.get("pesoComprado", 0.0),
+            "peso_venda": c.get("pesoVendido", 0.0),
+            "valor_compra": c.get("valorComprado", 0.0),
+            "valor_venda": c.get("receita", 0.0),
+            "custo_vendido": c.get("custoVendido", 0.0),
+            "lucro": c.get("margem", 0.0),
+            "estoque_kg": c.get("estoqueKg", 0.0),
+            "valor_estoque": c.get("valorEstoque", 0.0),
+        })
     return rows
 
 
@@ -272,15 +309,20 @@ def adicionar_transacao(
 ) -> None:
     cfg = get_db_config()
     placeholder = "%s" if cfg.backend == "postgres" else "?"
+    returning = " RETURNING id" if cfg.backend == "postgres" else ""
+    linha = unidades.para_banco(produto_id, tipo, peso_kg, preco_kg, valor_total, data_str)
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
             f"""
-            INSERT INTO transacoes (produtoId, tipo, pesoKg, precoKg, valorTotal, data)
+            INSERT INTO transacoes (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia)
             VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-            """,
-            (produto_id, tipo, peso_kg, preco_kg, valor_total, data_str),
+            """ + returning,
+            linha,
         )
+        transacao_id = cursor.fetchone()[0] if returning else cursor.lastrowid
+        custos.registrar(conn, transacao_id, produto_id, tipo, unidades.kg(linha[2]),
+                         unidades.reais(linha[4]), unidades.data_iso(linha[5]), placeholder=placeholder)
         conn.commit()
 
 
@@ -290,17 +332,74 @@ def excluir_transacao(transacao_id: int) -> None:
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(f"DELETE FROM transacoes WHERE id = {placeholder}", (transacao_id,))
+        custos.remover(conn, transacao_id, placeholder=placeholder)
         conn.commit()
 
 
+def importar_transacoes(arquivo, somente_validar: bool = False) -> Dict[str, Any]:
+    cfg = get_db_config()
+    with get_connection() as conn:
+        return importacao.importar(conn, arquivo, cfg.backend, somente_validar)
+
+
+def get_consolidado(inicio: date | None = None, fim: date | None = None) -> Dict[str, Any]:
+    """Totais de custo e margem de cada loja, lidos em paralelo"""
+    cfg = get_db_config()
+    placeholder = "%s" if cfg.backend == "postgres" else "?"
+
+    def calcular(loja: str) -> Dict[str, Any]:
+        with get_connection(loja) as conn:
+            return custos.resumo(conn, inicio, fim, placeholder)["totais"]
+
+    return lojas.consolidar(listar_lojas(), calcular)
+
+
+def get_analitica(inicio: date | None = None, fim: date | None = None) -> List[Dict[str, Any]]:
+    """Precos medios, margem, volumes de 7/30 dias e volatilidade por produto"""
+    cfg = get_db_config()
+    placeholder = "%s" if cfg.backend == "postgres" else "?"
+    with get_connection() as conn:
+        return analitica.resumo(conn, inicio, fim, placeholder)["porProduto"]
+
+
+def get_previsao() -> Dict[str, Any]:
+    """Previsao de vendas de amanha e compra sugerida (estado guardado por loja)"""
+    cfg = get_db_config()
+    placeholder = "%s" if cfg.backend == "postgres" else "?"
+    with get_connection() as conn:
+        return previsao.prever(conn, chave=(cfg.backend, loja_atual()), placeholder=placeholder)
+
+
 def moeda(valor: float) -> str:
     return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
 
 def main() -> None:
     st.set_page_config(page_title="Pescados do Alexandre", layout="wide", page_icon="🐟")
-    init_db()
-    popular_produtos_iniciais()
+
+    # Loja (banca): cada uma tem o seu banco
+    lojas_existentes = listar_lojas()
+    loja = loja_atual()
+    st.session_state["loja"] = st.sidebar.selectbox(
+        "Loja", lojas_existentes,
+        index=lojas_existentes.index(loja) if loja in lojas_existentes else 0,
+    )
+    with st.sidebar.expander("Nova loja"):
+        nova_loja = st.text_input("Identificador", placeholder="feira-centro")
+        if st.button("Criar loja"):
+            try:
+                nova_loja = lojas.validar(nova_loja)
+            except lojas.LojaInvalida as e:
+                st.error(str(e))
+            else:
+                if nova_loja in lojas_existentes:
+                    st.warning("Essa loja já existe.")
+                else:
+                    preparar_loja(get_db_config().backend, nova_loja)
+                    st.session_state["loja"] = nova_loja
+                    st.rerun()
+
+    preparar_loja(get_db_config().backend, loja_atual())
 
     st.markdown(
         """
@@ -367,12 +466,13 @@ def main() -> None:
 
     produtos = get_produtos()
     transacoes = get_transacoes()
-    resumo = get_resumo_produtos()
 
     df_trans_all = pd.DataFrame(transacoes)
     if not df_trans_all.empty:
         df_trans_all["data"] = pd.to_datetime(df_trans_all["data"], errors="coerce")
     df_trans = df_trans_all.copy()
+    start_date = end_date = None
+    sel_produtos = []
 
     st.sidebar.header("Filtros")
     if not df_trans.empty:
@@ -398,6 +498,10 @@ def main() -> None:
         if sel_tipos:
             df_trans = df_trans[df_trans["tipo"].isin(sel_tipos)]
 
+    # Lucro pelo custo das mercadorias vendidas, no periodo filtrado
+    resumo = get_resumo_produtos(start_date, end_date)
+    resumo_filtrado = [r for r in resumo if not sel_produtos or r["nome"] in sel_produtos]
+
     tab_dashboard, tab_produtos, tab_transacoes = st.tabs(
         ["Dashboard", "Produtos", "Transações"]
     )
@@ -406,12 +510,12 @@ def main() -> None:
         if not df_trans.empty:
             total_compra = df_trans.loc[df_trans["tipo"] == "compra", "valorTotal"].sum()
             total_venda = df_trans.loc[df_trans["tipo"] == "venda", "valorTotal"].sum()
-            total_estoque = sum(r["estoque_kg"] for r in resumo)
         else:
-            total_compra = sum(r["valor_compra"] for r in resumo)
-            total_venda = sum(r["valor_venda"] for r in resumo)
-            total_estoque = sum(r["estoque_kg"] for r in resumo)
-        total_lucro = total_venda - total_compra
+            total_compra = sum(r["valor_compra"] for r in resumo_filtrado)
+            total_venda = sum(r["valor_venda"] for r in resumo_filtrado)
+        total_estoque = sum(r["estoque_kg"] for r in resumo_filtrado)
+        total_valor_estoque = sum(r["valor_estoque"] for r in resumo_filtrado)
+        total_lucro = sum(r["lucro"] for r in resumo_filtrado)
 
         c1, c2, c3, c4 = st.columns(4)
         with c1:
@@ -424,11 +528,11 @@ def main() -> None:
             st.markdown("</div>", unsafe_allow_html=True)
         with c3:
             st.markdown('<div class="kpi-card">', unsafe_allow_html=True)
-            st.metric("Lucro", moeda(total_lucro))
+            st.metric("Lucro", moeda(total_lucro), help="Receita das vendas menos o custo do que foi vendido")
             st.markdown("</div>", unsafe_allow_html=True)
         with c4:
             st.markdown('<div class="kpi-card">', unsafe_allow_html=True)
-            st.metric("Estoque (kg)", f"{total_estoque:.2f}")
+            st.metric("Estoque (kg)", f"{total_estoque:.2f}", help=f"Valor em estoque: {moeda(total_valor_estoque)}")
             st.markdown("</div>", unsafe_allow_html=True)
 
         st.markdown('<div class="section-title">Análises</div>', unsafe_allow_html=True)
@@ -459,6 +563,15 @@ def main() -> None:
                     .sum()
                     .reset_index()
                 )
+                # Periodos longos: no maximo ~PONTOS_PADRAO pontos por tipo,
+                # mantendo o menor e o maior valor de cada faixa de dias
+                partes = []
+                for _, grupo in df_time.groupby("tipo"):
+                    grupo = grupo.sort_values("dia").reset_index(drop=True)
+                    indices = downsample.minmax(grupo["valorTotal"].tolist(), downsample.PONTOS_PADRAO)
+                    partes.append(grupo.iloc[indices])
+                dias_total = len(df_time)
+                df_time = pd.concat(partes, ignore_index=True)
                 chart = (
                     alt.Chart(df_time)
                     .mark_area(opacity=0.35)
@@ -471,6 +584,8 @@ def main() -> None:
                     .properties(height=320, title="Compras x Vendas no Tempo")
                 )
                 st.altair_chart(chart, use_container_width=True)
+                if len(df_time) < dias_total:
+                    st.caption("Série reduzida para o período; diminua o período para ver cada dia.")
             else:
                 st.info("Sem dados para o gráfico temporal.")
 
@@ -485,7 +600,9 @@ def main() -> None:
                     "estoque_kg",
                     "valor_compra",
                     "valor_venda",
+                    "custo_vendido",
                     "lucro",
+                    "valor_estoque",
                 ]
             ]
             df_resumo.columns = [
@@ -495,12 +612,65 @@ def main() -> None:
                 "Estoque (kg)",
                 "Valor Compra",
                 "Valor Venda",
+                "Custo Vendido",
                 "Lucro",
+                "Valor Estoque",
             ]
             st.dataframe(df_resumo, use_container_width=True, hide_index=True)
         else:
             st.info("Nenhum dado para exibir ainda.")
 
+        st.subheader("Indicadores de Preço")
+        indicadores = [r for r in get_analitica(start_date, end_date) if not sel_produtos or r["nome"] in sel_produtos]
+        df_indicadores = pd.DataFrame(indicadores)
+        if not df_indicadores.empty:
+            df_indicadores = df_indicadores[
+                ["nome", "precoMedioCompra", "precoMedioVenda", "margemPrecoPct", "volume7d", "volume30d", "volatilidade"]
+            ]
+            df_indicadores.columns = [
+                "Produto", "Compra (R$/kg)", "Venda (R$/kg)", "Margem de Preço (%)", "Venda 7 dias (kg)",
+                "Venda 30 dias (kg)", "Volatilidade (%)",
+            ]
+            for coluna in ("Margem de Preço (%)", "Volatilidade (%)"):
+                df_indicadores[coluna] = df_indicadores[coluna] * 100
+            st.dataframe(df_indicadores, use_container_width=True, hide_index=True)
+            st.caption(
+                "Margem de preço pelos preços médios do período (a margem realizada está no resumo acima); "
+                "volumes até o fim do período; volatilidade = desvio padrão / média do preço de venda diário."
+            )
+
+        prev = get_previsao()
+        st.subheader(f"Compra Sugerida para {date.fromisoformat(prev['alvo']).strftime('%d/%m/%Y')}")
+        df_previsao = pd.DataFrame(prev["porProduto"])
+        if not df_previsao.empty:
+            df_previsao = df_previsao[
+                ["nome", "previsaoHojeKg", "vendidoHojeKg", "estoqueKg", "previsaoKg", "sugestaoCompraKg"]
+            ]
+            df_previsao.columns = [
+                "Produto", "Previsão Hoje (kg)", "Vendido Hoje (kg)", "Estoque (kg)",
+                "Previsão Amanhã (kg)", "Comprar (kg)",
+            ]
+            st.dataframe(df_previsao, use_container_width=True, hide_index=True)
+            st.caption(
+                f"Perfil do dia da semana e suavização exponencial sobre os últimos {prev['historicoDias']} dias; "
+                f"a compra cobre a previsão com {previsao.SEGURANCA:.0%} de folga, descontado o estoque que deve sobrar hoje."
+            )
+
+        if len(lojas_existentes) > 1:
+            with st.expander("Consolidado de todas as lojas"):
+                consolidado = get_consolidado(start_date, end_date)
+                df_lojas = pd.DataFrame(consolidado["porLoja"])[
+                    ["loja", "valorComprado", "receita", "custoVendido", "margem", "estoqueKg", "valorEstoque"]
+                ]
+                df_lojas.columns = [
+                    "Loja", "Valor Compra", "Valor Venda", "Custo Vendido", "Lucro", "Estoque (kg)", "Valor Estoque",
+                ]
+                st.dataframe(df_lojas, use_container_width=True, hide_index=True)
+                st.caption(
+                    f"Total: vendas {moeda(consolidado['totais'].get('receita', 0.0))}, "
+                    f"lucro {moeda(consolidado['totais'].get('margem', 0.0))}."
+                )
+
         st.subheader("Transações Recentes")
         if not df_trans.empty:
             df_recent = df_trans.sort_values("data", ascending=False).copy()
@@ -609,6 +779,37 @@ def main() -> None:
                     st.success("Transação registrada.")
                     st.rerun()
 
+        with st.expander("Importar histórico (CSV)"):
+            st.caption(
+                "Colunas: data, produto (ou produtoId), tipo, pesoKg e, opcionalmente, "
+                "precoKg e valorTotal. O valor total é recalculado; linhas com erro não são gravadas."
+            )
+            arquivo_csv = st.file_uploader("Arquivo CSV", type=["csv"], key="importar_csv")
+            if arquivo_csv is not None:
+                conteudo = arquivo_csv.getvalue()
+                try:
+                    previa = importar_transacoes(conteudo, somente_validar=True)
+                except ValueError as e:
+                    st.error(str(e))
+                    previa = None
+                if previa:
+                    st.write(
+                        f"{previa['total']} linha(s): {previa['validas']} válida(s), "
+                        f"{previa['invalidas']} com erro."
+                    )
+                    if previa["erros"]:
+                        st.dataframe(
+                            pd.DataFrame(
+                                [{"Linha": e["linha"], "Erros": "; ".join(e["erros"])} for e in previa["erros"]]
+                            ),
+                            use_container_width=True,
+                            hide_index=True,
+                        )
+                    if previa["validas"] and st.button(f"Importar {previa['validas']} transação(ões)"):
+                        relatorio = importar_transacoes(conteudo)
+                        st.success(f"{relatorio['importadas']} transação(ões) importada(s).")
+                        st.rerun()
+
         st.divider()
         st.subheader("Transações Cadastradas")
         if not df_trans_all.empty:
@@ -0,0 +1,296 @@
+"""
+Pescados do Alexandre - Armazenamento em ponto fixo
+As transacoes guardam inteiros: peso em gramas (pesoG), preco por kg e
+valor total em centavos (precoCentavos, valorCentavos) e a data como
+numero do dia desde 1970-01-01 (dia). Somas ficam exatas, linhas e
+indices menores e filtros de periodo viram comparacoes de inteiros.
+
+A API continua recebendo e devolvendo pesoKg, precoKg, valorTotal e data
+(AAAA-MM-DD): a conversao acontece so na entrada e na saida do banco.
+
+Bancos antigos (colunas REAL / TEXT ou DATE) sao convertidos uma vez por
+criar_tabelas(); tambem da para converter pela linha de comando:
+  python unidades.py                 # pescados.db (ou DATABASE_URL)
+  python unidades.py --banco outra.db
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Sequence
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "pescados.db")
+
+GRAMAS = 1000
+CENTAVOS = 100
+EPOCA = date(1970, 1, 1)
+
+# Ordem das colunas usada por copias, exportacao e para_api()
+COLUNAS = "id, produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia"
+COLUNAS_LEGADAS = "id, produtoId, tipo, pesoKg, precoKg, valorTotal, data"
+BLOCO_MIGRACAO = 5000
+
+
+# ==================== CONVERSAO ====================
+
+def _inteiro(valor, escala: int) -> int:
+    # Arredonda meio para cima sobre o valor decimal digitado:
+    # 2.675 * 100 = 267.49999999999997 em binario, mas vira 268
+    return int(math.floor(round(float(valor) * escala, 6) + 0.5))
+
+
+def gramas(kg) -> int:
+    return _inteiro(kg, GRAMAS)
+
+
+def centavos(reais) -> int:
+    return _inteiro(reais, CENTAVOS)
+
+
+def kg(gramas_: int) -> float:
+    return gramas_ / GRAMAS
+
+
+def reais(centavos_: int) -> float:
+    return centavos_ / CENTAVOS
+
+
+def dia(data) -> int:
+    """Numero do dia (desde 1970-01-01) de uma data, datetime ou texto AAAA-MM-DD"""
+    if isinstance(data, datetime):
+        data = data.date()
+    elif not isinstance(data, date):
+        data = date.fromisoformat(str(data)[:10])
+    return (data - EPOCA).days
+
+
+def data_iso(numero: int) -> str:
+    return (EPOCA + timedelta(days=int(numero))).isoformat()
+
+
+def para_banco(produto_id, tipo, peso_kg, preco_kg, valor_total, data) -> tuple:
+    """Valores da API -> (produtoId, tipo, pesoG, precoCentavos, valorCentavos, dia)"""
+    return (int(produto_id), tipo, gramas(peso_kg), centavos(preco_kg), centavos(valor_total), dia(data))
+
+
+def para_api(linha: Sequence) -> Dict[str, Any]:
+    """Linha na ordem de COLUNAS -> transacao no formato da API"""
+    return {
+        "id": linha[0],
+        "produtoId": linha[1],
+        "tipo": linha[2],
+        "pesoKg": kg(linha[3]),
+        "precoKg": reais(linha[4]),
+        "valorTotal": reais(linha[5]),
+        "data": data_iso(linha[6]),
+    }
+
+
+def inteiros(serie, escala: int):
+    """Versao vetorizada de _inteiro() para Series do pandas"""
+    import numpy as np
+
+    return np.floor((serie.astype(float) * escala).round(6) + 0.5).astype("int64")
+
+
+# ==================== ESQUEMA ====================
+
+def ddl(tabela: str, backend: str, chave_estrangeira: bool = True) -> str:
+    if backend == "postgres":
+        id_coluna = "id SERIAL PRIMARY KEY" if chave_estrangeira else "id INTEGER PRIMARY KEY"
+        produto = "produtoId INTEGER NOT NULL REFERENCES produtos(id)" if chave_estrangeira else "produtoId INTEGER NOT NULL"
+        fk = ""
+    else:
+        id_coluna = "id INTEGER PRIMARY KEY AUTOINCREMENT" if chave_estrangeira else "id INTEGER PRIMARY KEY"
+        produto = "produtoId INTEGER NOT NULL"
+        fk = ",\n            FOREIGN KEY (produtoId) REFERENCES produtos(id)" if chave_estrangeira else ""
+    return f"""
+        CREATE TABLE IF NOT EXISTS {tabela} (
+            {id_coluna},
+            {produto},
+            tipo TEXT NOT NULL CHECK(tipo IN ('compra', 'venda')),
+            pesoG INTEGER NOT NULL,
+            precoCentavos INTEGER NOT NULL,
+            valorCentavos INTEGER NOT NULL,
+            dia INTEGER NOT NULL{fk}
+        )
+    """
+
+
+def _colunas(conn, tabela: str, backend: str) -> set:
+    cursor = conn.cursor()
+    try:
+        if backend == "postgres":
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s",
+                (tabela,),
+            )
+            return {r[0].lower() for r in cursor.fetchall()}
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        return {r[1].lower() for r in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def criar_tabelas(conn, backend: str = "sqlite", tabela: str = "transacoes") -> bool:
+    """Cria a tabela de transacoes (ou transacoes_arquivo) em ponto fixo.
+
+    Se ela existir no formato antigo, converte os dados. Devolve True quando
+    houve conversao. Sem commit.
+    """
+    principal = tabela == "transacoes"
+    colunas = _colunas(conn, tabela, backend)
+    migrou = False
+    if "pesokg" in colunas and "pesog" not in colunas:
+        if backend == "postgres":
+            _migrar_postgres(conn, tabela)
+        else:
+            _migrar_sqlite(conn, tabela, principal)
+        migrou = True
+    cursor = conn.cursor()
+    cursor.execute(ddl(tabela, backend, principal))
+    # Paginacao e filtros de periodo por (dia, id)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_dia_id ON {tabela} (dia, id)")
+    cursor.close()
+    return migrou
+
+
+def ler_transacoes(conn, tabela: str = "transacoes", backend: str = "sqlite") -> List[tuple]:
+    """Linhas na ordem de COLUNAS, convertendo na leitura se a tabela ainda
+    estiver no formato antigo (nao altera o banco)"""
+    cursor = conn.cursor()
+    try:
+        if "pesog" in _colunas(conn, tabela, backend):
+            cursor.execute(f"SELECT {COLUNAS} FROM {tabela} ORDER BY id")
+            return [tuple(r) for r in cursor.fetchall()]
+        cursor.execute(f"SELECT {COLUNAS_LEGADAS} FROM {tabela} ORDER BY id")
+        return [(r[0], *para_banco(*tuple(r)[1:])) for r in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _migrar_sqlite(conn, tabela: str, principal: bool) -> None:
+    # SQLite nao troca o tipo de coluna: cria a tabela nova, copia
+    # convertendo em blocos e troca os nomes
+    nova = f"{tabela}_ponto_fixo"
+    leitura = conn.cursor()
+    escrita = conn.cursor()
+    try:
+        escrita.execute(f"DROP TABLE IF EXISTS {nova}")
+        escrita.execute(ddl(nova, "sqlite", principal))
+        leitura.execute(f"SELECT {COLUNAS_LEGADAS} FROM {tabela} ORDER BY id")
+        while True:
+            linhas = leitura.fetchmany(BLOCO_MIGRACAO)
+            if not linhas:
+                break
+            escrita.executemany(
+                f"INSERT INTO {nova} ({COLUNAS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r[0], *para_banco(*r[1:])) for r in linhas],
+            )
+        sequencia = None
+        if principal:
+            escrita.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabela,))
+            row = escrita.fetchone()
+            sequencia = row[0] if row else None
+        escrita.execute(f"DROP TABLE {tabela}")
+        escrita.execute(f"ALTER TABLE {nova} RENAME TO {tabela}")
+        if sequencia is not None:
+            # Ids ja usados (e excluidos) nao voltam a ser distribuidos
+            escrita.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequencia, tabela))
+    finally:
+        leitura.close()
+        escrita.close()
+
+
+def _migrar_postgres(conn, tabela: str) -> None:
+    # NUMERIC arredonda meio para longe do zero sobre o valor decimal
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP INDEX IF EXISTS idx_{tabela}_data_id")
+        cursor.execute(
+            f"""
+            ALTER TABLE {tabela}
+                ADD COLUMN pesoG INTEGER,
+                ADD COLUMN precoCentavos INTEGER,
+                ADD COLUMN valorCentavos INTEGER,
+                ADD COLUMN dia INTEGER
+            """
+        )
+        cursor.execute(
+            f"""
+            UPDATE {tabela} SET
+                pesoG = ROUND(pesoKg::numeric * 1000),
+                precoCentavos = ROUND(precoKg::numeric * 100),
+                valorCentavos = ROUND(valorTotal::numeric * 100),
+                dia = data - DATE '1970-01-01'
+            """
+        )
+        cursor.execute(
+            f"""
+            ALTER TABLE {tabela}
+                ALTER COLUMN pesoG SET NOT NULL,
+                ALTER COLUMN precoCentavos SET NOT NULL,
+                ALTER COLUMN valorCentavos SET NOT NULL,
+                ALTER COLUMN dia SET NOT NULL,
+                DROP COLUMN pesoKg,
+                DROP COLUMN precoKg,
+                DROP COLUMN valorTotal,
+                DROP COLUMN data
+            """
+        )
+    finally:
+        cursor.close()
+
+
+# ==================== CLI ====================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Converte as transacoes para ponto fixo")
+    parser.add_argument("--banco", help="arquivo SQLite (ignora DATABASE_URL)")
+    args = parser.parse_args(argv)
+
+    database_url = os.getenv("DATABASE_URL")
+    if database_url and not args.banco:
+        import psycopg2
+
+        conn, backend = psycopg2.connect(database_url), "postgres"
+    else:
+        import sqlite3
+
+        conn, backend = sqlite3.connect(args.banco or DB_PATH), "sqlite"
+    try:
+        migradas = [t for t in ("transacoes", "transacoes_arquivo")
+                    if (t == "transacoes" or t in _tabelas(conn, backend)) and criar_tabelas(conn, backend, t)]
+        if "transacoes" in migradas:
+            # O livro de custo (e os checkpoints) guardava valores da era REAL
+            import custos
+
+            custos.criar_tabelas(conn, backend)
+            custos.reconstruir(conn, "%s" if backend == "postgres" else "?")
+        conn.commit()
+    finally:
+        conn.close()
+    print("convertidas: " + ", ".join(migradas) if migradas else "nada a converter")
+    return 0
+
+
+def _tabelas(conn, backend: str) -> set:
+    cursor = conn.cursor()
+    try:
+        if backend == "postgres":
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")
+        else:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {r[0] for r in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())